@@ -15,6 +15,12 @@ from app.config.settings import (
     split_origins,
     sqlalchemy_engine_kwargs,
 )
+from app.core.db.factory import create_adapter
+from app.core.db.pool import init_pool
+from app.core.db.schema_caps import refresh_capabilities
+from app.core.json_provider import FastJSONProvider
+from app.services.ubicacion_eventos import start_notify_listener
+from app.services.ubicacion_mantenimiento import start_partition_maintenance
 
 from app.views.api import api_bp       # /api/ping, /api/ping-db
 from app.views.web import web_bp       # /
@@ -22,11 +28,15 @@ from app.endpoints.ubicaciones import ubic_bp
 from app.endpoints.auth import auth_bp              # /api/auth/*
 from app.endpoints.users import users_bp            # /api/users/*
 from app.endpoints.mobile import mobile_bp   # ← NUEVO
+from app.endpoints.geocercas import geocercas_bp    # /api/geocercas/*
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
 
+    # === JSON (orjson si está instalado; ver app/core/json_provider.py) ===
+    app.json = FastJSONProvider(app)
+
     # === Secret & JWT ===
     app.config["SECRET_KEY"] = Settings.SECRET_KEY
     app.config["JWT_SECRET_KEY"] = Settings.JWT_SECRET
@@ -60,8 +70,8 @@ def create_app() -> Flask:
         resources={
             r"/api/*": {
                 "origins": origins,
-                "allow_headers": ["Content-Type", "Authorization"],
-                "expose_headers": ["Content-Type"],
+                "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+                "expose_headers": ["Content-Type", "ETag", "Last-Modified"],
                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
                 "vary_header": True,
                 "max_age": 86400,
@@ -74,6 +84,13 @@ def create_app() -> Flask:
     engine = create_engine(db_uri, **sqlalchemy_engine_kwargs(Settings))
     app.extensions["db_engine"] = engine
 
+    # === Pool psycopg compartido (repositorios/servicios con SQL directo) ===
+    # Uno por proceso/worker; se cierra solo al terminar (atexit en core/db/pool.py)
+    pg_pool = init_pool(Settings)
+    app.extensions["pg_pool"] = pg_pool
+    # Adaptador genérico (execute/fetch*/transaction) sobre ese mismo pool
+    app.extensions["db"] = create_adapter(Settings.DB_ENGINE, pool=pg_pool)
+
     # === JWT ===
     JWTManager(app)
 
@@ -85,6 +102,18 @@ def create_app() -> Flask:
     app.register_blueprint(patrullas_bp,    url_prefix="/api/patrullas")     # /api/patrullas/*
     app.register_blueprint(asig_bp,         url_prefix="/api/asignaciones") 
     app.register_blueprint(mobile_bp, url_prefix="/api/mobile")  # ← NUEVO
+    app.register_blueprint(geocercas_bp,    url_prefix="/api/geocercas")     # /api/geocercas/*
     app.register_blueprint(web_bp)                                           # /
 
+    # === Capacidades del esquema (después de los ensure_schema de los blueprints) ===
+    try:
+        refresh_capabilities(engine)
+    except Exception as e:
+        # se reintenta en el primer uso (get_capabilities)
+        print(f"[app] schema capabilities warning: {e}")
+
+    # === Hilos de fondo por worker ===
+    start_partition_maintenance()  # particiones futuras + retención del historial
+    start_notify_listener()  # LISTEN: escrituras de otros workers/nodos
+
     return app
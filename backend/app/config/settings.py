@@ -2,6 +2,8 @@
 import os
 from urllib.parse import quote_plus
 
+from psycopg import conninfo
+
 
 class Settings:
     # === SECRET / COOKIES ===
@@ -21,6 +23,110 @@ class Settings:
     DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
     DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos
 
+    # Pool psycopg compartido por proceso (repositorios/servicios con SQL directo).
+    # gunicorn.conf.py fija los hilos por worker en UBIC_SSE_MAX_CLIENTS + este max.
+    PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+    PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+    PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))  # espera máx. por conexión (s)
+    PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "1800"))  # segundos
+    PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))  # segundos
+
+    # === Ingesta de ubicaciones: write-behind opcional ===
+    # Si está activo, POST /api/ubicaciones encola el ping y responde 202;
+    # un hilo lo escribe en micro-lotes (por tamaño o por tiempo).
+    UBIC_WRITE_BEHIND = os.getenv("UBIC_WRITE_BEHIND", "false").lower() == "true"
+    UBIC_WB_BATCH_ROWS = int(os.getenv("UBIC_WB_BATCH_ROWS", "200"))
+    UBIC_WB_MAX_DELAY_MS = int(os.getenv("UBIC_WB_MAX_DELAY_MS", "250"))
+    UBIC_WB_QUEUE_MAX = int(os.getenv("UBIC_WB_QUEUE_MAX", "10000"))
+    UBIC_WB_PUT_TIMEOUT_MS = int(os.getenv("UBIC_WB_PUT_TIMEOUT_MS", "50"))  # backpressure
+
+    # === Historial de ubicaciones: particiones por tiempo + retención ===
+    UBIC_PARTITION_INTERVAL = os.getenv("UBIC_PARTITION_INTERVAL", "day").lower()  # day | week
+    UBIC_PARTITIONS_AHEAD = int(os.getenv("UBIC_PARTITIONS_AHEAD", "7"))  # periodos futuros ya creados
+    UBIC_RETENTION_DAYS = int(os.getenv("UBIC_RETENTION_DAYS", "0"))  # 0 = conservar todo
+    UBIC_RETENTION_MODE = os.getenv("UBIC_RETENTION_MODE", "detach").lower()  # drop | detach
+    UBIC_PARTITION_MAINT_S = int(os.getenv("UBIC_PARTITION_MAINT_S", "3600"))  # cada cuánto (s)
+    # migrar una tabla public.ubicaciones sin particionar al arrancar (bloquea la tabla)
+    UBIC_PARTITION_MIGRATE = os.getenv("UBIC_PARTITION_MIGRATE", "false").lower() == "true"
+
+    # === PostGIS (opcional): columna geom + índice GiST en historial y posición vigente ===
+    # Por defecto se activa con DB_ENGINE=postgis; si la extensión no está, se usa lat/lng.
+    UBIC_POSTGIS = os.getenv(
+        "UBIC_POSTGIS", "true" if DB_ENGINE.lower() == "postgis" else "false"
+    ).lower() == "true"
+
+    # === Índice en memoria (grilla) de la posición vigente, por worker ===
+    UBIC_GRID_ENABLED = os.getenv("UBIC_GRID_ENABLED", "true").lower() == "true"
+    UBIC_GRID_CELL_DEG = float(os.getenv("UBIC_GRID_CELL_DEG", "0.01"))  # ~1.1 km
+    UBIC_GRID_SYNC_S = float(os.getenv("UBIC_GRID_SYNC_S", "2"))  # incremental (otros workers)
+    UBIC_GRID_FULL_SYNC_S = float(os.getenv("UBIC_GRID_FULL_SYNC_S", "60"))  # recarga completa
+
+    # === Teselas vectoriales (GET /api/ubicaciones/tiles/{z}/{x}/{y}.mvt) ===
+    UBIC_TILE_EXTENT = int(os.getenv("UBIC_TILE_EXTENT", "4096"))
+    UBIC_TILE_BUFFER = int(os.getenv("UBIC_TILE_BUFFER", "64"))  # unidades de tesela por lado
+    UBIC_TILE_FULL_ZOOM = int(os.getenv("UBIC_TILE_FULL_ZOOM", "16"))  # desde aquí no se ralea
+    UBIC_TILE_MAX_FEATURES = int(os.getenv("UBIC_TILE_MAX_FEATURES", "5000"))  # por capa
+    UBIC_TILE_CACHE_MAX = int(os.getenv("UBIC_TILE_CACHE_MAX", "2000"))  # teselas por worker
+    UBIC_TILE_LIVE_TTL_S = float(os.getenv("UBIC_TILE_LIVE_TTL_S", "2"))  # capas en vivo
+    UBIC_TILE_HIST_TTL_S = float(os.getenv("UBIC_TILE_HIST_TTL_S", "300"))  # ventanas ya cerradas
+
+    # === Clusters en /api/ubicaciones/geo?cluster=true&zoom=N ===
+    UBIC_CLUSTER_RADIUS_PX = float(os.getenv("UBIC_CLUSTER_RADIUS_PX", "60"))
+    UBIC_CLUSTER_MAX_ZOOM = int(os.getenv("UBIC_CLUSTER_MAX_ZOOM", "16"))  # más cerca: puntos sueltos
+    UBIC_CLUSTER_REBUILD_S = float(os.getenv("UBIC_CLUSTER_REBUILD_S", "1"))  # índice en vivo
+
+    # === Mapa de calor (GET /api/ubicaciones/heatmap) ===
+    UBIC_HEATMAP_MAX_CELLS = int(os.getenv("UBIC_HEATMAP_MAX_CELLS", "250000"))  # cols*filas
+    UBIC_HEATMAP_MAX_DAYS = int(os.getenv("UBIC_HEATMAP_MAX_DAYS", "31"))  # ventana desde/hasta
+
+    # === Recorridos simplificados (GET /api/ubicaciones/track) ===
+    UBIC_TRACK_TOL_PX = float(os.getenv("UBIC_TRACK_TOL_PX", "1.0"))  # tolerancia DP en píxeles
+    UBIC_TRACK_GAP_S = float(os.getenv("UBIC_TRACK_GAP_S", "300"))  # hueco que corta el tramo
+    UBIC_TRACK_MAX_POINTS = int(os.getenv("UBIC_TRACK_MAX_POINTS", "50000"))
+    UBIC_TRACK_CACHE_MAX = int(os.getenv("UBIC_TRACK_CACHE_MAX", "256"))  # recorridos cerrados
+
+    # === /api/ubicaciones/geo?stream=true (cursor del lado del servidor) ===
+    UBIC_STREAM_CHUNK_ROWS = int(os.getenv("UBIC_STREAM_CHUNK_ROWS", "2000"))  # features por parte
+    UBIC_STREAM_MAX_ROWS = int(os.getenv("UBIC_STREAM_MAX_ROWS", "0"))  # 0 = sin tope
+
+    # === GET condicional (ETag) en /api/ubicaciones, /geo, /actuales y /summary ===
+    UBIC_ETAG_ENABLED = os.getenv("UBIC_ETAG_ENABLED", "true").lower() == "true"
+    UBIC_ETAG_TTL_MS = int(os.getenv("UBIC_ETAG_TTL_MS", "500"))  # watermark cacheado por worker
+
+    # === Delta del mapa en vivo (GET /api/ubicaciones/geo?since=<cursor>) ===
+    UBIC_DELTA_TOMBSTONE_H = float(os.getenv("UBIC_DELTA_TOMBSTONE_H", "24"))  # bajas que se recuerdan
+
+    # === Push de posiciones por SSE (GET /api/ubicaciones/stream), un hub por worker ===
+    UBIC_SSE_ENABLED = os.getenv("UBIC_SSE_ENABLED", "true").lower() == "true"
+    UBIC_SSE_POLL_MS = int(os.getenv("UBIC_SSE_POLL_MS", "1000"))  # lectura de respaldo (avisos perdidos)
+    UBIC_SSE_MIN_INTERVAL_MS = int(os.getenv("UBIC_SSE_MIN_INTERVAL_MS", "200"))  # junta ráfagas
+    UBIC_SSE_HEARTBEAT_S = float(os.getenv("UBIC_SSE_HEARTBEAT_S", "15"))
+    UBIC_SSE_REPLAY = int(os.getenv("UBIC_SSE_REPLAY", "512"))  # lotes para retomar con Last-Event-ID
+    # por worker; cada stream es un hilo de gunicorn (ver gunicorn.conf.py)
+    UBIC_SSE_MAX_CLIENTS = int(os.getenv("UBIC_SSE_MAX_CLIENTS", "48"))
+    UBIC_SSE_MAX_S = int(os.getenv("UBIC_SSE_MAX_S", "900"))  # se corta y el cliente reconecta (0 = nunca)
+    UBIC_SSE_RETRY_MS = int(os.getenv("UBIC_SSE_RETRY_MS", "3000"))
+
+    # === Avisos de escrituras entre workers/nodos (LISTEN/NOTIFY, una conexión por worker) ===
+    UBIC_NOTIFY_ENABLED = os.getenv("UBIC_NOTIFY_ENABLED", "true").lower() == "true"
+    UBIC_NOTIFY_CHANNEL = os.getenv("UBIC_NOTIFY_CHANNEL", "ubicaciones")
+    UBIC_NOTIFY_CHECK_S = float(os.getenv("UBIC_NOTIFY_CHECK_S", "10"))  # control de la conexión
+    UBIC_NOTIFY_RECONNECT_MAX_S = float(os.getenv("UBIC_NOTIFY_RECONNECT_MAX_S", "30"))  # backoff máximo
+
+    # === Geocercas: evaluación de pings en segundo plano (micro-lotes por worker) ===
+    GEOFENCE_ENABLED = os.getenv("GEOFENCE_ENABLED", "true").lower() == "true"
+    GEOFENCE_SYNC_S = float(os.getenv("GEOFENCE_SYNC_S", "5"))  # chequeo de cambios en geocercas
+    GEOFENCE_BATCH_ROWS = int(os.getenv("GEOFENCE_BATCH_ROWS", "500"))
+    GEOFENCE_MAX_DELAY_MS = int(os.getenv("GEOFENCE_MAX_DELAY_MS", "200"))
+    GEOFENCE_QUEUE_MAX = int(os.getenv("GEOFENCE_QUEUE_MAX", "20000"))  # lleno => se descartan
+
+    # === Caché de asignación usuario -> patrulla (por worker) ===
+    ASIG_CACHE_TTL_S = float(os.getenv("ASIG_CACHE_TTL_S", "60"))
+    ASIG_CACHE_NEG_TTL_S = float(os.getenv("ASIG_CACHE_NEG_TTL_S", "10"))  # "sin asignación"
+    ASIG_CACHE_MAX = int(os.getenv("ASIG_CACHE_MAX", "10000"))
+    # sin LISTEN/NOTIFY los demás workers sólo se enteran al vencer el TTL
+    ASIG_CACHE_TTL_NO_NOTIFY_S = float(os.getenv("ASIG_CACHE_TTL_NO_NOTIFY_S", "3"))
+
     # === JWT / CORS ===
     JWT_SECRET = os.getenv("JWT_SECRET", "dev-jwt-change-me")
 
@@ -53,6 +159,30 @@ def build_sqlalchemy_uri(cfg: "Settings") -> str:
     raise ValueError(f"DB_ENGINE no soportado: {engine}")
 
 
+def build_psycopg_conninfo(cfg: "Settings") -> str:
+    """
+    Construye el conninfo para psycopg (escapa espacios/símbolos en credenciales).
+    """
+    return conninfo.make_conninfo(
+        host=cfg.DB_HOST,
+        port=str(cfg.DB_PORT),
+        dbname=cfg.DB_NAME,
+        user=cfg.DB_USER,
+        password=cfg.DB_PASSWORD,
+    )
+
+
+def psycopg_pool_kwargs(cfg: "Settings") -> dict:
+    """Parámetros para psycopg_pool.ConnectionPool."""
+    return {
+        "min_size": max(cfg.PG_POOL_MIN_SIZE, 0),
+        "max_size": max(cfg.PG_POOL_MAX_SIZE, cfg.PG_POOL_MIN_SIZE, 1),
+        "timeout": cfg.PG_POOL_TIMEOUT,
+        "max_lifetime": cfg.PG_POOL_MAX_LIFETIME,
+        "max_idle": cfg.PG_POOL_MAX_IDLE,
+    }
+
+
 def sqlalchemy_engine_kwargs(cfg: "Settings") -> dict:
     """Parámetros de pool para create_engine (opcionales)."""
     return {
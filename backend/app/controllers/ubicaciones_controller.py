@@ -1,7 +1,7 @@
 # backend/app/controllers/ubicaciones_controller.py
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from app.services.ubicacion_service import UbicacionService
 
@@ -16,12 +16,24 @@ class UbicacionesController:
     def ensure_schema(self) -> None:
         self.service.ensure_schema()
 
+    def warm_index(self) -> int:
+        return self.service.warm_index()
+
     # -------------------------
     # CRUD
     # -------------------------
     def crear(self, data: Dict[str, Any]) -> Dict[str, Any]:
         return self.service.crear(data)
 
+    def crear_batch(
+        self,
+        items: List[Any],
+        *,
+        nombre: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self.service.crear_batch(items, nombre=nombre, patrulla_id=patrulla_id)
+
     def actualizar(self, ubic_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         return self.service.actualizar(ubic_id, data)
 
@@ -31,8 +43,14 @@ class UbicacionesController:
     def obtener(self, ubic_id: int) -> Optional[Dict[str, Any]]:
         return self.service.obtener(ubic_id)
 
-    def listar(self, page: int = 1, size: int = 100) -> Dict[str, Any]:
-        return self.service.listar(page=page, size=size)
+    def listar(
+        self,
+        page: int = 1,
+        size: int = 100,
+        after: Optional[str] = None,
+        count: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return self.service.listar(page=page, size=size, after=after, count=count)
 
     # -------------------------
     # Helpers internos
@@ -84,12 +102,81 @@ class UbicacionesController:
             # bbox inválido -> lista vacía (compat)
             return []
 
+    # -------------------------
+    # Unidades más cercanas
+    # -------------------------
+    def nearest(
+        self,
+        lat: Any,
+        lng: Any,
+        *,
+        k: Any = None,
+        max_km: Any = None,
+        activo: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.service.nearest(lat, lng, k=k, max_km=max_km, activo=activo)
+
+    # -------------------------
+    # Teselas vectoriales (MVT)
+    # -------------------------
+    def tile(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        *,
+        capas: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+    ) -> Tuple[bytes, float]:
+        return self.service.tile(z, x, y, capas=capas, patrulla_id=patrulla_id, desde=desde, hasta=hasta)
+
+    # -------------------------
+    # Recorrido simplificado por patrulla/turno
+    # -------------------------
+    def track(
+        self,
+        *,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        zoom: Any = None,
+        asignacion_id: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        return self.service.track(
+            patrulla_id=patrulla_id, desde=desde, hasta=hasta, zoom=zoom, asignacion_id=asignacion_id
+        )
+
+    # -------------------------
+    # Mapa de calor
+    # -------------------------
+    def heatmap(
+        self,
+        *,
+        bbox: Optional[str],
+        desde: Optional[str],
+        hasta: Optional[str],
+        cell_m: Any = None,
+        patrulla_id: Optional[int] = None,
+        formato: str = "matrix",
+    ) -> Dict[str, Any]:
+        return self.service.heatmap(
+            bbox, desde, hasta, cell_m=cell_m, patrulla_id=patrulla_id, formato=formato
+        )
+
     # -------------------------
     # Dashboard
     # -------------------------
     def summary(self) -> Dict[str, Any]:
         return self.service.summary()
 
+    def actuales(self) -> List[Dict[str, Any]]:
+        return self.service.actuales()
+
+    def ingest_stats(self) -> Dict[str, Any]:
+        return self.service.ingest_stats()
+
     # -------------------------
     # GeoJSON para frontend (Leaflet/Mapbox)
     # -------------------------
@@ -101,14 +188,22 @@ class UbicacionesController:
         hasta: Optional[str] = None,
         limit: Optional[int] = None,
         bbox: Optional[str] = None,
+        near: Optional[str] = None,
+        radius_m: Optional[float] = None,
+        polygon: Optional[str] = None,
+        cluster: bool = False,
+        zoom: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
         Orquesta la generación de GeoJSON. Acepta filtros opcionales:
 
-        - patrulla_id: (compat futura) se ignora si tu tabla no la tiene.
+        - patrulla_id: posición vigente de esa unidad o su recorrido en desde/hasta.
         - desde/hasta: ISO8601 o 'YYYY-MM-DD HH:MM:SS' contra updated_at.
         - limit: tope de puntos (default 1000, máx 5000).
         - bbox: string 'minLng,minLat,maxLng,maxLat'.
+        - near/radius_m: 'lng,lat' y radio en metros.
+        - polygon: GeoJSON Polygon/MultiPolygon (requiere PostGIS).
+        - cluster/zoom: grupos {cluster, point_count, activos} para ese zoom.
 
         Retorna FeatureCollection lista para el frontend.
         """
@@ -131,4 +226,60 @@ class UbicacionesController:
             hasta=hasta,
             limit=lim,
             bbox=bbox_dict,
+            near=near,
+            radius_m=radius_m,
+            polygon=polygon,
+            cluster=cluster,
+            zoom=zoom,
+        )
+
+    def feature_stream(
+        self,
+        *,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        limit: Optional[str] = None,
+        bbox: Optional[str] = None,
+        near: Optional[str] = None,
+        radius_m: Optional[float] = None,
+        polygon: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Igual que feature_collection pero como generador de partes del JSON (sin tope de 5000)."""
+        bbox_dict = self._parse_bbox(bbox) if bbox else None
+        return self.service.feature_stream(
+            patrulla_id=patrulla_id,
+            desde=desde,
+            hasta=hasta,
+            limit=limit,
+            bbox=bbox_dict,
+            near=near,
+            radius_m=radius_m,
+            polygon=polygon,
+        )
+
+    def feature_delta(
+        self,
+        *,
+        since: str,
+        bbox: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Cambios del mapa en vivo desde un cursor (features + deleted + cursor nuevo)."""
+        bbox_dict = self._parse_bbox(bbox) if bbox else None
+        return self.service.feature_delta(since, bbox=bbox_dict, patrulla_id=patrulla_id)
+
+    def position_stream(
+        self,
+        *,
+        last_event_id: Optional[str] = None,
+        bbox: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+        dumps: Any = None,
+    ) -> Iterator[str]:
+        """Eventos SSE (snapshot / positions) del mapa en vivo."""
+        bbox_dict = self._parse_bbox(bbox) if bbox else None
+        kwargs = {"dumps": dumps} if dumps is not None else {}
+        return self.service.position_stream(
+            last_event_id=last_event_id, bbox=bbox_dict, patrulla_id=patrulla_id, **kwargs
         )
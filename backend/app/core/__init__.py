@@ -7,6 +7,7 @@ from flask_jwt_extended import JWTManager
 
 from app.config.settings import Settings
 from app.core.db.factory import create_adapter
+from app.core.db.pool import init_pool
 from app.views.api import api_bp
 from app.views.web import web_bp
 
@@ -59,15 +60,8 @@ def create_app():
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=Settings.JWT_EXPIRES_MIN)
     JWTManager(app)
 
-    # === DB adapter ===
-    db = create_adapter(
-        Settings.DB_ENGINE,
-        host=Settings.DB_HOST,
-        port=Settings.DB_PORT,
-        name=Settings.DB_NAME,
-        user=Settings.DB_USER,
-        password=Settings.DB_PASSWORD,
-    )
+    # === DB adapter (conexiones prestadas del pool del proceso, seguro entre hilos) ===
+    db = create_adapter(Settings.DB_ENGINE, pool=init_pool(Settings))
     try:
         db.connect()
         app.extensions["db"] = db
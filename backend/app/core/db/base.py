@@ -1,15 +1,32 @@
 from abc import ABC, abstractmethod
-from contextlib import contextmanager
-from typing import Any, Iterable, Optional
+from typing import Any, AsyncContextManager, ContextManager, Iterable, Optional
+
 
 class DatabaseAdapter(ABC):
-    """Interfaz unificada para cualquier motor de BD."""
+    """
+    Interfaz unificada para cualquier motor de BD.
+
+    Las implementaciones no comparten conexión ni cursor entre hilos/requests:
+    cada operación (o cada bloque transaction()) toma una conexión prestada del
+    pool y el estado de execute()/fetch*() vive en el contexto actual.
+
+    Uso:
+        db.execute("SELECT NOW()"); db.fetchone()      # autocommit, 1 préstamo
+        with db.transaction():                          # 1 conexión todo el bloque
+            db.execute(...); db.execute(...)
+    """
 
     @abstractmethod
     def connect(self) -> None: ...
     @abstractmethod
     def close(self) -> None: ...
     @abstractmethod
+    def connection(self) -> ContextManager[Any]:
+        """Presta una conexión cruda del pool durante el bloque `with`."""
+    @abstractmethod
+    def transaction(self) -> ContextManager[Any]:
+        """Commit al salir sin error, rollback si hay excepción. Anidable (savepoint)."""
+    @abstractmethod
     def execute(self, sql: str, params: Optional[Iterable[Any]] = None) -> None: ...
     @abstractmethod
     def fetchone(self) -> Optional[tuple]: ...
@@ -20,12 +37,28 @@ class DatabaseAdapter(ABC):
     @abstractmethod
     def rollback(self) -> None: ...
 
-    @contextmanager
-    def transaction(self):
-        """Uso: with db.transaction(): db.execute(...); ..."""
-        try:
-            yield
-            self.commit()
-        except Exception:
-            self.rollback()
-            raise
+
+class AsyncDatabaseAdapter(ABC):
+    """
+    Gemelo asíncrono de DatabaseAdapter (mismo contrato, métodos awaitables).
+    El estado execute()/fetch*() es por tarea asyncio.
+    """
+
+    @abstractmethod
+    async def connect(self) -> None: ...
+    @abstractmethod
+    async def close(self) -> None: ...
+    @abstractmethod
+    def connection(self) -> AsyncContextManager[Any]: ...
+    @abstractmethod
+    def transaction(self) -> AsyncContextManager[Any]: ...
+    @abstractmethod
+    async def execute(self, sql: str, params: Optional[Iterable[Any]] = None) -> None: ...
+    @abstractmethod
+    async def fetchone(self) -> Optional[tuple]: ...
+    @abstractmethod
+    async def fetchall(self) -> list[tuple]: ...
+    @abstractmethod
+    async def commit(self) -> None: ...
+    @abstractmethod
+    async def rollback(self) -> None: ...
@@ -1,7 +1,24 @@
-from app.core.db.base import DatabaseAdapter
-from app.core.db.postgres import PostgresAdapter
+from app.core.db.base import AsyncDatabaseAdapter, DatabaseAdapter
+from app.core.db.postgres import AsyncPostgresAdapter, PostgresAdapter
+
+_PG_ENGINES = ("postgres", "postgresql", "postgis")
+
 
 def create_adapter(engine: str, **kw) -> DatabaseAdapter:
-    if engine.lower() == "postgres":
-        return PostgresAdapter(kw["host"], kw["port"], kw["name"], kw["user"], kw["password"])
+    """kw: host/port/name/user/password, o pool=<ConnectionPool> para reusar el del proceso."""
+    if engine.lower() in _PG_ENGINES:
+        return PostgresAdapter(
+            kw.get("host"), kw.get("port"), kw.get("name"), kw.get("user"), kw.get("password"),
+            pool=kw.get("pool"),
+        )
+    raise ValueError(f"Motor no soportado: {engine}")
+
+
+def create_async_adapter(engine: str, **kw) -> AsyncDatabaseAdapter:
+    """Igual que create_adapter pero devuelve el gemelo asíncrono (pool=<AsyncConnectionPool>)."""
+    if engine.lower() in _PG_ENGINES:
+        return AsyncPostgresAdapter(
+            kw.get("host"), kw.get("port"), kw.get("name"), kw.get("user"), kw.get("password"),
+            pool=kw.get("pool"),
+        )
     raise ValueError(f"Motor no soportado: {engine}")
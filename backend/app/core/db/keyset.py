@@ -0,0 +1,78 @@
+# backend/app/core/db/keyset.py
+"""
+Paginación por keyset (?after=<cursor>) para los listados.
+
+En lugar de LIMIT/OFFSET (que lee y descarta todas las filas anteriores) se
+ordena por una clave estable y única y se pide lo que viene después de la
+última fila vista: WHERE (k1, k2) > (:k1, :k2) ORDER BY k1, k2 LIMIT n. Con
+un índice sobre la clave, la página 10.000 cuesta lo mismo que la primera:
+así están ubicaciones (id), patrullas (id) y asignaciones/mine
+(user_id, started_at, id). Usuarios y patrullas de la app móvil ordenan por
+claves calculadas (rango de rol, alias vacío) sin índice: el cursor evita el
+OFFSET pero cada página sigue ordenando todo el conjunto.
+
+El cursor es opaco para el cliente: la clave de la última fila en JSON,
+base64url. Cada listado sabe cómo decodificar sus valores (tipos).
+
+Conteo (count): exact = COUNT(*) (recorre todo), estimate = filas estimadas
+por el planner (EXPLAIN, sin ejecutar), none = no se cuenta.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+COUNT_MODES = ("exact", "estimate", "none")
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Clave de la última fila -> cursor opaco."""
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, types: Sequence[Callable[[Any], Any]]) -> List[Any]:
+    """Cursor -> valores de la clave, convertidos con `types` (uno por columna). ValueError si no sirve."""
+    try:
+        pad = "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(token + pad))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return [conv(v) for conv, v in zip(types, values)]
+    except Exception:
+        raise ValueError("after inválido (usar el cursor 'next' de la respuesta anterior)")
+
+
+def parse_dt(value: Any) -> datetime:
+    return datetime.fromisoformat(str(value))
+
+
+def count_mode(value: Optional[str], default: str) -> str:
+    mode = (value or default).strip().lower()
+    if mode not in COUNT_MODES:
+        raise ValueError(f"count debe ser uno de: {', '.join(COUNT_MODES)}")
+    return mode
+
+
+def explain_sql(sql: str) -> str:
+    """EXPLAIN sin ANALYZE: el planner estima las filas sin ejecutar la consulta."""
+    return f"EXPLAIN (FORMAT JSON) {sql}"
+
+
+def plan_rows(plan: Any) -> int:
+    """Filas estimadas del nodo raíz del resultado de explain_sql()."""
+    if isinstance(plan, (str, bytes)):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def next_cursor(rows: Sequence[Any], size: int, key: Callable[[Any], Sequence[Any]]) -> Optional[str]:
+    """Cursor de la página siguiente, o None si esta fue la última (se pide size + 1 filas)."""
+    if len(rows) <= size:
+        return None
+    return encode_cursor(key(rows[size - 1]))
@@ -0,0 +1,65 @@
+# backend/app/core/db/pool.py
+"""
+Pool de conexiones psycopg compartido por proceso.
+
+create_app() lo inicializa con init_pool() y lo cierra al terminar el proceso.
+Los repositorios/servicios que usan SQL directo piden conexiones con:
+
+    with get_pool().connection() as conn:
+        ...
+
+Al salir del bloque la conexión vuelve al pool (commit si no hubo error,
+rollback si lo hubo).
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from typing import Optional
+
+from psycopg_pool import ConnectionPool
+
+from app.config.settings import Settings, build_psycopg_conninfo, psycopg_pool_kwargs
+
+_pool: Optional[ConnectionPool] = None
+_lock = threading.Lock()
+
+
+def init_pool(cfg: "Settings" = Settings) -> ConnectionPool:
+    """
+    Crea (una sola vez por proceso) el pool acotado. Idempotente: si ya existe
+    y sigue abierto, lo devuelve. No bloquea si la BD aún no responde; las
+    conexiones se abren en segundo plano.
+    """
+    global _pool
+    with _lock:
+        if _pool is not None and not _pool.closed:
+            return _pool
+        _pool = ConnectionPool(
+            build_psycopg_conninfo(cfg),
+            check=ConnectionPool.check_connection if cfg.DB_POOL_PRE_PING else None,
+            name="patrullaje",
+            open=True,
+            **psycopg_pool_kwargs(cfg),
+        )
+        return _pool
+
+
+def get_pool() -> ConnectionPool:
+    """Pool del proceso; lo crea con Settings si nadie lo inicializó (scripts, shell)."""
+    pool = _pool
+    if pool is None or pool.closed:
+        pool = init_pool()
+    return pool
+
+
+def close_pool() -> None:
+    """Cierra el pool del proceso (si existe). Seguro de llamar varias veces."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None and not pool.closed:
+        pool.close()
+
+
+atexit.register(close_pool)
@@ -1,25 +1,236 @@
 # backend/app/core/db/postgres.py
-import psycopg
-from app.core.db.base import DatabaseAdapter
+from __future__ import annotations
+
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Optional
+
+from psycopg import conninfo
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from app.config.settings import Settings, psycopg_pool_kwargs
+from app.core.db.base import AsyncDatabaseAdapter, DatabaseAdapter
+
+
+class _Lease:
+    """
+    Estado por contexto (hilo/request o tarea asyncio):
+      - conn/cur: transacción abierta con transaction()
+      - rows: resultado del último execute() fuera de transacción
+    """
+
+    __slots__ = ("conn", "cur", "rows")
+
+    def __init__(self, conn: Any = None, cur: Any = None, rows: Optional[Deque[tuple]] = None) -> None:
+        self.conn = conn
+        self.cur = cur
+        self.rows = rows if rows is not None else deque()
+
+
+def _make_dsn(host, port, name, user, password) -> str:
+    if host is None:
+        return ""
+    return conninfo.make_conninfo(
+        host=host, port=str(port), dbname=name, user=user, password=password
+    )
+
 
 class PostgresAdapter(DatabaseAdapter):
-    def __init__(self, host, port, name, user, password):
-        self.dsn = f"host={host} port={port} dbname={name} user={user} password={password}"
-        self.conn = None
-        self.cur = None
+    """
+    Adaptador psycopg sobre un ConnectionPool. Si recibe `pool` (p.ej. el del
+    proceso, ver app/core/db/pool.py) lo usa sin adueñarse de él; si no, crea
+    el suyo en connect() y lo cierra en close().
+    """
+
+    def __init__(self, host=None, port=None, name=None, user=None, password=None, *, pool: Optional[ConnectionPool] = None):
+        self.dsn = _make_dsn(host, port, name, user, password)
+        self._pool = pool
+        self._owns_pool = pool is None
+        self._state: ContextVar[Optional[_Lease]] = ContextVar(f"pg_adapter_{id(self)}", default=None)
 
     def connect(self):
-        if not self.conn:
-            self.conn = psycopg.connect(self.dsn, autocommit=False)
-            self.cur = self.conn.cursor()
+        if self._pool is None:
+            self._pool = ConnectionPool(self.dsn, name="db-adapter", open=True, **psycopg_pool_kwargs(Settings))
 
     def close(self):
-        if self.cur: self.cur.close()
-        if self.conn: self.conn.close()
-        self.cur = None; self.conn = None
-
-    def execute(self, sql, params=None): self.cur.execute(sql, params or ())
-    def fetchone(self): return self.cur.fetchone()
-    def fetchall(self): return self.cur.fetchall()
-    def commit(self): self.conn.commit()
-    def rollback(self): self.conn.rollback()
+        if self._pool is not None and self._owns_pool:
+            self._pool.close()
+            self._pool = None
+
+    def _require_pool(self) -> ConnectionPool:
+        if self._pool is None:
+            self.connect()
+        return self._pool
+
+    def _tx(self) -> Optional[_Lease]:
+        st = self._state.get()
+        return st if st is not None and st.conn is not None else None
+
+    @contextmanager
+    def connection(self):
+        with self._require_pool().connection() as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self):
+        outer = self._tx()
+        if outer is not None:
+            # anidada: savepoint sobre la misma conexión prestada
+            with outer.conn.transaction():
+                yield outer.conn
+            return
+
+        with self._require_pool().connection() as conn:
+            lease = _Lease(conn, conn.cursor())
+            token = self._state.set(lease)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                lease.cur.close()
+                self._state.reset(token)
+
+    def execute(self, sql, params=None):
+        tx = self._tx()
+        if tx is not None:
+            tx.cur.execute(sql, params)
+            return
+        # fuera de transacción: préstamo corto, resultados bufferizados en el contexto
+        with self._require_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else []
+        self._state.set(_Lease(rows=deque(rows)))
+
+    def fetchone(self):
+        st = self._state.get()
+        if st is None:
+            return None
+        if st.cur is not None:
+            return st.cur.fetchone()
+        return st.rows.popleft() if st.rows else None
+
+    def fetchall(self):
+        st = self._state.get()
+        if st is None:
+            return []
+        if st.cur is not None:
+            return st.cur.fetchall()
+        rows = list(st.rows)
+        st.rows.clear()
+        return rows
+
+    def commit(self):
+        tx = self._tx()
+        if tx is not None:
+            tx.conn.commit()
+
+    def rollback(self):
+        tx = self._tx()
+        if tx is not None:
+            tx.conn.rollback()
+
+
+class AsyncPostgresAdapter(AsyncDatabaseAdapter):
+    """
+    Gemelo asíncrono sobre AsyncConnectionPool (psycopg async).
+    El pool queda ligado al event loop donde se hizo `await connect()`:
+    úsalo desde un loop de larga vida (servidor ASGI, tareas de fondo), no
+    desde vistas async de Flask, que crean un loop nuevo por request.
+    """
+
+    def __init__(self, host=None, port=None, name=None, user=None, password=None, *, pool: Optional[AsyncConnectionPool] = None):
+        self.dsn = _make_dsn(host, port, name, user, password)
+        self._pool = pool
+        self._owns_pool = pool is None
+        self._state: ContextVar[Optional[_Lease]] = ContextVar(f"pg_async_adapter_{id(self)}", default=None)
+
+    async def connect(self):
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(self.dsn, name="db-adapter-async", open=False, **psycopg_pool_kwargs(Settings))
+        if self._pool.closed:
+            await self._pool.open()
+
+    async def close(self):
+        if self._pool is not None and self._owns_pool:
+            await self._pool.close()
+            self._pool = None
+
+    async def _require_pool(self) -> AsyncConnectionPool:
+        if self._pool is None or self._pool.closed:
+            await self.connect()
+        return self._pool
+
+    def _tx(self) -> Optional[_Lease]:
+        st = self._state.get()
+        return st if st is not None and st.conn is not None else None
+
+    @asynccontextmanager
+    async def connection(self):
+        pool = await self._require_pool()
+        async with pool.connection() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        outer = self._tx()
+        if outer is not None:
+            async with outer.conn.transaction():
+                yield outer.conn
+            return
+
+        pool = await self._require_pool()
+        async with pool.connection() as conn:
+            lease = _Lease(conn, conn.cursor())
+            token = self._state.set(lease)
+            try:
+                yield conn
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+            finally:
+                await lease.cur.close()
+                self._state.reset(token)
+
+    async def execute(self, sql, params=None):
+        tx = self._tx()
+        if tx is not None:
+            await tx.cur.execute(sql, params)
+            return
+        pool = await self._require_pool()
+        async with pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall() if cur.description else []
+        self._state.set(_Lease(rows=deque(rows)))
+
+    async def fetchone(self):
+        st = self._state.get()
+        if st is None:
+            return None
+        if st.cur is not None:
+            return await st.cur.fetchone()
+        return st.rows.popleft() if st.rows else None
+
+    async def fetchall(self):
+        st = self._state.get()
+        if st is None:
+            return []
+        if st.cur is not None:
+            return await st.cur.fetchall()
+        rows = list(st.rows)
+        st.rows.clear()
+        return rows
+
+    async def commit(self):
+        tx = self._tx()
+        if tx is not None:
+            await tx.conn.commit()
+
+    async def rollback(self):
+        tx = self._tx()
+        if tx is not None:
+            await tx.conn.rollback()
@@ -0,0 +1,123 @@
+# backend/app/core/db/schema_caps.py
+"""
+Registro de capacidades del esquema (tablas/columnas/extensiones presentes).
+
+Se construye una vez al arrancar (create_app) con una sola consulta al
+catálogo y se puede refrescar bajo demanda (refresh_capabilities, p.ej. tras
+una migración). El hot path consulta este objeto en memoria en lugar de
+preguntar a pg_catalog en cada request.
+
+La foto es por proceso: un refresh en un worker avisa a los demás (ver
+views/api.py), que marcan la suya vieja (mark_stale) y la releen en el
+próximo get_capabilities.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from sqlalchemy import text
+
+# Tablas de public.* cuyo layout nos interesa (legacy + actuales)
+WATCHED_TABLES = (
+    "ubicaciones",
+    "patrulla",
+    "users",
+    "user_patrulla_asignacion",
+    "operador",
+    "asignacion_patrulla",
+    "patrulla_posicion_actual",
+)
+
+_SQL_COLUMNS = text("""
+    SELECT c.relname, a.attname
+      FROM pg_catalog.pg_class c
+      JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+      LEFT JOIN pg_catalog.pg_attribute a
+             ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+     WHERE n.nspname = 'public'
+       AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+       AND c.relname = ANY(:tables)
+""")
+_SQL_EXTENSIONS = text("SELECT extname FROM pg_catalog.pg_extension")
+
+
+class SchemaCapabilities:
+    """Foto inmutable del esquema. `version` cambia en cada refresh."""
+
+    def __init__(
+        self,
+        tables: Dict[str, FrozenSet[str]],
+        extensions: Iterable[str] = (),
+        version: int = 0,
+    ) -> None:
+        self.tables = dict(tables)
+        self.extensions = frozenset(extensions)
+        self.version = version
+
+    def has_table(self, table: str) -> bool:
+        return table in self.tables
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.tables.get(table, ())
+
+    def has_extension(self, name: str) -> bool:
+        return name in self.extensions
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "tables": {t: sorted(cols) for t, cols in sorted(self.tables.items())},
+            "extensions": sorted(self.extensions),
+        }
+
+
+_caps: Optional[SchemaCapabilities] = None
+_stale = False
+_lock = threading.Lock()
+
+
+def refresh_capabilities(engine, tables: Iterable[str] = WATCHED_TABLES) -> SchemaCapabilities:
+    """Relee el catálogo (2 consultas) y publica una nueva versión."""
+    global _caps, _stale
+    found: Dict[str, set] = {}
+    with engine.connect() as conn:
+        for relname, attname in conn.execute(_SQL_COLUMNS, {"tables": list(tables)}):
+            cols = found.setdefault(relname, set())
+            if attname:
+                cols.add(attname)
+        exts = [r[0] for r in conn.execute(_SQL_EXTENSIONS)]
+    with _lock:
+        version = (_caps.version + 1) if _caps is not None else 1
+        _caps = SchemaCapabilities(
+            {t: frozenset(c) for t, c in found.items()}, exts, version
+        )
+        _stale = False
+        return _caps
+
+
+def current_capabilities() -> Optional[SchemaCapabilities]:
+    """Capacidades ya detectadas, sin ir a la BD (None si aún no hay foto)."""
+    return _caps
+
+
+def mark_stale() -> None:
+    """Otro worker refrescó: releer en el próximo get_capabilities()."""
+    global _stale
+    _stale = True
+
+
+def get_capabilities(engine) -> SchemaCapabilities:
+    """
+    Capacidades vigentes; las carga si aún no se detectaron (p.ej. BD caída al
+    arrancar) o si quedaron marcadas viejas (si falla, sigue la foto anterior).
+    """
+    caps = _caps
+    if caps is None:
+        return refresh_capabilities(engine)
+    if _stale:
+        try:
+            return refresh_capabilities(engine)
+        except Exception as e:
+            print(f"[schema_caps] no se pudo releer el esquema, se usa la versión {caps.version}: {e}")
+    return caps
@@ -0,0 +1,94 @@
+# backend/app/core/json_provider.py
+"""
+Proveedor JSON de la app (app.json): orjson si está instalado, stdlib si no.
+
+- datetime/date/time salen en ISO 8601 en ambos casos (orjson lo hace de
+  forma nativa; el respaldo usa isoformat()), así la salida no depende de
+  qué librería haya en el entorno. Antes Flask los mandaba como fecha HTTP
+  ("Mon, 01 Jan 2024 00:00:00 GMT"), que siempre es UTC.
+- Los datetime naive se tratan como UTC y salen con "+00:00": un ISO sin
+  zona new Date() lo lee como hora local del navegador, no como UTC.
+- Decimal -> string (igual que el proveedor por defecto de Flask).
+- Sin ordenar claves: orden de inserción, más barato que sort_keys.
+- Si orjson rechaza un valor (p.ej. enteros de más de 64 bits) se reintenta
+  con stdlib en lugar de fallar la respuesta.
+"""
+from __future__ import annotations
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time, timezone
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:  # opcional
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None  # type: ignore[assignment]
+
+HAS_ORJSON = orjson is not None
+
+
+def _default(o: Any) -> Any:
+    """Tipos que ni orjson ni json serializan solos."""
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _default_stdlib(o: Any) -> Any:
+    if isinstance(o, datetime) and o.tzinfo is None:
+        return o.replace(tzinfo=timezone.utc).isoformat()  # igual que OPT_NAIVE_UTC
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    return _default(o)
+
+
+if HAS_ORJSON:
+    _OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+    _OPTS_PRETTY = _OPTS | orjson.OPT_INDENT_2
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    ensure_ascii = False
+
+    def _dumps_bytes(self, obj: Any, pretty: bool = False) -> bytes:
+        if HAS_ORJSON:
+            try:
+                return orjson.dumps(obj, default=_default, option=_OPTS_PRETTY if pretty else _OPTS)
+            except (TypeError, orjson.JSONEncodeError):
+                pass  # p.ej. int > 64 bits: se intenta con stdlib
+        return json.dumps(
+            obj,
+            default=_default_stdlib,
+            ensure_ascii=False,
+            indent=2 if pretty else None,
+            separators=None if pretty else (",", ":"),
+        ).encode("utf-8")
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:  # opciones explícitas (indent, sort_keys...): stdlib tal cual
+            kwargs.setdefault("default", _default_stdlib)
+            kwargs.setdefault("ensure_ascii", False)
+            return json.dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if HAS_ORJSON and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._dumps_bytes(obj, pretty) + b"\n", mimetype=self.mimetype)
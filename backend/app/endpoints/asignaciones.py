@@ -6,6 +6,9 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from sqlalchemy import text
 
+from app.core.db.keyset import count_mode, decode_cursor, explain_sql, next_cursor, parse_dt, plan_rows
+from app.services.ubicacion_eventos import ASIGNACION, anunciar
+
 asig_bp = Blueprint("asignaciones", __name__)
 
 # ---------------------------------------------------------------------
@@ -63,10 +66,13 @@ def _ensure_schema(_state):
                     ON user_patrulla_asignacion(user_id)
                     WHERE ended_at IS NULL;
             """))
+            # (user_id, started_at, id): orden estable para el keyset de /mine;
+            # reemplaza a idx_upa_user_started (mismo prefijo)
             conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_upa_user_started
-                    ON user_patrulla_asignacion(user_id, started_at DESC);
+                CREATE INDEX IF NOT EXISTS idx_upa_user_started_id
+                    ON user_patrulla_asignacion(user_id, started_at DESC, id DESC);
             """))
+            conn.execute(text("DROP INDEX IF EXISTS idx_upa_user_started;"))
     except Exception as e:
         print(f"[asignaciones] ensure_schema warning: {e}")
 
@@ -118,6 +124,7 @@ def start_asignacion():
             """),
             {"uid": uid, "pid": patrulla_id, "now": now},
         ).mappings().first()
+    anunciar(ASIGNACION, uid=uid, email=email)  # en todos los workers
 
     return jsonify({"ok": True, "asignacion": dict(new_row)}), 201
 
@@ -143,6 +150,7 @@ def end_asignacion():
             """),
             {"uid": uid, "now": now},
         ).mappings().first()
+    anunciar(ASIGNACION, uid=uid, email=email)  # en todos los workers
 
     if not res:
         return jsonify({"ok": False, "msg": "no hay asignación activa"}), 404
@@ -194,33 +202,55 @@ def mine_asignaciones():
     except Exception:
         return jsonify({"ok": False, "msg": "page/size inválidos"}), 400
 
-    off = (page - 1) * size
+    # ?after=<next>: keyset sobre (started_at, id) DESC con idx_upa_user_started_id
+    after = request.args.get("after") or None
+    try:
+        count = count_mode(request.args.get("count"), "none" if after else "exact")
+        key = decode_cursor(after, (parse_dt, int)) if after else None
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+
+    off = 0 if after else (page - 1) * size
+    params = {"uid": uid, "size": size + 1, "off": off}
+    keyset = ""
+    if key is not None:
+        keyset = "AND (a.started_at, a.id) < (:k_started, :k_id)"
+        params.update(k_started=key[0], k_id=key[1])
 
+    total = None
     with _engine().connect() as conn:
-        total = conn.execute(
-            text("SELECT COUNT(*) FROM user_patrulla_asignacion WHERE user_id = :uid"),
-            {"uid": uid},
-        ).scalar_one()
+        if count == "exact":
+            total = conn.execute(
+                text("SELECT COUNT(*) FROM user_patrulla_asignacion WHERE user_id = :uid"),
+                {"uid": uid},
+            ).scalar_one()
+        elif count == "estimate":
+            plan = conn.execute(
+                text(explain_sql("SELECT 1 FROM user_patrulla_asignacion WHERE user_id = :uid")),
+                {"uid": uid},
+            ).scalar()
+            total = plan_rows(plan)
 
         rows = conn.execute(
-            text("""
+            text(f"""
                 SELECT a.id, a.user_id, a.patrulla_id, a.started_at, a.ended_at,
                        p.codigo AS patrulla_codigo, p.alias AS patrulla_alias
                   FROM user_patrulla_asignacion a
                   JOIN patrulla p ON p.id = a.patrulla_id
-                 WHERE a.user_id = :uid
-                 ORDER BY a.started_at DESC
+                 WHERE a.user_id = :uid {keyset}
+                 ORDER BY a.started_at DESC, a.id DESC
                  LIMIT :size OFFSET :off
             """),
-            {"uid": uid, "size": size, "off": off},
+            params,
         ).mappings().all()
 
-    items = [dict(r) for r in rows]
+    items = [dict(r) for r in rows[:size]]
     return jsonify({
         "ok": True,
         "items": items,
-        "page": page,
+        "page": None if after else page,
         "size": size,
         "total": total,
-        "total_pages": (total + size - 1) // size if size else 1
+        "total_pages": (total + size - 1) // size if total is not None else None,
+        "next": next_cursor(rows, size, lambda r: (r["started_at"], r["id"])),
     }), 200
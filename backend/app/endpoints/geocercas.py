@@ -0,0 +1,172 @@
+# backend/app/endpoints/geocercas.py
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.core.db.keyset import parse_dt
+from app.services.geocerca_service import GeocercaService
+from app.services.user_service import UserService
+
+geocercas_bp = Blueprint("geocercas", __name__)
+_svc = GeocercaService()
+_user_svc = UserService()
+
+
+@geocercas_bp.record_once
+def _ensure_schema(_state):
+    try:
+        _svc.ensure_schema()
+    except Exception as e:
+        print(f"[geocercas] ensure_schema warning: {e}")
+
+
+# ------- helpers de admin -------
+def _current_uid_int() -> Optional[int]:
+    try:
+        val = get_jwt_identity()
+        return int(val) if val is not None else None
+    except Exception:
+        return None
+
+
+def _admin_guard() -> Optional[Tuple[dict, int]]:
+    uid = _current_uid_int()
+    if uid is None:
+        return {"ok": False, "msg": "no autorizado"}, 401
+    try:
+        roles = _user_svc.list_role_codes(uid) or []
+    except Exception:
+        roles = []
+    if "admin" not in roles:
+        return {"ok": False, "msg": "permiso denegado"}, 403
+    return None
+
+
+def _int_arg(name: str) -> Optional[int]:
+    val = request.args.get(name)
+    if val in (None, ""):
+        return None
+    try:
+        return int(val)
+    except ValueError:
+        raise ValueError(f"{name} inválido")
+
+
+def _dt_arg(name: str) -> Optional[datetime]:
+    """ISO 8601 (Z o ±HH:MM; sin zona = UTC). ValueError -> 400 antes de tocar la BD."""
+    val = (request.args.get(name) or "").strip()
+    if not val:
+        return None
+    try:
+        dt = parse_dt(val.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} inválido (ISO 8601, p.ej. 2024-05-01T10:00:00Z)")
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+# ------- lectura (sesión) -------
+
+# GET /api/geocercas
+@geocercas_bp.get("")
+@jwt_required()
+def list_geocercas():
+    try:
+        items = _svc.list()
+        return jsonify({"ok": True, "items": items, "total": len(items)}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al listar: {e}"}), 500
+
+
+# GET /api/geocercas/eventos?patrulla_id=&geocerca_id=&desde=&limit=
+@geocercas_bp.get("/eventos")
+@jwt_required()
+def list_eventos():
+    try:
+        items = _svc.eventos(
+            patrulla_id=_int_arg("patrulla_id"),
+            geocerca_id=_int_arg("geocerca_id"),
+            desde=_dt_arg("desde"),
+            limit=_int_arg("limit") or 200,
+        )
+        return jsonify({"ok": True, "items": items}), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al listar eventos: {e}"}), 500
+
+
+# GET /api/geocercas/stats  (cola de evaluación del worker que responde)
+@geocercas_bp.get("/stats")
+@jwt_required()
+def geocercas_stats():
+    return jsonify(_svc.stats()), 200
+
+
+# GET /api/geocercas/<id>
+@geocercas_bp.get("/<int:gid>")
+@jwt_required()
+def get_geocerca(gid: int):
+    try:
+        item = _svc.get(gid)
+        if not item:
+            return jsonify({"ok": False, "msg": "no encontrado"}), 404
+        return jsonify({"ok": True, "geocerca": item}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al obtener: {e}"}), 500
+
+
+# ------- escritura (solo admin) -------
+
+# POST /api/geocercas  {nombre, geojson: Polygon|MultiPolygon, patrulla_id?, activo?}
+@geocercas_bp.post("")
+@jwt_required()
+def create_geocerca():
+    guard = _admin_guard()
+    if guard:
+        body, code = guard
+        return jsonify(body), code
+    try:
+        item = _svc.create(request.get_json(silent=True) or {})
+        return jsonify({"ok": True, "geocerca": item}), 201
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al crear: {e}"}), 500
+
+
+# PUT /api/geocercas/<id>  {nombre?, geojson?, patrulla_id?, activo?}
+@geocercas_bp.put("/<int:gid>")
+@jwt_required()
+def update_geocerca(gid: int):
+    guard = _admin_guard()
+    if guard:
+        body, code = guard
+        return jsonify(body), code
+    try:
+        item = _svc.update(gid, request.get_json(silent=True) or {})
+        if not item:
+            return jsonify({"ok": False, "msg": "no encontrado"}), 404
+        return jsonify({"ok": True, "geocerca": item}), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al actualizar: {e}"}), 500
+
+
+# DELETE /api/geocercas/<id>
+@geocercas_bp.delete("/<int:gid>")
+@jwt_required()
+def delete_geocerca(gid: int):
+    guard = _admin_guard()
+    if guard:
+        body, code = guard
+        return jsonify(body), code
+    try:
+        if not _svc.delete(gid):
+            return jsonify({"ok": False, "msg": "no encontrado"}), 404
+        return jsonify({"ok": True}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al eliminar: {e}"}), 500
@@ -5,6 +5,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import text
 
+from app.core.db.keyset import count_mode, decode_cursor, explain_sql, next_cursor, plan_rows
+
 mobile_bp = Blueprint("mobile", __name__)
 
 # ---------------------------------------------------------------------
@@ -28,18 +30,27 @@ def listar_patrullas_mobile():
     Soporta:
       - q: búsqueda por alias o código (ILIKE)
       - page, size: paginación (size máx 200)
+      - after: cursor 'next' de la respuesta anterior (keyset, sin OFFSET;
+        page se ignora; el orden no tiene índice, cada página ordena todo)
+      - count: exact (defecto con page) | estimate | none (defecto con after)
     Respuesta:
-      { ok, items: [{id, codigo, alias}], page, size, total }
+      { ok, items: [{id, codigo, alias}], page, size, total, next }
     """
     q = (request.args.get("q") or "").strip()
+    after = request.args.get("after") or None
     try:
         page = max(1, int(request.args.get("page", 1)))
         size = int(request.args.get("size", 100))
     except ValueError:
         return jsonify({"ok": False, "msg": "page/size inválidos"}), 400
+    try:
+        count = count_mode(request.args.get("count"), "none" if after else "exact")
+        key = decode_cursor(after, (bool, str, str)) if after else None
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
 
     size = max(1, min(size, 200))
-    off = (page - 1) * size
+    off = 0 if after else (page - 1) * size
 
     # Filtro por búsqueda (alias/codigo)
     where = """
@@ -47,35 +58,48 @@ def listar_patrullas_mobile():
                COALESCE(p.alias,'')  ILIKE '%' || :q || '%' OR
                COALESCE(p.codigo,'') ILIKE '%' || :q || '%')
     """
+    params = {"q": q, "lim": size + 1, "off": off}
 
-    # Conteo total
-    sql_count = text(f"SELECT COUNT(*) FROM patrulla p {where}")
+    # Clave de orden: primero las que tienen alias, por alias y luego código
+    # (único); la misma expresión sirve para el keyset
+    sort_key = "(NULLIF(p.alias, '') IS NULL), COALESCE(p.alias, ''), p.codigo"
+    page_where = where
+    if key is not None:
+        page_where += f" AND ({sort_key}) > (:k_sin_alias, :k_alias, :k_codigo)"
+        params.update(k_sin_alias=key[0], k_alias=key[1], k_codigo=key[2])
 
     # Datos paginados (solo campos mínimos)
     sql_items = text(f"""
-        SELECT p.id, p.codigo, p.alias
+        SELECT p.id, p.codigo, p.alias,
+               NULLIF(p.alias, '') IS NULL AS sin_alias, COALESCE(p.alias, '') AS alias_orden
           FROM patrulla p
-          {where}
-         ORDER BY NULLIF(p.alias, '') IS NULL, p.alias ASC, p.codigo ASC
+          {page_where}
+         ORDER BY {sort_key}
          LIMIT :lim OFFSET :off
     """)
 
     eng = _get_engine()
+    total = None
     try:
         with eng.connect() as conn:
-            total = conn.execute(sql_count, {"q": q}).scalar() or 0
-            rows = conn.execute(sql_items, {"q": q, "lim": size, "off": off}).fetchall()
+            if count == "exact":
+                total = conn.execute(text(f"SELECT COUNT(*) FROM patrulla p {where}"), {"q": q}).scalar() or 0
+            elif count == "estimate":
+                plan = conn.execute(text(explain_sql(f"SELECT 1 FROM patrulla p {where}")), {"q": q}).scalar()
+                total = plan_rows(plan)
+            rows = conn.execute(sql_items, params).fetchall()
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al listar patrullas: {e}"}), 500
 
-    items = [{"id": r[0], "codigo": r[1], "alias": r[2]} for r in rows]
+    items = [{"id": r[0], "codigo": r[1], "alias": r[2]} for r in rows[:size]]
 
     return jsonify({
         "ok": True,
         "items": items,
-        "page": page,
+        "page": None if after else page,
         "size": size,
-        "total": total
+        "total": total,
+        "next": next_cursor(rows, size, lambda r: (r[3], r[4], r[1])),
     }), 200
 
 
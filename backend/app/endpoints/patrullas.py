@@ -5,6 +5,7 @@ from typing import Optional, Tuple
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from app.services.ubicacion_eventos import ASIGNACION, anunciar
 from app.services.patrulla_service import PatrullaService
 from app.services.user_service import UserService
 
@@ -53,6 +54,7 @@ def _admin_guard() -> Optional[Tuple[dict, int]]:
 # ------- rutas CRUD (solo admin) -------
 
 # GET /api/patrullas?page=1&size=10&q=abc
+#     o ?after=<next>&size=10 (keyset); count=exact|estimate|none
 @patrullas_bp.get("")
 @jwt_required()
 def list_patrullas():
@@ -69,10 +71,19 @@ def list_patrullas():
     q = (request.args.get("q") or "").strip()
 
     try:
-        data = _patr_svc.list(page=page, size=size, q=q)
-        total = int(data.get("total", 0))
-        total_pages = (total + size - 1) // size if size else 1
+        data = _patr_svc.list(
+            page=page,
+            size=size,
+            q=q,
+            after=request.args.get("after") or None,
+            count=request.args.get("count") or None,
+        )
+        total = data.get("total")
+        size = data.get("size", size)
+        total_pages = (total + size - 1) // size if total is not None and size else None
         return jsonify({**data, "ok": True, "total_pages": total_pages}), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al listar: {e}"}), 500
 
@@ -146,6 +157,8 @@ def update_patrulla(pid: int):
         )
         if not item:
             return jsonify({"ok": False, "msg": "no encontrado"}), 404
+        # alias/código cacheados en la asignación de los usuarios
+        anunciar(ASIGNACION)  # vacía la caché en todos los workers
         return jsonify({"ok": True, "patrulla": item}), 200
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al actualizar: {e}"}), 500
@@ -164,6 +177,8 @@ def delete_patrulla(pid: int):
         ok = _patr_svc.delete(pid)
         if not ok:
             return jsonify({"ok": False, "msg": "no encontrado"}), 404
+        # ON DELETE CASCADE cierra sus asignaciones
+        anunciar(ASIGNACION)  # vacía la caché en todos los workers
         return jsonify({"ok": True}), 200
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al eliminar: {e}"}), 500
@@ -1,11 +1,21 @@
 # backend/app/endpoints/ubicaciones.py
 from __future__ import annotations
 
-from flask import Blueprint, request, jsonify, current_app
+from functools import wraps
+
+from flask import Blueprint, Response, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
-from sqlalchemy import text
+from sqlalchemy import TextClause, text
 
+from app.config.settings import Settings
 from app.controllers.ubicaciones_controller import UbicacionesController
+from app.core.db.keyset import count_mode
+from app.core.db.schema_caps import get_capabilities
+from app.services.asignacion_cache import asignacion_cache, is_miss
+from app.services.posicion_index import get_posicion_index
+from app.services.ubicacion_buffer import BufferFullError
+from app.services.ubicacion_stream import StreamBusyError
+from app.services.ubicacion_version import Watermark, current_watermark
 
 # Nota: SIN url_prefix aquí. El prefijo final se fija en app/__init__.py al registrar.
 ubic_bp = Blueprint("ubicaciones", __name__)
@@ -30,11 +40,145 @@ def _ensure_schema(_state):
         print(f"[ubicaciones] ensure_schema warning: {e}")
 
 
-# ---------- Helpers de DB ----------
-def _table_exists(conn, table_name: str) -> bool:
-    """Verifica si existe public.<table_name> usando to_regclass (ignora schema search_path)."""
-    q = text("SELECT to_regclass(:tbl) IS NOT NULL")
-    return bool(conn.execute(q, {"tbl": f"public.{table_name}"}).scalar())
+# ---------- GET condicional (ETag) ----------
+def _cache_headers(resp: Response, etag: str, wm: Watermark) -> None:
+    resp.set_etag(etag)
+    if wm.max_ts is not None:
+        resp.last_modified = wm.max_ts
+    resp.headers["Cache-Control"] = "no-cache"  # el cliente guarda, pero revalida siempre
+
+
+def _conditional(view=None, *, unless=None):
+    """
+    ETag = watermark de ubicaciones (ver services/ubicacion_version.py) + ruta
+    y parámetros. Si If-None-Match coincide se responde 304 sin correr la
+    consulta. Last-Modified es informativo: la validación es por ETag, porque
+    el watermark incluye cambios que no mueven ninguna fecha (ediciones,
+    borrados, pings con hora atrasada).
+
+    Si hay índice en memoria, antes de la vista se lo sincroniza contra ese
+    mismo watermark (GridIndex.sync_for): un cuerpo servido del índice nunca
+    es más viejo que su ETag.
+
+    unless(): si devuelve True la respuesta sale sin ETag (depende de algo
+    que el watermark no cubre).
+    """
+    if view is None:
+        return lambda v: _conditional(v, unless=unless)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Settings.UBIC_ETAG_ENABLED or (unless is not None and unless()):
+            return view(*args, **kwargs)
+        try:
+            wm = current_watermark()
+        except Exception as e:
+            print(f"[ubicaciones] watermark no disponible, respuesta sin ETag: {e}")
+            return view(*args, **kwargs)
+
+        # _ts = cache-buster del frontend: no cambia la respuesta
+        query = sorted((k, v) for k, v in request.args.items(multi=True) if k != "_ts")
+        etag = wm.etag(f"{request.path}?{query}")
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            _cache_headers(resp, etag, wm)
+            return resp
+
+        # que el índice en memoria no responda algo más viejo que el ETag:
+        # sync bloqueante (una por watermark); si falla, la respuesta va sin ETag
+        index = get_posicion_index()
+        fresh = index is None or index.sync_for(wm.etag(""), wm.ediciones)
+        resp = current_app.make_response(view(*args, **kwargs))
+        if resp.status_code == 200 and fresh:
+            _cache_headers(resp, etag, wm)
+        return resp
+
+    return wrapper
+
+
+# ---------- SQL del resolver, especializado según el esquema detectado ----------
+_SQL_UPA = text(
+    """
+    SELECT p.id, p.alias, p.codigo
+      FROM user_patrulla_asignacion a
+      JOIN patrulla p ON p.id = a.patrulla_id
+     WHERE a.user_id = :uid AND a.ended_at IS NULL
+     ORDER BY a.started_at DESC
+     LIMIT 1
+    """
+)
+
+# (versión de capacidades, sql user_patrulla_asignacion, sql legacy)
+_resolver_sql: tuple = (None, None, None)
+
+
+def _build_legacy_resolver_sql(caps) -> TextClause | None:
+    """
+    Arma el fallback operador/asignacion_patrulla sólo con las columnas que
+    existen (sin sub-consultas a pg_attribute). None si el layout no alcanza.
+    """
+    if not (caps.has_table("patrulla") and caps.has_table("operador") and caps.has_table("asignacion_patrulla")):
+        return None
+    if not (caps.has_column("asignacion_patrulla", "operador_id") and caps.has_column("asignacion_patrulla", "patrulla_id")):
+        return None
+
+    op_branches = []
+    if caps.has_column("operador", "email"):
+        op_branches.append("SELECT o.id FROM operador o WHERE :email <> '' AND LOWER(o.email) = :email")
+    if caps.has_column("operador", "user_id"):
+        op_branches.append(
+            "SELECT o2.id FROM operador o2 "
+            "WHERE CAST(:uid AS bigint) IS NOT NULL AND o2.user_id = CAST(:uid AS bigint)"
+        )
+
+    vigente = []
+    if caps.has_column("asignacion_patrulla", "activo"):
+        vigente.append("ap.activo = TRUE")
+    if caps.has_column("asignacion_patrulla", "inicio"):
+        if caps.has_column("asignacion_patrulla", "fin"):
+            vigente.append("(ap.inicio <= NOW() AND (ap.fin IS NULL OR ap.fin >= NOW()))")
+        else:
+            vigente.append("ap.inicio <= NOW()")
+
+    if not op_branches or not vigente:
+        return None
+
+    order = ["ap.id DESC"]
+    if caps.has_column("asignacion_patrulla", "inicio"):
+        order.insert(0, "ap.inicio DESC NULLS LAST")
+
+    return text(
+        f"""
+        WITH op AS (
+          {" UNION ".join(op_branches)}
+          LIMIT 1
+        ),
+        asign AS (
+          SELECT ap.patrulla_id
+            FROM asignacion_patrulla ap
+            JOIN op ON op.id = ap.operador_id
+           WHERE {" OR ".join(vigente)}
+           ORDER BY {", ".join(order)}
+           LIMIT 1
+        )
+        SELECT p.id, p.alias, p.codigo
+          FROM patrulla p
+          JOIN asign a ON a.patrulla_id = p.id
+         LIMIT 1
+        """
+    )
+
+
+def _resolver_statements(engine) -> tuple[TextClause | None, TextClause | None]:
+    """(sql tabla nueva | None, sql legacy | None) para la versión vigente del esquema."""
+    global _resolver_sql
+    caps = get_capabilities(engine)
+    version, upa_sql, legacy_sql = _resolver_sql
+    if version != caps.version:
+        upa_sql = _SQL_UPA if caps.has_table("user_patrulla_asignacion") and caps.has_table("patrulla") else None
+        legacy_sql = _build_legacy_resolver_sql(caps)
+        _resolver_sql = (caps.version, upa_sql, legacy_sql)
+    return upa_sql, legacy_sql
 
 
 def _auto_nombre_from_patrulla(patrulla_id) -> str | None:
@@ -65,6 +209,14 @@ def _auto_nombre_from_patrulla(patrulla_id) -> str | None:
         return None
 
 
+def _default_nombre(patrulla_id, pinfo: dict | None) -> str:
+    """Nombre para pings que no lo traen: alias/código de la patrulla o 'Patrulla <id>'."""
+    if pinfo and (pinfo.get("alias") or pinfo.get("codigo")):
+        return pinfo.get("alias") or pinfo.get("codigo")
+    auto = _auto_nombre_from_patrulla(patrulla_id)
+    return auto or f"Patrulla {patrulla_id}"
+
+
 # ---------- Resolver principal: patrulla activa para el usuario del JWT ----------
 def _resolve_patrulla_for_user() -> tuple[int | None, dict | None]:
     """
@@ -74,7 +226,8 @@ def _resolve_patrulla_for_user() -> tuple[int | None, dict | None]:
       1) NUEVO: user_patrulla_asignacion (ended_at IS NULL) por user_id.
       2) Fallback: operador/asignacion_patrulla (activo=true o ventana inicio/fin).
 
-    Si nada aplica, retorna (None, None).
+    Si nada aplica, retorna (None, None). El resultado se cachea por usuario
+    (ver app/services/asignacion_cache.py).
     """
     engine = current_app.extensions.get("db_engine")
     if engine is None:
@@ -91,102 +244,45 @@ def _resolve_patrulla_for_user() -> tuple[int | None, dict | None]:
     if uid_int is None and not email:
         return None, None
 
+    # Caché por usuario (se invalida en /api/asignaciones/start y /end)
+    key = asignacion_cache.key(uid_int, email)
+    cached = asignacion_cache.get(key)
+    if not is_miss(cached):
+        return cached
+
+    result = _query_patrulla_for_user(engine, uid_int, email)
+    asignacion_cache.set(key, result)
+    return result
+
+
+def _query_patrulla_for_user(engine, uid_int: int | None, email: str) -> tuple[int | None, dict | None]:
+    """Consulta real de la asignación activa (sin caché), con el SQL precompilado para el esquema."""
+    try:
+        upa_sql, legacy_sql = _resolver_statements(engine)
+    except Exception:
+        return None, None
+
     with engine.connect() as conn:
         # 1) Preferir la tabla nueva si existe
-        try:
-            if uid_int is not None and _table_exists(conn, "user_patrulla_asignacion"):
-                row = conn.execute(
-                    text(
-                        """
-                        SELECT p.id, p.alias, p.codigo
-                          FROM user_patrulla_asignacion a
-                          JOIN patrulla p ON p.id = a.patrulla_id
-                         WHERE a.user_id = :uid AND a.ended_at IS NULL
-                         ORDER BY a.started_at DESC
-                         LIMIT 1
-                        """
-                    ),
-                    {"uid": uid_int},
-                ).fetchone()
+        if uid_int is not None and upa_sql is not None:
+            try:
+                row = conn.execute(upa_sql, {"uid": uid_int}).fetchone()
                 if row:
                     pid, alias, codigo = row[0], row[1], row[2]
                     return pid, {"id": pid, "alias": alias, "codigo": codigo}
-        except Exception:
-            # No interrumpir el flujo: caer al fallback
-            pass
+            except Exception:
+                # No interrumpir el flujo: caer al fallback
+                conn.rollback()
 
         # 2) Fallback de compatibilidad: operador/asignacion_patrulla si existen
-        try:
-            if _table_exists(conn, "operador") and _table_exists(conn, "asignacion_patrulla"):
-                row = conn.execute(
-                    text(
-                        """
-                        WITH op AS (
-                          SELECT o.id
-                          FROM operador o
-                          WHERE (:email <> '' AND LOWER(o.email) = :email)
-                          UNION
-                          SELECT o2.id
-                          FROM operador o2
-                          WHERE (:uid::bigint IS NOT NULL)
-                            AND EXISTS (
-                              SELECT 1 FROM pg_catalog.pg_attribute
-                              WHERE attrelid = 'operador'::regclass
-                                AND attname = 'user_id'
-                                AND NOT attisdropped
-                            )
-                            AND o2.user_id = :uid::bigint
-                          LIMIT 1
-                        ),
-                        asign AS (
-                          SELECT ap.patrulla_id
-                          FROM asignacion_patrulla ap
-                          JOIN op ON op.id = ap.operador_id
-                          WHERE
-                            (
-                              EXISTS (
-                                SELECT 1 FROM pg_catalog.pg_attribute
-                                WHERE attrelid = 'asignacion_patrulla'::regclass
-                                  AND attname = 'activo'
-                                  AND NOT attisdropped
-                              ) AND ap.activo = TRUE
-                            )
-                            OR
-                            (
-                              EXISTS (
-                                SELECT 1 FROM pg_catalog.pg_attribute
-                                WHERE attrelid = 'asignacion_patrulla'::regclass
-                                  AND attname = 'inicio'
-                                  AND NOT attisdropped
-                              )
-                              AND ap.inicio <= NOW()
-                              AND (
-                                NOT EXISTS (
-                                  SELECT 1 FROM pg_catalog.pg_attribute
-                                  WHERE attrelid = 'asignacion_patrulla'::regclass
-                                    AND attname = 'fin'
-                                    AND NOT attisdropped
-                                )
-                                OR ap.fin IS NULL
-                                OR ap.fin >= NOW()
-                              )
-                            )
-                          ORDER BY ap.inicio DESC NULLS LAST, ap.id DESC
-                          LIMIT 1
-                        )
-                        SELECT p.id, p.alias, p.codigo
-                        FROM patrulla p
-                        JOIN asign a ON a.patrulla_id = p.id
-                        LIMIT 1
-                        """
-                    ),
-                    {"email": email, "uid": uid_int},
-                ).fetchone()
+        if legacy_sql is not None:
+            try:
+                row = conn.execute(legacy_sql, {"email": email, "uid": uid_int}).fetchone()
                 if row:
                     pid, alias, codigo = row[0], row[1], row[2]
                     return pid, {"id": pid, "alias": alias, "codigo": codigo}
-        except Exception:
-            pass
+            except Exception:
+                pass
 
     return None, None
 
@@ -224,25 +320,93 @@ def crear_ubicacion():
     # 3) 'nombre' opcional con autocompletado por alias/código
     nombre = (data.get("nombre") or "").strip()
     if not nombre:
-        if pinfo and (pinfo.get("alias") or pinfo.get("codigo")):
-            data["nombre"] = pinfo.get("alias") or pinfo.get("codigo")
-        else:
-            auto = _auto_nombre_from_patrulla(patrulla_id)
-            data["nombre"] = auto or f"Patrulla {patrulla_id}"
+        data["nombre"] = _default_nombre(patrulla_id, pinfo)
 
     try:
         row = get_ctrl().crear(data)
-        return jsonify(row), 201
+        # write-behind activo: aceptado, se persiste en el próximo micro-lote
+        return jsonify(row), (202 if row.get("queued") else 201)
     except ValueError as ve:
         return jsonify({"ok": False, "msg": str(ve)}), 400
+    except BufferFullError as be:
+        resp = jsonify({"ok": False, "msg": str(be)})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al crear: {e}"}), 500
 
 
+# -------------------------
+# Crear en lote (PROTEGIDO)
+# -------------------------
+@ubic_bp.post("/batch")
+@jwt_required()
+def crear_ubicaciones_batch():
+    """
+    Carga muchos pings de una unidad (p.ej. los acumulados sin señal).
+
+    Body: { items: [{lat, lng, activo?, nombre?, ts?}, ...], patrulla_id? }
+          (también se acepta directamente la lista de items)
+    Respuesta: { ok, accepted, rejected, results: [{index, ok, msg?}] }
+    La patrulla se resuelve una sola vez para todo el lote.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, list):
+        body = {"items": body}
+    body = body or {}
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"ok": False, "msg": "items debe ser una lista no vacía"}), 400
+
+    resolved_pid, pinfo = _resolve_patrulla_for_user()
+    patrulla_id = resolved_pid or body.get("patrulla_id")
+    if not patrulla_id:
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "msg": (
+                        "No se pudo resolver una patrulla activa para el usuario y tampoco recibimos patrulla_id. "
+                        "Abre una asignación en /api/asignaciones/start o envía patrulla_id para pruebas."
+                    ),
+                }
+            ),
+            422,
+        )
+
+    try:
+        res = get_ctrl().crear_batch(
+            items, nombre=_default_nombre(patrulla_id, pinfo), patrulla_id=patrulla_id
+        )
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al crear lote: {e}"}), 500
+
+    status = 201 if res["accepted"] else 400
+    return jsonify({"ok": res["accepted"] > 0, **res}), status
+
+
 # -------------------------
 # Listar: por bbox o paginado (PÚBLICO por ahora)
+# Paginado: ?after=<next> (keyset, costo fijo) o ?page= (OFFSET, compat);
+# ?count=estimate (defecto) | exact | none
 # -------------------------
+def _total_estimado() -> bool:
+    """
+    count=estimate sale de EXPLAIN (estadísticas del planner): puede cambiar
+    sin que se mueva el watermark, así que no va bajo un ETag fuerte.
+    """
+    if request.args.get("bbox"):
+        return False
+    try:
+        return count_mode(request.args.get("count"), "estimate") == "estimate"
+    except ValueError:
+        return False  # la vista responde 400
+
+
 @ubic_bp.get("")
+@_conditional(unless=_total_estimado)
 def listar_ubicaciones():
     bbox = request.args.get("bbox")
     if bbox:
@@ -259,12 +423,67 @@ def listar_ubicaciones():
         return jsonify({"ok": False, "msg": "page/size inválidos"}), 400
 
     try:
-        data = get_ctrl().listar(page=page, size=size)
+        data = get_ctrl().listar(
+            page=page,
+            size=size,
+            after=request.args.get("after") or None,
+            count=request.args.get("count") or None,
+        )
         return jsonify(data), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error al listar: {e}"}), 500
 
 
+# -------------------------
+# Posición vigente por patrulla (PÚBLICO por ahora)
+# -------------------------
+@ubic_bp.get("/actuales")
+@_conditional
+def listar_actuales():
+    """Una fila por patrulla (última posición conocida), para mapa y dashboard."""
+    try:
+        items = get_ctrl().actuales()
+        return jsonify({"items": items, "total": len(items)}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al listar actuales: {e}"}), 500
+
+
+# -------------------------
+# Unidades más cercanas a un punto (PÚBLICO por ahora)
+# -------------------------
+@ubic_bp.get("/nearest")
+def nearest():
+    """
+    Query: lat, lng (requeridos), k (def 5, máx 100), max_km (opcional),
+           activo=true|false (opcional).
+    Respuesta: { items: [{...posición vigente, distance_m}], total } ordenado por distancia.
+    """
+    activo = request.args.get("activo")
+    if activo not in (None, ""):
+        activo = activo.strip().lower()
+        if activo not in ("true", "false", "1", "0"):
+            return jsonify({"ok": False, "msg": "activo debe ser true|false"}), 400
+        activo = activo in ("true", "1")
+    else:
+        activo = None
+
+    try:
+        items = get_ctrl().nearest(
+            request.args.get("lat"),
+            request.args.get("lng"),
+            k=request.args.get("k"),
+            max_km=request.args.get("max_km"),
+            activo=activo,
+        )
+        return jsonify({"items": items, "total": len(items)}), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error en nearest: {e}"}), 500
+
+
 # -------------------------
 # Obtener uno (PÚBLICO por ahora)
 # -------------------------
@@ -316,16 +535,27 @@ def eliminar_ubicacion(ubic_id: int):
 # GeoJSON / Geo (PÚBLICO por ahora)
 # -------------------------
 @ubic_bp.get("/geo")
+@_conditional
 def geo_feature_collection():
     """
     Devuelve un FeatureCollection GeoJSON listo para Leaflet/Mapbox.
 
     Soporta query params:
       - limit: int (por defecto 1000)
-      - patrulla_id: int (opcional)
+      - patrulla_id: int (opcional; en vivo o recorrido con desde/hasta)
       - desde/hasta: ISO8601 o 'YYYY-MM-DD HH:MM:SS'
       - bbox: 'minLng,minLat,maxLng,maxLat' (opcional)
+      - near: 'lng,lat' + radius_m: metros (opcional)
+      - polygon: GeoJSON Polygon/MultiPolygon (opcional, requiere PostGIS)
+      - cluster=true + zoom=N: agrupa puntos para ese zoom; los grupos traen
+        properties {cluster: true, cluster_id, point_count, activos}
+      - stream=true: respuesta por partes desde un cursor del servidor, sin el
+        tope de 5000 (limit opcional; sin limit, toda la ventana en orden)
+      - since=<cursor>: sólo lo que cambió en el mapa en vivo desde el cursor
+        (since=0: todo). Además de features trae deleted [patrulla_id],
+        cursor (para el próximo pedido) y reset. Admite bbox y patrulla_id.
     """
+    stream = (request.args.get("stream") or "").lower() in ("1", "true", "yes")
     # --- limit robusto
     try:
         limit = int(request.args.get("limit", 1000))
@@ -353,6 +583,42 @@ def geo_feature_collection():
         if all(v is not None for v in (min_lng, min_lat, max_lng, max_lat)):
             bbox = f"{min_lng},{min_lat},{max_lng},{max_lat}"
 
+    since = request.args.get("since")
+    if since is not None:
+        if stream or desde or hasta or request.args.get("near") or request.args.get("polygon") \
+                or (request.args.get("cluster") or "").lower() in ("1", "true", "yes"):
+            return jsonify({
+                "ok": False,
+                "msg": "since sólo admite bbox y patrulla_id (mapa en vivo)",
+            }), 400
+        try:
+            delta = get_ctrl().feature_delta(since=since, bbox=bbox, patrulla_id=patrulla_id)
+            return jsonify(delta), 200
+        except ValueError as ve:
+            return jsonify({"ok": False, "msg": str(ve)}), 400
+        except Exception as e:
+            return jsonify({"ok": False, "msg": f"error en geo (delta): {e}"}), 500
+
+    if stream:
+        try:
+            chunks = get_ctrl().feature_stream(
+                patrulla_id=patrulla_id,
+                desde=desde,
+                hasta=hasta,
+                limit=request.args.get("limit") or None,
+                bbox=bbox,
+                near=request.args.get("near") or None,
+                radius_m=request.args.get("radius_m") or None,
+                polygon=request.args.get("polygon") or None,
+            )
+        except ValueError as ve:
+            return jsonify({"ok": False, "msg": str(ve)}), 400
+        except Exception as e:
+            return jsonify({"ok": False, "msg": f"error en geo: {e}"}), 500
+        resp = Response(chunks, status=200, mimetype="application/geo+json")
+        resp.headers["X-Accel-Buffering"] = "no"  # que un proxy no acumule la respuesta
+        return resp
+
     try:
         fc = get_ctrl().feature_collection(
             patrulla_id=patrulla_id,
@@ -360,16 +626,194 @@ def geo_feature_collection():
             hasta=hasta,
             limit=limit,
             bbox=bbox,
+            near=request.args.get("near") or None,
+            radius_m=request.args.get("radius_m") or None,
+            polygon=request.args.get("polygon") or None,
+            cluster=(request.args.get("cluster") or "").lower() in ("1", "true", "yes"),
+            zoom=request.args.get("zoom"),
         )
         return jsonify(fc), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
     except Exception as e:
         return jsonify({"ok": False, "msg": f"error en geo: {e}"}), 500
 
 
+# -------------------------
+# Push del mapa en vivo por SSE (PÚBLICO por ahora, igual que /geo)
+# -------------------------
+@ubic_bp.get("/stream")
+def position_stream():
+    """
+    text/event-stream con los cambios de posición (reemplaza el polling de
+    /actuales). Eventos 'snapshot' (flota completa) y 'positions' (delta), con
+    el cuerpo de /geo?since=. Query params opcionales: bbox, patrulla_id.
+    Para retomar: header Last-Event-ID (EventSource lo manda solo al
+    reconectar) o ?last_event_id=.
+    """
+    patrulla_id = request.args.get("patrulla_id")
+    try:
+        patrulla_id = int(patrulla_id) if patrulla_id not in (None, "") else None
+    except Exception:
+        return jsonify({"ok": False, "msg": "patrulla_id inválido"}), 400
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        chunks = get_ctrl().position_stream(
+            last_event_id=last_event_id,
+            bbox=request.args.get("bbox") or None,
+            patrulla_id=patrulla_id,
+            dumps=current_app.json.dumps,
+        )
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except StreamBusyError as be:
+        resp = jsonify({"ok": False, "msg": str(be)})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error en stream: {e}"}), 500
+    resp = Response(chunks, status=200, mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # que un proxy no acumule los eventos
+    return resp
+
+
+# -------------------------
+# Teselas vectoriales MVT (PÚBLICO por ahora, igual que /geo)
+# -------------------------
+@ubic_bp.get("/tiles/<int:z>/<int:x>/<int:y>.mvt")
+def vector_tile(z: int, x: int, y: int):
+    """
+    Tesela Mapbox Vector Tile (application/vnd.mapbox-vector-tile).
+
+    Query params:
+      - capas: 'posiciones' (def), 'historial' o 'posiciones,historial'
+      - patrulla_id: int (opcional)
+      - desde/hasta: ventana del historial (requerida para 'historial')
+
+    Por debajo de UBIC_TILE_FULL_ZOOM los puntos se ralean por celda y traen
+    la propiedad n (cuántos agrupa). Tesela sin datos = cuerpo vacío.
+    """
+    patrulla_id = request.args.get("patrulla_id")
+    try:
+        patrulla_id = int(patrulla_id) if patrulla_id not in (None, "") else None
+    except Exception:
+        return jsonify({"ok": False, "msg": "patrulla_id inválido"}), 400
+
+    try:
+        data, ttl = get_ctrl().tile(
+            z, x, y,
+            capas=request.args.get("capas") or None,
+            patrulla_id=patrulla_id,
+            desde=request.args.get("desde") or None,
+            hasta=request.args.get("hasta") or None,
+        )
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error en tiles: {e}"}), 500
+
+    resp = Response(data, status=200, mimetype="application/vnd.mapbox-vector-tile")
+    resp.headers["Cache-Control"] = f"public, max-age={int(ttl)}"
+    return resp
+
+
+# -------------------------
+# Recorrido simplificado (PÚBLICO por ahora, igual que /geo)
+# -------------------------
+@ubic_bp.get("/track")
+def track():
+    """
+    Recorrido de una patrulla como GeoJSON Feature (LineString, o
+    MultiLineString si hay huecos sin pings), simplificado con
+    Douglas–Peucker a la tolerancia del zoom pedido.
+
+    Query params:
+      - asignacion_id: turno (ventana started_at..ended_at), o bien
+      - patrulla_id + desde (+ hasta, def. ahora)
+      - zoom: 0..22 (opcional; sin zoom se devuelven todos los vértices)
+
+    properties.times trae el epoch (s) de cada vértice para reproducción.
+    """
+    ids = {}
+    for name in ("patrulla_id", "asignacion_id"):
+        val = request.args.get(name)
+        try:
+            ids[name] = int(val) if val not in (None, "") else None
+        except Exception:
+            return jsonify({"ok": False, "msg": f"{name} inválido"}), 400
+
+    try:
+        feature = get_ctrl().track(
+            **ids,
+            desde=request.args.get("desde") or None,
+            hasta=request.args.get("hasta") or None,
+            zoom=request.args.get("zoom"),
+        )
+        if feature is None:
+            return jsonify({"ok": False, "msg": "asignación no encontrada"}), 404
+        return jsonify(feature), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error en track: {e}"}), 500
+
+
+# -------------------------
+# Mapa de calor (PÚBLICO por ahora, igual que /geo)
+# -------------------------
+@ubic_bp.get("/heatmap")
+def heatmap():
+    """
+    Densidad de pings por celda (agregado en SQL, sin traer filas crudas).
+
+    Query params:
+      - bbox: 'minLng,minLat,maxLng,maxLat' (requerido)
+      - desde/hasta: ventana del historial (requeridos)
+      - cell_m: lado de la celda en metros (def 250, mín 10)
+      - patrulla_id: int (opcional)
+      - formato: 'matrix' (def, celdas [col, fila, n]) o 'geojson'
+    """
+    patrulla_id = request.args.get("patrulla_id")
+    try:
+        patrulla_id = int(patrulla_id) if patrulla_id not in (None, "") else None
+    except Exception:
+        return jsonify({"ok": False, "msg": "patrulla_id inválido"}), 400
+
+    try:
+        data = get_ctrl().heatmap(
+            bbox=request.args.get("bbox"),
+            desde=request.args.get("desde") or None,
+            hasta=request.args.get("hasta") or None,
+            cell_m=request.args.get("cell_m"),
+            patrulla_id=patrulla_id,
+            formato=(request.args.get("formato") or "matrix").lower(),
+        )
+        return jsonify(data), 200
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error en heatmap: {e}"}), 500
+
+
+# -------------------------
+# Métricas de ingesta write-behind (PÚBLICO por ahora)
+# -------------------------
+@ubic_bp.get("/ingest/stats")
+def ingest_stats():
+    """
+    queue_depth, flushes, last/avg/max_flush_ms, flushed/dropped_rows,
+    rejected_full; notify: estado del LISTEN (connected, received, reconnects).
+    """
+    return jsonify(get_ctrl().ingest_stats()), 200
+
+
 # -------------------------
 # Summary (PÚBLICO por ahora)
 # -------------------------
 @ubic_bp.get("/summary")
+@_conditional
 def summary():
     try:
         return jsonify(get_ctrl().summary()), 200
@@ -106,22 +106,25 @@ def _inject_roles(u: Dict[str, Any]) -> Dict[str, Any]:
       - roles: List[str]
       - role: str | None (primer rol, compat)
       - role_display: str | None (roles unidos por coma)
-    Si el servicio ya trae roles, se respetan; si no, se consultan.
+    Si el servicio ya trae roles (aunque sea lista vacía), se respetan; si no
+    trae la clave, se consultan. Así el listado no hace una consulta extra por
+    cada usuario sin roles.
     """
     if not isinstance(u, dict):
         return u
 
     user_id = u.get("id") or u.get("user_id") or u.get("_id")
     roles = u.get("roles")
+    svc_has_roles = isinstance(roles, list)
 
     # Si ya trae lista, la normalizamos suave
-    if isinstance(roles, list):
+    if svc_has_roles:
         roles = [str(r).strip().lower() for r in roles if str(r).strip()]
     else:
         roles = []
 
     # Si faltan roles, intentamos consultarlos
-    if not roles and user_id is not None:
+    if not svc_has_roles and user_id is not None:
         try:
             fetched = _user_svc.list_role_codes(int(user_id)) or []
             if isinstance(fetched, list):
@@ -196,6 +199,7 @@ def list_allowed_roles():
 # --------- Rutas CRUD (sólo admin) ----------
 
 # Listado paginado: GET /users?page=1&size=10&q=texto
+#   o ?after=<next> (keyset, sin OFFSET); count=exact|estimate|none
 @users_bp.get("")
 @jwt_required()
 def list_users():
@@ -214,15 +218,30 @@ def list_users():
     size = max(1, min(size, 200))
     q = (request.args.get("q") or "").strip().lower()
 
+    after = request.args.get("after") or None
+    count = request.args.get("count") or None
+
     # Si tu servicio tiene búsqueda/paginado con roles:
     try:
-        data = _user_svc.list_users_with_roles(page=page, size=size, q=q)
+        data = _user_svc.list_users_with_roles(page=page, size=size, q=q, after=after, count=count)
         items = list(data.get("items", []))
         # Enriquecer SIEMPRE
         items = [_inject_roles(dict(it)) for it in items]
-        total = int(data.get("total", len(items)))
-        total_pages = (total + size - 1) // size if size else 1
-        return jsonify({"ok": True, "items": items, "total": total, "page": page, "size": size, "total_pages": total_pages}), 200
+        total = data.get("total", len(items))
+        total_pages = (int(total) + size - 1) // size if total is not None and size else None
+        return jsonify({
+            "ok": True,
+            "items": items,
+            "total": total,
+            "count": data.get("count"),
+            "page": data.get("page", page),
+            "size": size,
+            "total_pages": total_pages,
+            "next": data.get("next"),
+        }), 200
+
+    except ValueError as ve:
+        return jsonify({"ok": False, "msg": str(ve)}), 400
 
     except TypeError:
         # fallback si list_users_with_roles no acepta q
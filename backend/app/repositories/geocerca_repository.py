@@ -0,0 +1,240 @@
+# backend/app/repositories/geocerca_repository.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+
+from app.core.db.pool import get_pool
+
+# (patrulla_id, ts, lat, lng, ubicacion_id, geocercas que contienen el punto)
+Evaluacion = Tuple[int, datetime, float, float, Optional[int], FrozenSet[int]]
+
+
+class GeocercaRepository:
+    """
+    Geocercas (polígonos GeoJSON en lng/lat), estado dentro/fuera por
+    patrulla y eventos enter/exit. SQL directo sobre el pool psycopg.
+    """
+
+    _COLS = "id, nombre, geojson, patrulla_id, activo, min_lng, min_lat, max_lng, max_lat, created_at, updated_at"
+
+    def __init__(self, pool: Optional[ConnectionPool] = None) -> None:
+        self._pool = pool
+
+    def _conn(self):
+        return (self._pool or get_pool()).connection()
+
+    # --- esquema ---
+    def ensure_schema(self) -> None:
+        ddl = [
+            """
+            CREATE TABLE IF NOT EXISTS public.geocerca (
+              id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+              nombre TEXT NOT NULL,
+              geojson JSONB NOT NULL,            -- Polygon | MultiPolygon
+              patrulla_id BIGINT,                -- sector asignado; NULL = aplica a todas
+              activo BOOLEAN NOT NULL DEFAULT TRUE,
+              min_lng DOUBLE PRECISION NOT NULL, -- bbox precalculado
+              min_lat DOUBLE PRECISION NOT NULL,
+              max_lng DOUBLE PRECISION NOT NULL,
+              max_lat DOUBLE PRECISION NOT NULL,
+              created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+              updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            # último estado conocido de cada patrulla respecto de cada geocerca
+            """
+            CREATE TABLE IF NOT EXISTS public.geocerca_estado (
+              patrulla_id BIGINT NOT NULL,
+              geocerca_id BIGINT NOT NULL REFERENCES public.geocerca(id) ON DELETE CASCADE,
+              dentro BOOLEAN NOT NULL,
+              updated_at TIMESTAMPTZ NOT NULL,
+              PRIMARY KEY (patrulla_id, geocerca_id)
+            )
+            """,
+            # eventos: sin FK para que sobrevivan al borrado de la geocerca (auditoría)
+            """
+            CREATE TABLE IF NOT EXISTS public.geocerca_evento (
+              id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+              geocerca_id BIGINT NOT NULL,
+              patrulla_id BIGINT NOT NULL,
+              tipo TEXT NOT NULL CHECK (tipo IN ('enter', 'exit')),
+              lat DOUBLE PRECISION NOT NULL,
+              lng DOUBLE PRECISION NOT NULL,
+              ubicacion_id BIGINT,
+              ocurrido_at TIMESTAMPTZ NOT NULL,
+              created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_geocerca_evento_patrulla ON public.geocerca_evento(patrulla_id, ocurrido_at)",
+            "CREATE INDEX IF NOT EXISTS idx_geocerca_evento_geocerca ON public.geocerca_evento(geocerca_id, ocurrido_at)",
+        ]
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                for sql in ddl:
+                    cur.execute(sql)
+            conn.commit()
+
+    # --- CRUD ---
+    def listar(self, solo_activas: bool = False) -> List[Dict[str, Any]]:
+        where = "WHERE activo" if solo_activas else ""
+        sql = f"SELECT {self._COLS} FROM public.geocerca {where} ORDER BY id"
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql)
+            return [dict(r) for r in cur.fetchall()]
+
+    def obtener(self, gid: int) -> Optional[Dict[str, Any]]:
+        sql = f"SELECT {self._COLS} FROM public.geocerca WHERE id=%s"
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, (gid,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+    def crear(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        sql = f"""
+        INSERT INTO public.geocerca (nombre, geojson, patrulla_id, activo, min_lng, min_lat, max_lng, max_lat)
+        VALUES (%(nombre)s, %(geojson)s, %(patrulla_id)s, %(activo)s,
+                %(min_lng)s, %(min_lat)s, %(max_lng)s, %(max_lat)s)
+        RETURNING {self._COLS}
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, {**data, "geojson": Jsonb(data["geojson"])})
+            row = cur.fetchone()
+            conn.commit()
+            return dict(row)
+
+    def actualizar(self, gid: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        sets, params = [], []
+        for col in ("nombre", "geojson", "patrulla_id", "activo", "min_lng", "min_lat", "max_lng", "max_lat"):
+            if col in data:
+                sets.append(f"{col}=%s")
+                params.append(Jsonb(data[col]) if col == "geojson" else data[col])
+        if not sets:
+            return self.obtener(gid)
+        params.append(gid)
+        sql = f"""
+        UPDATE public.geocerca SET {', '.join(sets)}, updated_at=NOW()
+        WHERE id=%s
+        RETURNING {self._COLS}
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, tuple(params))
+            row = cur.fetchone()
+            conn.commit()
+            return dict(row) if row else None
+
+    def eliminar(self, gid: int) -> bool:
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM public.geocerca WHERE id=%s", (gid,))
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted > 0
+
+    def version(self) -> Tuple[int, Optional[datetime]]:
+        """(cantidad, último updated_at): cambia con cualquier alta/edición/borrado."""
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*), MAX(updated_at) FROM public.geocerca")
+            n, ts = cur.fetchone()
+            return int(n), ts
+
+    # --- eventos ---
+    def eventos(
+        self,
+        *,
+        patrulla_id: Optional[int] = None,
+        geocerca_id: Optional[int] = None,
+        desde: Optional[datetime] = None,
+        limit: int = 200,
+    ) -> List[Dict[str, Any]]:
+        conds, params = [], []
+        if patrulla_id is not None:
+            conds.append("patrulla_id = %s")
+            params.append(patrulla_id)
+        if geocerca_id is not None:
+            conds.append("geocerca_id = %s")
+            params.append(geocerca_id)
+        if desde is not None:
+            conds.append("ocurrido_at >= %s")
+            params.append(desde)
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        params.append(max(1, min(int(limit), 1000)))
+        sql = f"""
+        SELECT id, geocerca_id, patrulla_id, tipo, lat, lng, ubicacion_id, ocurrido_at
+        FROM public.geocerca_evento
+        {where}
+        ORDER BY ocurrido_at DESC, id DESC
+        LIMIT %s
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, tuple(params))
+            return [dict(r) for r in cur.fetchall()]
+
+    def registrar_transiciones(self, evaluaciones: Sequence[Evaluacion]) -> List[Dict[str, Any]]:
+        """
+        Compara cada ping evaluado con el estado guardado de su patrulla y
+        persiste los cambios (estado + eventos enter/exit) en una transacción.
+        Un advisory lock por patrulla serializa a los workers que procesan
+        pings de la misma unidad; los pings más viejos que el estado se ignoran.
+        Devuelve los eventos emitidos.
+        """
+        if not evaluaciones:
+            return []
+        pids = sorted({e[0] for e in evaluaciones})
+        eventos: List[Dict[str, Any]] = []
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT pg_advisory_xact_lock(hashtextextended('geocerca:' || s.pid, 0))
+                  FROM (SELECT pid FROM unnest(%s::bigint[]) AS pid ORDER BY pid) s
+                """,
+                (pids,),
+            )
+            cur.execute(
+                "SELECT patrulla_id, geocerca_id, dentro, updated_at "
+                "FROM public.geocerca_estado WHERE patrulla_id = ANY(%s)",
+                (pids,),
+            )
+            estado: Dict[Tuple[int, int], Tuple[bool, datetime]] = {
+                (p, g): (d, ts) for p, g, d, ts in cur.fetchall()
+            }
+
+            cambios: Dict[Tuple[int, int], Tuple[bool, datetime]] = {}
+            for pid, ts, lat, lng, ubic_id, dentro_de in sorted(evaluaciones, key=lambda e: e[1]):
+                previas = {g for (p, g), (d, _) in estado.items() if p == pid and d}
+                for gid, tipo in [(g, "enter") for g in dentro_de - previas] + \
+                                 [(g, "exit") for g in previas - dentro_de]:
+                    prev = estado.get((pid, gid))
+                    if prev is not None and prev[1] > ts:
+                        continue  # ping atrasado: no revierte un estado más nuevo
+                    estado[(pid, gid)] = cambios[(pid, gid)] = (tipo == "enter", ts)
+                    eventos.append({
+                        "geocerca_id": gid, "patrulla_id": pid, "tipo": tipo,
+                        "lat": lat, "lng": lng, "ubicacion_id": ubic_id, "ocurrido_at": ts,
+                    })
+
+            if cambios:
+                cur.executemany(
+                    """
+                    INSERT INTO public.geocerca_estado (patrulla_id, geocerca_id, dentro, updated_at)
+                    SELECT %s, %s, %s, %s
+                     WHERE EXISTS (SELECT 1 FROM public.geocerca WHERE id = %s)
+                    ON CONFLICT (patrulla_id, geocerca_id)
+                    DO UPDATE SET dentro = EXCLUDED.dentro, updated_at = EXCLUDED.updated_at
+                    """,
+                    [(p, g, d, ts, g) for (p, g), (d, ts) in cambios.items()],
+                )
+                cur.executemany(
+                    """
+                    INSERT INTO public.geocerca_evento
+                           (geocerca_id, patrulla_id, tipo, lat, lng, ubicacion_id, ocurrido_at)
+                    VALUES (%(geocerca_id)s, %(patrulla_id)s, %(tipo)s, %(lat)s, %(lng)s,
+                            %(ubicacion_id)s, %(ocurrido_at)s)
+                    """,
+                    eventos,
+                )
+            conn.commit()
+        return eventos
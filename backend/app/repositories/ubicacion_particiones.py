@@ -0,0 +1,291 @@
+# backend/app/repositories/ubicacion_particiones.py
+"""
+Particionado por tiempo del historial public.ubicaciones.
+
+Layout:
+  - public.ubicaciones        PARTITION BY RANGE (updated_at), PK (id, updated_at)
+  - ubicaciones_pYYYYMMDD     una partición por día o semana (UTC), creadas por adelantado
+  - ubicaciones_default       pings fuera de rango (p.ej. lotes con ts viejo); al crear
+                              una partición se mueven a ella las filas que le tocan
+  - ubicaciones_legacy        tabla sin particionar migrada (opcional), adjunta como
+                              partición FROM (MINVALUE) TO (<inicio del primer periodo>)
+
+Índices: BRIN sobre updated_at (escaneos por rango casi gratis de mantener),
+(patrulla_id, updated_at) para el recorrido de una unidad y, para bbox en
+ventanas históricas, (lng, lat) o el GiST sobre geom si UBIC_POSTGIS. El "dónde está cada unidad ahora"
+sale de public.patrulla_posicion_actual, no de aquí.
+
+Retención: las particiones cuyo límite superior quedó fuera de la ventana
+(UBIC_RETENTION_DAYS) se eliminan (DROP) o se desadjuntan (DETACH, quedan como
+tablas sueltas para archivar).
+
+Todo el mantenimiento corre bajo un advisory lock: con varios workers sólo uno
+hace DDL a la vez.
+"""
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg import sql
+from psycopg_pool import ConnectionPool
+
+from app.config.settings import Settings
+from app.core.db.pool import get_pool
+from app.services.ubicacion_eventos import EDICION, notify
+
+# clave arbitraria para pg_advisory_xact_lock (DDL del historial de ubicaciones)
+_LOCK_KEY = 7_140_001
+
+INTERVALOS = {"day": timedelta(days=1), "week": timedelta(days=7)}
+
+_DDL_PARENT = """
+CREATE TABLE IF NOT EXISTS public.ubicaciones (
+  id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+  nombre TEXT NOT NULL,
+  lat DOUBLE PRECISION NOT NULL,
+  lng DOUBLE PRECISION NOT NULL,
+  activo BOOLEAN NOT NULL DEFAULT TRUE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  patrulla_id BIGINT,
+  PRIMARY KEY (id, updated_at)
+) PARTITION BY RANGE (updated_at)
+"""
+_DDL_DEFAULT = "CREATE TABLE IF NOT EXISTS public.ubicaciones_default PARTITION OF public.ubicaciones DEFAULT"
+_DDL_IDX_BRIN = "CREATE INDEX IF NOT EXISTS idx_ubicaciones_updated_brin ON public.ubicaciones USING brin (updated_at)"
+# sin PostGIS el bbox histórico usa este B-tree; con PostGIS lo reemplaza el GiST sobre geom
+_DDL_IDX_LNG_LAT = "CREATE INDEX IF NOT EXISTS idx_ubicaciones_lng_lat ON public.ubicaciones(lng, lat)"
+# columnas "reales" (sin las generadas, p.ej. geom) para mover filas entre particiones
+_COLS = "id, nombre, lat, lng, activo, created_at, updated_at, patrulla_id"
+# índices de la tabla sin particionar; se quitan al migrarla
+_LEGACY_IDX = (
+    "idx_ubicaciones_activo",
+    "idx_ubicaciones_lat",
+    "idx_ubicaciones_lng",
+    "idx_ubicaciones_updated_at",
+    "idx_ubicaciones_lng_lat",
+)
+
+_SQL_RELKIND = """
+SELECT c.relkind
+  FROM pg_catalog.pg_class c
+  JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+ WHERE n.nspname = 'public' AND c.relname = 'ubicaciones'
+"""
+_SQL_PARTICIONES = """
+SELECT c.relname, pg_catalog.pg_get_expr(c.relpartbound, c.oid)
+  FROM pg_catalog.pg_inherits i
+  JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid
+ WHERE i.inhparent = 'public.ubicaciones'::regclass
+"""
+# contador de ediciones del historial (watermark del ETag, ver ubicacion_version.py):
+# borrar o desadjuntar particiones cambia resultados sin tocar MAX(id)/MAX(updated_at)
+DDL_VERSION = """
+CREATE TABLE IF NOT EXISTS public.ubicacion_version (
+  id SMALLINT PRIMARY KEY CHECK (id = 1),
+  ediciones BIGINT NOT NULL DEFAULT 0
+)
+"""
+SQL_VERSION_ROW = "INSERT INTO public.ubicacion_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING"
+SQL_BUMP_EDICIONES = "UPDATE public.ubicacion_version SET ediciones = ediciones + 1 WHERE id = 1"
+_RE_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def inicio_periodo(ts: datetime, intervalo: str) -> datetime:
+    """Inicio (UTC, 00:00) del día o de la semana ISO (lunes) que contiene ts."""
+    d = ts.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if intervalo == "week":
+        d -= timedelta(days=d.weekday())
+    return d
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    """'2026-10-18 00:00:00+00' -> datetime; MINVALUE/MAXVALUE -> None."""
+    value = value.strip()
+    if not value.startswith("'"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+class UbicacionParticiones:
+    """DDL y mantenimiento de las particiones del historial."""
+
+    def __init__(self, pool: Optional[ConnectionPool] = None, cfg=Settings) -> None:
+        self._pool = pool
+        self.intervalo = cfg.UBIC_PARTITION_INTERVAL if cfg.UBIC_PARTITION_INTERVAL in INTERVALOS else "day"
+        self.adelante = max(int(cfg.UBIC_PARTITIONS_AHEAD), 1)
+        self.retencion_dias = max(int(cfg.UBIC_RETENTION_DAYS), 0)
+        self.modo_retencion = "drop" if cfg.UBIC_RETENTION_MODE == "drop" else "detach"
+        self.migrar_legacy = bool(cfg.UBIC_PARTITION_MIGRATE)
+        self.postgis = bool(cfg.UBIC_POSTGIS)
+
+    def _conn(self):
+        return (self._pool or get_pool()).connection()
+
+    # --- esquema ---
+    def ensure(self, cur) -> str:
+        """
+        Crea el padre particionado si no existe (o migra la tabla sin
+        particionar si UBIC_PARTITION_MIGRATE está activo). Corre dentro de la
+        transacción de ensure_schema del repositorio.
+        Devuelve 'partitioned' o 'legacy' (tabla sin particionar que se deja igual).
+        """
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+        cur.execute(_SQL_RELKIND)
+        row = cur.fetchone()
+        relkind = row[0] if row else None
+        if relkind == "r":
+            if not self.migrar_legacy:
+                return "legacy"
+            self._migrar_legacy(cur)
+        elif relkind is None:
+            cur.execute(_DDL_PARENT)
+        cur.execute(_DDL_DEFAULT)
+        cur.execute(_DDL_IDX_BRIN)
+        if not self.postgis:
+            cur.execute(_DDL_IDX_LNG_LAT)
+        return "partitioned"
+
+    def _migrar_legacy(self, cur) -> None:
+        """
+        Convierte la tabla sin particionar en la partición ubicaciones_legacy
+        del nuevo padre. Reescribe índices de la tabla vieja (costoso en tablas
+        grandes: conviene correrlo en una ventana de mantenimiento).
+        """
+        cur.execute("LOCK TABLE public.ubicaciones IN ACCESS EXCLUSIVE MODE")
+        cur.execute("SELECT COALESCE(MAX(id), 0), MAX(updated_at) FROM public.ubicaciones")
+        max_id, max_ts = cur.fetchone()
+        now = datetime.now(timezone.utc)
+        paso = INTERVALOS[self.intervalo]
+        limite = inicio_periodo(now, self.intervalo) + paso
+        if max_ts is not None:
+            limite = max(limite, inicio_periodo(max_ts, self.intervalo) + paso)
+
+        cur.execute("ALTER TABLE public.ubicaciones RENAME TO ubicaciones_legacy")
+        cur.execute("ALTER TABLE public.ubicaciones_legacy ALTER COLUMN id DROP IDENTITY IF EXISTS")
+        cur.execute("ALTER TABLE public.ubicaciones_legacy ALTER COLUMN id DROP DEFAULT")
+        cur.execute("DROP SEQUENCE IF EXISTS public.ubicaciones_id_seq")  # BIGSERIAL antiguo
+        cur.execute("ALTER TABLE public.ubicaciones_legacy DROP CONSTRAINT IF EXISTS ubicaciones_pkey")
+        # ATTACH exige las mismas columnas que el padre
+        cur.execute("ALTER TABLE public.ubicaciones_legacy ADD COLUMN IF NOT EXISTS patrulla_id BIGINT")
+        for idx in _LEGACY_IDX:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier("public", idx)))
+
+        cur.execute(_DDL_PARENT)
+        cur.execute(
+            sql.SQL("ALTER TABLE public.ubicaciones ALTER COLUMN id RESTART WITH {}").format(
+                sql.Literal(int(max_id) + 1)
+            )
+        )
+        cur.execute(
+            sql.SQL(
+                "ALTER TABLE public.ubicaciones ATTACH PARTITION public.ubicaciones_legacy "
+                "FOR VALUES FROM (MINVALUE) TO ({})"
+            ).format(sql.Literal(limite))
+        )
+        print(f"[ubicaciones] historial migrado a particiones (legacy hasta {limite.isoformat()})")
+
+    # --- mantenimiento ---
+    def _particiones(self, cur) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+        """(nombre, desde, hasta) de cada partición con rango; None = MINVALUE/MAXVALUE."""
+        cur.execute(_SQL_PARTICIONES)
+        out = []
+        for relname, bound in cur.fetchall():
+            m = _RE_BOUND.search(bound or "")
+            if m:  # DEFAULT no tiene rango
+                out.append((relname, _parse_bound(m.group(1)), _parse_bound(m.group(2))))
+        return out
+
+    def _crear_particion(self, cur, inicio: datetime, fin: datetime) -> str:
+        nombre = sql.Identifier("public", f"ubicaciones_p{inicio:%Y%m%d}")
+        desde, hasta = sql.Literal(inicio), sql.Literal(fin)
+        cur.execute(
+            "SELECT 1 FROM public.ubicaciones_default WHERE updated_at >= %s AND updated_at < %s LIMIT 1",
+            (inicio, fin),
+        )
+        if cur.fetchone() is None:
+            cur.execute(
+                sql.SQL("CREATE TABLE {} PARTITION OF public.ubicaciones FOR VALUES FROM ({}) TO ({})").format(
+                    nombre, desde, hasta
+                )
+            )
+        else:
+            # hay pings de ese rango en el default: moverlos y adjuntar
+            cur.execute(
+                sql.SQL(
+                    "CREATE TABLE {} (LIKE public.ubicaciones "
+                    "INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+                ).format(nombre)
+            )
+            cur.execute(
+                sql.SQL(
+                    "WITH m AS (DELETE FROM public.ubicaciones_default "
+                    "WHERE updated_at >= {d} AND updated_at < {h} RETURNING {c}) "
+                    "INSERT INTO {n} ({c}) SELECT {c} FROM m"
+                ).format(n=nombre, d=desde, h=hasta, c=sql.SQL(_COLS))
+            )
+            cur.execute(
+                sql.SQL("ALTER TABLE public.ubicaciones ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+                    nombre, desde, hasta
+                )
+            )
+        return f"ubicaciones_p{inicio:%Y%m%d}"
+
+    def mantenimiento(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Crea las particiones del periodo actual + UBIC_PARTITIONS_AHEAD y aplica
+        la retención. Idempotente; seguro con varios workers (advisory lock).
+        """
+        now = now or datetime.now(timezone.utc)
+        paso = INTERVALOS[self.intervalo]
+        res: Dict[str, Any] = {"created": [], "dropped": [], "detached": [], "default_purged": 0}
+
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            cur.execute(_SQL_RELKIND)
+            row = cur.fetchone()
+            if not row or row[0] != "p":
+                conn.rollback()
+                return {**res, "skipped": "ubicaciones no está particionada"}
+
+            existentes = self._particiones(cur)
+
+            def _ocupado(ini: datetime, fin: datetime) -> bool:
+                for _, d, h in existentes:
+                    if (d is None or d < fin) and (h is None or ini < h):
+                        return True
+                return False
+
+            inicio = inicio_periodo(now, self.intervalo)
+            for i in range(self.adelante + 1):
+                ini, fin = inicio + i * paso, inicio + (i + 1) * paso
+                if not _ocupado(ini, fin):
+                    res["created"].append(self._crear_particion(cur, ini, fin))
+                    existentes.append((res["created"][-1], ini, fin))
+
+            if self.retencion_dias:
+                corte = now - timedelta(days=self.retencion_dias)
+                for nombre, _, hasta in existentes:
+                    if hasta is None or hasta > corte:
+                        continue
+                    ident = sql.Identifier("public", nombre)
+                    if self.modo_retencion == "drop":
+                        cur.execute(sql.SQL("DROP TABLE {}").format(ident))
+                        res["dropped"].append(nombre)
+                    else:
+                        cur.execute(sql.SQL("ALTER TABLE public.ubicaciones DETACH PARTITION {}").format(ident))
+                        res["detached"].append(nombre)
+                if self.modo_retencion == "drop":
+                    cur.execute("DELETE FROM public.ubicaciones_default WHERE updated_at < %s", (corte,))
+                    res["default_purged"] = cur.rowcount
+                if res["dropped"] or res["detached"] or res["default_purged"]:
+                    try:
+                        with conn.transaction():  # savepoint: sin la tabla de versión no se aborta la retención
+                            cur.execute(SQL_BUMP_EDICIONES)
+                            notify(cur, EDICION)
+                    except Exception as e:
+                        print(f"[ubicaciones] no se pudo marcar la edición del historial: {e}")
+            conn.commit()
+        return res
@@ -1,81 +1,234 @@
 # backend/app/repositories/ubicacion_repository.py
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
-import psycopg
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from psycopg.rows import dict_row
-from psycopg import conninfo
+from psycopg_pool import ConnectionPool
 
 from app.config.settings import Settings
+from app.core.db.keyset import decode_cursor, explain_sql, next_cursor, plan_rows
+from app.core.db.pool import get_pool
+from app.core.db.schema_caps import current_capabilities
+from app.services.geo_utils import deg_box, haversine_m, haversine_sql
+from app.services.ubicacion_eventos import EDICION, PING, notify, resumen_lote
+from app.services.mvt import tile_size_m
+from app.repositories.ubicacion_particiones import (
+    DDL_VERSION,
+    SQL_BUMP_EDICIONES,
+    SQL_VERSION_ROW,
+    UbicacionParticiones,
+)
 
 
 class UbicacionRepository:
     """
-    Repositorio que maneja su propia conexión psycopg (igual que UserService).
-    Soporta __init__(db=None) para compatibilidad con llamadas antiguas.
+    Repositorio con SQL directo sobre el pool psycopg del proceso
+    (ver app/core/db/pool.py). Soporta __init__(db=None) para compatibilidad
+    con llamadas antiguas; `pool` permite inyectar otro pool (scripts/bench).
     """
 
-    def __init__(self, db: Any = None) -> None:  # db ignorado (compat)
-        # DSN robusto (evita problemas de espacios/símbolos en credenciales)
-        self.dsn = conninfo.make_conninfo(
-            host=Settings.DB_HOST,
-            port=str(Settings.DB_PORT),
-            dbname=Settings.DB_NAME,
-            user=Settings.DB_USER,
-            password=Settings.DB_PASSWORD,
-        )
+    def __init__(self, db: Any = None, pool: Optional[ConnectionPool] = None) -> None:  # db ignorado (compat)
+        self._pool = pool
+
+    def _conn(self):
+        """Conexión prestada del pool; vuelve al pool al salir del `with`."""
+        return (self._pool or get_pool()).connection()
+
+    @staticmethod
+    def postgis_activo() -> bool:
+        """UBIC_POSTGIS pedido y la columna geom existe (según las capacidades detectadas)."""
+        if not Settings.UBIC_POSTGIS:
+            return False
+        caps = current_capabilities()
+        return caps is not None and caps.has_column("patrulla_posicion_actual", "geom")
 
     # --- esquema ---
     def ensure_schema(self) -> None:
         """
-        Crea la tabla e índices si no existen. Evita el choque con sequences
-        usando IDENTITY en lugar de BIGSERIAL (que fue la causa del error
-        'pg_class_relname_nsp_index' por 'ubicaciones_id_seq' duplicada).
+        Crea el historial particionado por tiempo (ver ubicacion_particiones.py),
+        la tabla de posición vigente y las particiones del periodo actual y
+        siguientes. Una tabla sin particionar preexistente se deja tal cual
+        salvo UBIC_PARTITION_MIGRATE=true. IDENTITY en lugar de BIGSERIAL
+        (evita el choque 'pg_class_relname_nsp_index' por la sequence).
         """
-        ddl_table = """
-        CREATE TABLE IF NOT EXISTS public.ubicaciones (
-          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        # Posición vigente: una fila por patrulla, upsert en cada ingesta.
+        # public.ubicaciones queda como historial append-only.
+        ddl_actual_idx = (
+            "CREATE INDEX IF NOT EXISTS idx_posicion_actual_updated_at "
+            "ON public.patrulla_posicion_actual(updated_at)"
+        )
+        ddl_actual = """
+        CREATE TABLE IF NOT EXISTS public.patrulla_posicion_actual (
+          patrulla_id BIGINT PRIMARY KEY,
+          ubicacion_id BIGINT,
           nombre TEXT NOT NULL,
           lat DOUBLE PRECISION NOT NULL,
           lng DOUBLE PRECISION NOT NULL,
           activo BOOLEAN NOT NULL DEFAULT TRUE,
-          created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
           updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
         );
         """
-        ddl_idx = [
-            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_activo ON public.ubicaciones(activo)",
-            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_lat ON public.ubicaciones(lat)",
-            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_lng ON public.ubicaciones(lng)",
-            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_updated_at ON public.ubicaciones(updated_at)",
-            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_lng_lat ON public.ubicaciones(lng, lat)",
+
+        # Delta del mapa en vivo (/geo?since=): cada cambio de la posición
+        # vigente guarda el xid de su transacción y las bajas quedan como
+        # lápidas. bajas_hasta = mayor xid de lápida ya purgada (cursores
+        # anteriores no pueden seguir con delta).
+        ddl_delta = [
+            "ALTER TABLE public.patrulla_posicion_actual "
+            "ADD COLUMN IF NOT EXISTS cambio_xid xid8 NOT NULL DEFAULT pg_current_xact_id()",
+            "CREATE INDEX IF NOT EXISTS idx_posicion_actual_cambio ON public.patrulla_posicion_actual(cambio_xid)",
+            """
+            CREATE TABLE IF NOT EXISTS public.patrulla_posicion_baja (
+              patrulla_id BIGINT PRIMARY KEY,
+              cambio_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+              deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_posicion_baja_cambio ON public.patrulla_posicion_baja(cambio_xid)",
+            "ALTER TABLE public.ubicacion_version ADD COLUMN IF NOT EXISTS bajas_hasta xid8 NOT NULL DEFAULT '0'",
+        ]
+
+        # patrulla_id en el historial (tablas creadas antes no la tenían);
+        # en el padre particionado se propaga a todas las particiones
+        ddl_pid = [
+            "ALTER TABLE public.ubicaciones ADD COLUMN IF NOT EXISTS patrulla_id BIGINT",
+            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_patrulla_ts ON public.ubicaciones(patrulla_id, updated_at)",
         ]
 
-        with psycopg.connect(self.dsn) as conn:
+        # PostGIS opcional: geom generada desde lng/lat (las escrituras no cambian,
+        # COPY incluido) + GiST. En la posición vigente también un GiST sobre
+        # geom::geography para ST_DWithin en metros.
+        geom_col = (
+            "ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326) "
+            "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(lng, lat), 4326)) STORED"
+        )
+        ddl_postgis = [
+            "CREATE EXTENSION IF NOT EXISTS postgis",
+            f"ALTER TABLE public.ubicaciones {geom_col}",
+            "CREATE INDEX IF NOT EXISTS idx_ubicaciones_geom ON public.ubicaciones USING gist (geom)",
+            f"ALTER TABLE public.patrulla_posicion_actual {geom_col}",
+            "CREATE INDEX IF NOT EXISTS idx_posicion_actual_geom ON public.patrulla_posicion_actual USING gist (geom)",
+            "CREATE INDEX IF NOT EXISTS idx_posicion_actual_geog "
+            "ON public.patrulla_posicion_actual USING gist ((geom::geography))",
+        ]
+
+        particiones = UbicacionParticiones(pool=self._pool)
+        with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute(ddl_table)
-                for ddl in ddl_idx:
+                layout = particiones.ensure(cur)
+                for ddl in ddl_pid:
                     cur.execute(ddl)
+                cur.execute(ddl_actual)
+                cur.execute(ddl_actual_idx)
+                cur.execute(DDL_VERSION)
+                cur.execute(SQL_VERSION_ROW)
+                for ddl in ddl_delta:
+                    cur.execute(ddl)
+                if Settings.UBIC_POSTGIS:
+                    try:
+                        with conn.transaction():  # savepoint: sin extensión/permisos se sigue con lat/lng
+                            for ddl in ddl_postgis:
+                                cur.execute(ddl)
+                    except Exception as e:
+                        print(f"[ubicaciones] PostGIS no disponible, se usa lat/lng: {e}")
             conn.commit()
 
+        if layout == "legacy":
+            print(
+                "[ubicaciones] public.ubicaciones no está particionada; "
+                "UBIC_PARTITION_MIGRATE=true para migrarla"
+            )
+            return
+        particiones.mantenimiento()
+
     # --- escrituras ---
+    # upsert de la posición vigente; no retrocede si llega un ping más viejo
+    # (p.ej. lotes acumulados sin señal)
+    _UPSERT_ACTUAL = """
+        INSERT INTO public.patrulla_posicion_actual AS pa
+               (patrulla_id, ubicacion_id, nombre, lat, lng, activo, updated_at)
+        {source}
+        ON CONFLICT (patrulla_id) DO UPDATE
+           SET ubicacion_id = EXCLUDED.ubicacion_id,
+               nombre = EXCLUDED.nombre,
+               lat = EXCLUDED.lat,
+               lng = EXCLUDED.lng,
+               activo = EXCLUDED.activo,
+               updated_at = EXCLUDED.updated_at,
+               cambio_xid = pg_current_xact_id()
+         WHERE pa.updated_at <= EXCLUDED.updated_at
+    """
+
     def crear(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Inserta el ping en el historial y, si trae patrulla_id, actualiza su posición vigente (1 round trip)."""
         sql = """
-        INSERT INTO public.ubicaciones (nombre, lat, lng, activo)
-        VALUES (%s, %s, %s, COALESCE(%s, TRUE))
-        RETURNING id, nombre, lat, lng, activo, created_at, updated_at
+        WITH ins AS (
+          INSERT INTO public.ubicaciones (nombre, lat, lng, activo, patrulla_id)
+          VALUES (%(nombre)s, %(lat)s, %(lng)s, COALESCE(%(activo)s, TRUE), %(pid)s)
+          RETURNING id, patrulla_id, nombre, lat, lng, activo, created_at, updated_at
+        ), actual AS (
+        """ + self._UPSERT_ACTUAL.format(source="""
+          SELECT patrulla_id, id, nombre, lat, lng, activo, updated_at
+            FROM ins WHERE patrulla_id IS NOT NULL
+        """) + """
+        )
+        SELECT * FROM ins
         """
-        nombre = (data.get("nombre") or "").strip()
-        lat = float(data["lat"])
-        lng = float(data["lng"])
-        activo = data.get("activo", True)
-
-        with psycopg.connect(self.dsn) as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(sql, (nombre, lat, lng, activo))
+        params = {
+            "nombre": (data.get("nombre") or "").strip(),
+            "lat": float(data["lat"]),
+            "lng": float(data["lng"]),
+            "activo": data.get("activo", True),
+            "pid": data.get("patrulla_id"),
+        }
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
             row = cur.fetchone()
+            notify(cur, PING, [row["patrulla_id"]] if row["patrulla_id"] is not None else [], row["updated_at"])
             conn.commit()
             return dict(row)
 
+    def crear_batch(self, rows: Sequence[Tuple[str, float, float, bool, datetime, Optional[int]]]) -> int:
+        """
+        Inserta muchas filas (nombre, lat, lng, activo, updated_at, patrulla_id)
+        con COPY y actualiza la posición vigente de cada patrulla con su ping
+        más reciente, todo en una sola transacción. Las filas deben venir ya
+        validadas. Devuelve la cantidad insertada.
+        """
+        if not rows:
+            return 0
+        latest: Dict[int, Tuple[str, float, float, bool, datetime, Optional[int]]] = {}
+        for row in rows:
+            pid = row[5]
+            if pid is not None and (pid not in latest or latest[pid][4] <= row[4]):
+                latest[pid] = row
+
+        copy_sql = "COPY public.ubicaciones (nombre, lat, lng, activo, updated_at, patrulla_id) FROM STDIN"
+        # COPY no devuelve ids: el de la fila vigente se busca por (patrulla_id, updated_at)
+        upsert_sql = self._UPSERT_ACTUAL.format(source="""
+          SELECT v.pid,
+                 (SELECT u.id FROM public.ubicaciones u
+                   WHERE u.patrulla_id = v.pid AND u.updated_at = v.ts
+                   ORDER BY u.id DESC LIMIT 1),
+                 v.nombre, v.lat, v.lng, v.activo, v.ts
+            FROM (VALUES (CAST(%s AS bigint), CAST(%s AS text), CAST(%s AS double precision),
+                          CAST(%s AS double precision), CAST(%s AS boolean), CAST(%s AS timestamptz)))
+                 AS v(pid, nombre, lat, lng, activo, ts)
+        """)
+        with self._conn() as conn, conn.cursor() as cur:
+            with cur.copy(copy_sql) as cp:
+                for row in rows:
+                    cp.write_row(row)
+            if latest:
+                cur.executemany(
+                    upsert_sql,
+                    [(pid, n, lat, lng, act, ts) for pid, (n, lat, lng, act, ts, _) in latest.items()],
+                )
+            notify(cur, PING, *resumen_lote(rows))
+            conn.commit()
+        return len(rows)
+
     def actualizar(
         self,
         ubic_id: int,
@@ -107,55 +260,134 @@ class UbicacionRepository:
         UPDATE public.ubicaciones
         SET {', '.join(sets)}, updated_at=NOW()
         WHERE id=%s
-        RETURNING id, nombre, lat, lng, activo, created_at, updated_at
+        RETURNING id, patrulla_id, nombre, lat, lng, activo, created_at, updated_at
+        """
+        sync_sql = """
+        UPDATE public.patrulla_posicion_actual
+           SET nombre=%s, lat=%s, lng=%s, activo=%s, updated_at=%s, cambio_xid=pg_current_xact_id()
+         WHERE ubicacion_id=%s
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor(row_factory=dict_row) as cur:
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, tuple(params))
             row = cur.fetchone()
+            if row:
+                cur.execute(
+                    sync_sql,
+                    (row["nombre"], row["lat"], row["lng"], row["activo"], row["updated_at"], ubic_id),
+                )
+                cur.execute(SQL_BUMP_EDICIONES)
+                notify(cur, EDICION, [row["patrulla_id"]] if row["patrulla_id"] is not None else None)
             conn.commit()
             return dict(row) if row else None
 
     def eliminar(self, ubic_id: int) -> bool:
-        sql = "DELETE FROM public.ubicaciones WHERE id=%s"
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        sql = "DELETE FROM public.ubicaciones WHERE id=%s RETURNING patrulla_id"
+        # si era la posición vigente de su patrulla, se repone con el ping anterior
+        sync_sql = "DELETE FROM public.patrulla_posicion_actual WHERE ubicacion_id=%s"
+        reponer_sql = self._UPSERT_ACTUAL.format(source="""
+          SELECT patrulla_id, id, nombre, lat, lng, activo, updated_at
+            FROM public.ubicaciones
+           WHERE patrulla_id = %s
+           ORDER BY updated_at DESC, id DESC
+           LIMIT 1
+        """)
+        # sin ping anterior la patrulla desaparece del mapa: lápida para el delta
+        baja_sql = """
+        INSERT INTO public.patrulla_posicion_baja (patrulla_id) VALUES (%s)
+        ON CONFLICT (patrulla_id) DO UPDATE
+           SET cambio_xid = pg_current_xact_id(), deleted_at = NOW()
+        """
+        with self._conn() as conn, conn.cursor() as cur:
             cur.execute(sql, (ubic_id,))
-            deleted = cur.rowcount
+            row = cur.fetchone()
+            if row:
+                cur.execute(sync_sql, (ubic_id,))
+                if cur.rowcount and row[0] is not None:
+                    cur.execute(reponer_sql, (row[0],))
+                    if not cur.rowcount:
+                        cur.execute(baja_sql, (row[0],))
+                cur.execute(SQL_BUMP_EDICIONES)
+                notify(cur, EDICION, [row[0]] if row[0] is not None else None)
             conn.commit()
-            return deleted > 0
+            return row is not None
 
     # --- lecturas ---
     def obtener(self, ubic_id: int) -> Optional[Dict[str, Any]]:
         sql = """
-        SELECT id, nombre, lat, lng, activo, created_at, updated_at
+        SELECT id, patrulla_id, nombre, lat, lng, activo, created_at, updated_at
         FROM public.ubicaciones WHERE id=%s
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor(row_factory=dict_row) as cur:
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, (ubic_id,))
             row = cur.fetchone()
             return dict(row) if row else None
 
-    def listar_paginado(self, page: int = 1, size: int = 100) -> Dict[str, Any]:
+    def listar_paginado(
+        self,
+        page: int = 1,
+        size: int = 100,
+        *,
+        after: Optional[str] = None,
+        count: str = "estimate",
+    ) -> Dict[str, Any]:
+        """
+        Historial por id descendente. Con `after` (cursor 'next' de la página
+        anterior) se pagina por keyset: WHERE id < :id baja por el PK de cada
+        partición y cuesta lo mismo en cualquier página; `page` se ignora.
+        Sin `after`, LIMIT/OFFSET como antes (compat).
+        count: estimate (planner, por defecto) | exact (COUNT(*)) | none.
+        """
         page = max(page, 1)
         size = max(min(size, 500), 1)
-        offset = (page - 1) * size
+        where, params = "", []
+        if after:
+            (last_id,) = decode_cursor(after, (int,))
+            where, params, offset = "WHERE id < %s", [last_id], 0
+        else:
+            offset = (page - 1) * size
 
-        count_sql = "SELECT COUNT(*) FROM public.ubicaciones"
-        list_sql = """
-        SELECT id, nombre, lat, lng, activo, created_at, updated_at
+        list_sql = f"""
+        SELECT id, patrulla_id, nombre, lat, lng, activo, created_at, updated_at
         FROM public.ubicaciones
+        {where}
         ORDER BY id DESC
         LIMIT %s OFFSET %s
         """
-        with psycopg.connect(self.dsn) as conn:
+        total: Optional[int] = None
+        with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute(count_sql)
-                total = int(cur.fetchone()[0])
+                if count == "exact":
+                    cur.execute("SELECT COUNT(*) FROM public.ubicaciones")
+                    total = int(cur.fetchone()[0])
+                elif count == "estimate":
+                    cur.execute(explain_sql("SELECT 1 FROM public.ubicaciones"))
+                    total = plan_rows(cur.fetchone()[0])
 
             with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(list_sql, (size, offset))
+                cur.execute(list_sql, (*params, size + 1, offset))
                 rows = [dict(r) for r in cur.fetchall()]
 
-        return {"items": rows, "page": page, "size": size, "total": total}
+        return {
+            "items": rows[:size],
+            "page": None if after else page,
+            "size": size,
+            "total": total,
+            "count": count,
+            "next": next_cursor(rows, size, lambda r: (r["id"],)),
+        }
+
+    # --- posición vigente (una fila por patrulla) ---
+    _ACTUAL_COLS = "ubicacion_id AS id, patrulla_id, nombre, lat, lng, activo, updated_at"
+
+    def actuales(self) -> List[Dict[str, Any]]:
+        sql = f"""
+        SELECT {self._ACTUAL_COLS}
+        FROM public.patrulla_posicion_actual
+        ORDER BY updated_at DESC
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql)
+            return [dict(r) for r in cur.fetchall()]
 
     def listar_bbox(
         self,
@@ -164,41 +396,372 @@ class UbicacionRepository:
         max_lng: float,
         max_lat: float,
     ) -> List[Dict[str, Any]]:
-        sql = """
-        SELECT id, nombre, lat, lng, activo, created_at, updated_at
-        FROM public.ubicaciones
-        WHERE lng BETWEEN %s AND %s
-          AND lat BETWEEN %s AND %s
+        """Posición vigente de las patrullas dentro del bbox (no el historial)."""
+        if self.postgis_activo():
+            cond = "geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)"
+            params: Tuple[float, ...] = (min_lng, min_lat, max_lng, max_lat)
+        else:
+            cond = "lng BETWEEN %s AND %s AND lat BETWEEN %s AND %s"
+            params = (min_lng, max_lng, min_lat, max_lat)
+        sql = f"""
+        SELECT {self._ACTUAL_COLS}
+        FROM public.patrulla_posicion_actual
+        WHERE {cond}
         ORDER BY updated_at DESC
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(sql, (min_lng, max_lng, min_lat, max_lat))
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
             return [dict(r) for r in cur.fetchall()]
 
-    # --- agregados para dashboard ---
-    def contar_total(self) -> int:
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM public.ubicaciones")
-            return int(cur.fetchone()[0])
+    def cercanas(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        *,
+        max_m: Optional[float] = None,
+        activo: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        k posiciones vigentes más cercanas, con distance_m (haversine).
+        PostGIS: orden KNN `<->` sobre el GiST geography; si no, haversine en SQL.
+        """
+        conds: List[str] = []
+        params: Dict[str, Any] = {"lat": lat, "lng": lng, "k": k}
+        if activo is not None:
+            conds.append("u.activo = %(activo)s")
+            params["activo"] = activo
+        if self.postgis_activo():
+            pt = "ST_SetSRID(ST_MakePoint(%(lng)s, %(lat)s), 4326)::geography"
+            if max_m is not None:
+                conds.append(f"ST_DWithin(u.geom::geography, {pt}, %(max_m)s)")
+                params["max_m"] = max_m
+            order = f"u.geom::geography <-> {pt}"
+        else:
+            dist = haversine_sql("%(lat)s", "%(lng)s")
+            if max_m is not None:
+                dlat, dlng = deg_box(lat, max_m)
+                conds.append("u.lat BETWEEN %(lat)s - %(dlat)s AND %(lat)s + %(dlat)s")
+                conds.append("u.lng BETWEEN %(lng)s - %(dlng)s AND %(lng)s + %(dlng)s")
+                conds.append(f"{dist} <= %(max_m)s")
+                params.update(max_m=max_m, dlat=dlat, dlng=dlng)
+            order = dist
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        sql = f"""
+        SELECT {self._ACTUAL_COLS}
+        FROM public.patrulla_posicion_actual u
+        {where}
+        ORDER BY {order}
+        LIMIT %(k)s
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
+            rows = [dict(r) for r in cur.fetchall()]
+        for r in rows:
+            r["distance_m"] = haversine_m(lat, lng, r["lat"], r["lng"])
+        rows.sort(key=lambda r: r["distance_m"])
+        return rows
+
+    # --- watermark para GET condicional (ver ubicacion_version.py) ---
+    def version(self) -> Tuple[Optional[int], Optional[datetime], int, int]:
+        """
+        (MAX(id) del historial, MAX(updated_at) y COUNT(*) de la posición
+        vigente, contador de ediciones). Todo por índice o sobre tablas chicas.
+        """
+        sql = """
+        SELECT (SELECT MAX(id) FROM public.ubicaciones),
+               (SELECT MAX(updated_at) FROM public.patrulla_posicion_actual),
+               (SELECT COUNT(*) FROM public.patrulla_posicion_actual),
+               COALESCE((SELECT ediciones FROM public.ubicacion_version WHERE id = 1), 0)
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql)
+            max_id, max_ts, n, ediciones = cur.fetchone()
+            return max_id, max_ts, int(n), int(ediciones)
+
+    # --- delta del mapa en vivo (/geo?since=<cursor>) y del índice en memoria ---
+    def cambios_desde(self, since: int, patrulla_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Posiciones vigentes cambiadas y patrullas dadas de baja desde el cursor
+        `since`, más el cursor nuevo. Todo en una transacción REPEATABLE READ:
+        el cursor es el xmin de esa misma snapshot, así una transacción que
+        seguía abierta al leer (xid >= xmin) entra en el próximo delta aunque
+        confirme tarde. Puede repetir algún cambio ya enviado, nunca perderlo.
 
-    def contar_activas(self) -> int:
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM public.ubicaciones WHERE activo=TRUE")
-            return int(cur.fetchone()[0])
+        since <= 0 o anterior a las lápidas purgadas -> reset (todas las
+        posiciones, sin bajas).
+        """
+        pid_sql = " AND patrulla_id = %(pid)s" if patrulla_id is not None else ""
+        pid_baja_sql = " AND b.patrulla_id = %(pid)s" if patrulla_id is not None else ""
+        cambios_sql = f"""
+        SELECT {self._ACTUAL_COLS}
+        FROM public.patrulla_posicion_actual
+        WHERE cambio_xid >= %(since)s::xid8{pid_sql}
+        ORDER BY updated_at
+        """
+        bajas_sql = f"""
+        SELECT b.patrulla_id
+        FROM public.patrulla_posicion_baja b
+        WHERE b.cambio_xid >= %(since)s::xid8{pid_baja_sql}
+          AND NOT EXISTS (
+            SELECT 1 FROM public.patrulla_posicion_actual pa WHERE pa.patrulla_id = b.patrulla_id
+          )
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.execute("""
+            SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS cursor,
+                   COALESCE((SELECT bajas_hasta::text FROM public.ubicacion_version WHERE id = 1), '0') AS horizonte
+            """)
+            snap = cur.fetchone()
+            cursor, horizonte = int(snap["cursor"]), int(snap["horizonte"])
+            reset = since <= 0 or since <= horizonte
+            params = {"since": str(0 if reset else since), "pid": patrulla_id}
+            cur.execute(cambios_sql, params)
+            rows = [dict(r) for r in cur.fetchall()]
+            bajas: List[int] = []
+            if not reset:
+                cur.execute(bajas_sql, params)
+                bajas = [int(r["patrulla_id"]) for r in cur.fetchall()]
+            conn.rollback()
+        return {"cursor": cursor, "reset": reset, "rows": rows, "bajas": bajas}
 
-    def ultima_actualizacion_iso(self) -> Optional[str]:
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute("SELECT MAX(updated_at) FROM public.ubicaciones")
-            ts = cur.fetchone()[0]
-            return ts.isoformat() if ts else None
+    def purgar_bajas(self, horas: float) -> int:
+        """Borra lápidas más viejas que `horas` y corre el horizonte del delta. Devuelve cuántas borró."""
+        sql = """
+        WITH d AS (
+          DELETE FROM public.patrulla_posicion_baja
+           WHERE deleted_at < NOW() - %s * INTERVAL '1 hour'
+          RETURNING cambio_xid
+        ), v AS (
+          UPDATE public.ubicacion_version
+             SET bajas_hasta = GREATEST(bajas_hasta, (SELECT MAX(cambio_xid) FROM d))
+           WHERE id = 1 AND EXISTS (SELECT 1 FROM d)
+        )
+        SELECT COUNT(*) FROM d
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (float(horas),))
+            n = int(cur.fetchone()[0])
+            conn.commit()
+            return n
 
-    def recientes(self, limit: int = 20) -> List[Dict[str, Any]]:
+    # --- agregados para dashboard (sobre la posición vigente) ---
+    def resumen_actual(self) -> Dict[str, Any]:
+        """total de patrullas con posición, activas y última actualización (1 consulta)."""
         sql = """
-        SELECT id, nombre, lat, lng, activo, created_at, updated_at
-        FROM public.ubicaciones
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE activo), MAX(updated_at)
+        FROM public.patrulla_posicion_actual
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql)
+            total, activas, ts = cur.fetchone()
+            return {
+                "total": int(total),
+                "activas": int(activas),
+                "ultima_actualizacion": ts.isoformat() if ts else None,
+            }
+
+    def recientes(self, limit: int = 20) -> List[Dict[str, Any]]:
+        sql = f"""
+        SELECT {self._ACTUAL_COLS}
+        FROM public.patrulla_posicion_actual
         ORDER BY updated_at DESC
         LIMIT %s
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor(row_factory=dict_row) as cur:
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, (limit,))
             return [dict(r) for r in cur.fetchall()]
+
+    # --- teselas vectoriales (historial) ---
+    def _tile_filtros(
+        self,
+        desde: Optional[datetime],
+        hasta: Optional[datetime],
+        patrulla_id: Optional[int],
+        params: Dict[str, Any],
+    ) -> List[str]:
+        conds: List[str] = []
+        if desde is not None:
+            conds.append("u.updated_at >= %(desde)s")
+            params["desde"] = desde
+        if hasta is not None:
+            conds.append("u.updated_at <= %(hasta)s")
+            params["hasta"] = hasta
+        if patrulla_id is not None:
+            conds.append("u.patrulla_id = %(pid)s")
+            params["pid"] = patrulla_id
+        return conds
+
+    def tile_historial(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        bounds: Tuple[float, float, float, float],
+        *,
+        cell: int,
+        extent: int,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        patrulla_id: Optional[int] = None,
+        limit: int = 5000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Historial de la tesela agrupado en celdas de `cell` unidades (sin PostGIS):
+        {gx, gy, n, ts, patrulla_id} con las celdas más recientes primero.
+        patrulla_id sólo viene si la celda es de una única patrulla.
+        """
+        params: Dict[str, Any] = {
+            "n": float(1 << z), "x": x, "y": y, "extent": extent, "cell": max(cell, 1), "limit": limit,
+            "min_lng": bounds[0], "min_lat": bounds[1], "max_lng": bounds[2], "max_lat": bounds[3],
+        }
+        conds = [
+            "u.lng BETWEEN %(min_lng)s AND %(max_lng)s",
+            "u.lat BETWEEN %(min_lat)s AND %(max_lat)s",
+        ] + self._tile_filtros(desde, hasta, patrulla_id, params)
+        sql = f"""
+        WITH p AS (
+          SELECT u.updated_at, u.patrulla_id,
+                 ((u.lng + 180.0) / 360.0 * %(n)s - %(x)s) * %(extent)s AS px,
+                 ((1.0 - ln(tan(radians(u.lat)) + 1.0 / cos(radians(u.lat))) / pi()) / 2.0 * %(n)s
+                   - %(y)s) * %(extent)s AS py
+          FROM public.ubicaciones u
+          WHERE {" AND ".join(conds)}
+        )
+        SELECT floor(px / %(cell)s)::int AS gx, floor(py / %(cell)s)::int AS gy,
+               COUNT(*) AS n, MAX(updated_at) AS ts,
+               CASE WHEN MIN(patrulla_id) = MAX(patrulla_id) THEN MIN(patrulla_id) END AS patrulla_id
+        FROM p
+        GROUP BY 1, 2
+        ORDER BY MAX(updated_at) DESC
+        LIMIT %(limit)s
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
+            return [dict(r) for r in cur.fetchall()]
+
+    def tile_historial_mvt(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        *,
+        cell: int,
+        extent: int,
+        buffer: int,
+        layer: str = "historial",
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        patrulla_id: Optional[int] = None,
+        limit: int = 5000,
+    ) -> bytes:
+        """Misma capa que tile_historial pero codificada por PostGIS (ST_AsMVT sobre el GiST de geom)."""
+        params: Dict[str, Any] = {
+            "z": z, "x": x, "y": y, "extent": extent, "buffer": buffer, "cell": max(cell, 1),
+            "layer": layer, "limit": limit,
+            # margen del buffer en metros Web Mercator
+            "margin": buffer / float(extent) * tile_size_m(z),
+        }
+        conds = [
+            "u.geom && ST_Transform(ST_Expand(b.env, %(margin)s), 4326)",
+        ] + self._tile_filtros(desde, hasta, patrulla_id, params)
+        sql = f"""
+        WITH b AS (SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env),
+        p AS (
+          SELECT ST_AsMVTGeom(ST_Transform(u.geom, 3857), b.env, %(extent)s, %(buffer)s, true) AS g,
+                 u.updated_at, u.patrulla_id
+          FROM public.ubicaciones u, b
+          WHERE {" AND ".join(conds)}
+        ),
+        c AS (
+          SELECT ST_SnapToGrid(g, %(cell)s) AS geom,
+                 COUNT(*)::int AS n,
+                 to_char(MAX(updated_at) AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"') AS ts,
+                 CASE WHEN MIN(patrulla_id) = MAX(patrulla_id) THEN MIN(patrulla_id) END AS patrulla_id
+          FROM p
+          WHERE g IS NOT NULL
+          GROUP BY 1
+          ORDER BY MAX(updated_at) DESC
+          LIMIT %(limit)s
+        )
+        SELECT ST_AsMVT(c, %(layer)s, %(extent)s, 'geom') FROM c
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            row = cur.fetchone()
+            return bytes(row[0]) if row and row[0] else b""
+
+    # --- mapa de calor ---
+    def heatmap(
+        self,
+        bbox: Tuple[float, float, float, float],
+        cell_deg: Tuple[float, float],
+        dims: Tuple[int, int],
+        desde: datetime,
+        hasta: datetime,
+        patrulla_id: Optional[int] = None,
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Pings del historial en [desde, hasta) dentro del bbox, contados por celda
+        de una grilla con origen en (min_lng, min_lat): [(col, fila, n), ...].
+        Un solo GROUP BY en el servidor; sólo viajan las celdas no vacías.
+        """
+        params: Dict[str, Any] = {
+            "x0": bbox[0], "y0": bbox[1], "x1": bbox[2], "y1": bbox[3],
+            "dx": cell_deg[0], "dy": cell_deg[1], "cols": dims[0], "rows": dims[1],
+            "desde": desde, "hasta": hasta,
+        }
+        conds = ["u.updated_at >= %(desde)s", "u.updated_at < %(hasta)s"]
+        if self.postgis_activo():
+            conds.append("u.geom && ST_MakeEnvelope(%(x0)s, %(y0)s, %(x1)s, %(y1)s, 4326)")
+        else:
+            conds.append("u.lng BETWEEN %(x0)s AND %(x1)s")
+            conds.append("u.lat BETWEEN %(y0)s AND %(y1)s")
+        if patrulla_id is not None:
+            conds.append("u.patrulla_id = %(pid)s")
+            params["pid"] = patrulla_id
+        # LEAST: los puntos sobre el borde máximo caen en la última celda
+        sql = f"""
+        SELECT LEAST(floor((u.lng - %(x0)s) / %(dx)s)::int, %(cols)s - 1) AS cx,
+               LEAST(floor((u.lat - %(y0)s) / %(dy)s)::int, %(rows)s - 1) AS cy,
+               COUNT(*) AS n
+        FROM public.ubicaciones u
+        WHERE {" AND ".join(conds)}
+        GROUP BY 1, 2
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [(int(cx), int(cy), int(n)) for cx, cy, n in cur.fetchall()]
+
+    # --- recorridos ---
+    def track(
+        self,
+        patrulla_id: int,
+        desde: datetime,
+        hasta: datetime,
+        limit: int,
+    ) -> List[Tuple[float, float, datetime]]:
+        """(lng, lat, updated_at) de la patrulla en [desde, hasta], en orden (idx_ubicaciones_patrulla_ts)."""
+        sql = """
+        SELECT lng, lat, updated_at
+        FROM public.ubicaciones
+        WHERE patrulla_id = %s AND updated_at >= %s AND updated_at <= %s
+        ORDER BY updated_at, id
+        LIMIT %s
+        """
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (patrulla_id, desde, hasta, limit))
+            return [(float(lng), float(lat), ts) for lng, lat, ts in cur.fetchall()]
+
+    def asignacion(self, asig_id: int) -> Optional[Dict[str, Any]]:
+        """Turno (user_patrulla_asignacion): {id, patrulla_id, started_at, ended_at}."""
+        sql = """
+        SELECT id, patrulla_id, started_at, ended_at
+        FROM public.user_patrulla_asignacion
+        WHERE id = %s
+        """
+        with self._conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, (asig_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
@@ -0,0 +1,101 @@
+# backend/app/services/asignacion_cache.py
+"""
+Caché en memoria (por proceso) de la patrulla activa de cada usuario.
+
+La usa el resolver de POST /api/ubicaciones para que un ping en régimen
+estable no consulte asignaciones. Se invalida por usuario en
+/api/asignaciones/start y /end, y completa cuando cambia/borra una patrulla,
+en todos los workers: el aviso viaja por el bus de ubicacion_eventos
+(LISTEN/NOTIFY). Tras una reconexión del LISTEN se vacía entera. El TTL
+(ASIG_CACHE_TTL_S; ASIG_CACHE_NEG_TTL_S para "sin asignación") es el límite
+si se pierde un aviso; con UBIC_NOTIFY_ENABLED=false no hay avisos entre
+workers y el TTL se acota a ASIG_CACHE_TTL_NO_NOTIFY_S.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple, Union
+
+from app.config.settings import Settings
+from app.services.ubicacion_eventos import ASIGNACION, RESYNC, Cambio, bus
+
+Key = Union[int, str]
+_MISS = object()
+
+
+class AsignacionCache:
+    def __init__(self, ttl: float, neg_ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.neg_ttl = neg_ttl
+        self.max_entries = max(max_entries, 1)
+        self._data: "OrderedDict[Key, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(uid: Optional[int], email: str = "") -> Optional[Key]:
+        if uid is not None:
+            return uid
+        return f"email:{email}" if email else None
+
+    def get(self, key: Key) -> Any:
+        """Valor cacheado o _MISS (ojo: (None, None) es un valor válido)."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return _MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Key, value: Tuple[Optional[int], Optional[dict]]) -> None:
+        ttl = self.ttl if value and value[0] is not None else self.neg_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, uid: Optional[int] = None, email: str = "") -> None:
+        with self._lock:
+            for k in (self.key(uid), self.key(None, (email or "").strip().lower())):
+                if k is not None:
+                    self._data.pop(k, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_ttl_tope = float("inf") if Settings.UBIC_NOTIFY_ENABLED else Settings.ASIG_CACHE_TTL_NO_NOTIFY_S
+asignacion_cache = AsignacionCache(
+    ttl=min(Settings.ASIG_CACHE_TTL_S, _ttl_tope),
+    neg_ttl=min(Settings.ASIG_CACHE_NEG_TTL_S, _ttl_tope),
+    max_entries=Settings.ASIG_CACHE_MAX,
+)
+
+
+def _on_cambio(cambio: Cambio) -> None:
+    if cambio.kind == ASIGNACION:
+        if cambio.uid is None and not cambio.email:
+            asignacion_cache.clear()
+        else:
+            asignacion_cache.invalidate(cambio.uid, cambio.email)
+    elif cambio.kind == RESYNC:
+        asignacion_cache.clear()  # pudo perderse alguna invalidación
+
+
+bus.subscribe(_on_cambio)
+
+
+def is_miss(value: Any) -> bool:
+    return value is _MISS
@@ -0,0 +1,122 @@
+# backend/app/services/cluster.py
+"""
+Agrupamiento de puntos por zoom (estilo supercluster, con grilla jerárquica).
+
+- Coordenadas en Web Mercator normalizado (0..1), como un mapa XYZ.
+- Nivel z: se agrupan los ítems del nivel z+1 por celdas de `radius_px`
+  píxeles (tesela de `tile_px`); el centroide es el promedio ponderado por
+  cantidad de puntos. Así cada nivel se construye desde el anterior y no
+  desde todos los puntos.
+- Por encima de max_zoom se devuelven los puntos originales.
+
+Un punto suelto se devuelve como su Feature original; un grupo como
+Feature con properties {cluster, cluster_id, point_count, activos}.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Feature = Dict[str, Any]
+BBox = Tuple[float, float, float, float]
+
+
+def _mx(lng: float) -> float:
+    return lng / 360.0 + 0.5
+
+
+def _my(lat: float) -> float:
+    s = math.sin(math.radians(max(min(lat, 85.05112878), -85.05112878)))
+    return 0.5 - 0.25 * math.log((1 + s) / (1 - s)) / math.pi
+
+
+def _lng(x: float) -> float:
+    return (x - 0.5) * 360.0
+
+
+def _lat(y: float) -> float:
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+class _Item:
+    __slots__ = ("x", "y", "n", "activos", "feature", "id")
+
+    def __init__(self, x: float, y: float, n: int, activos: int, feature: Optional[Feature], id: int) -> None:
+        self.x, self.y, self.n, self.activos, self.feature, self.id = x, y, n, activos, feature, id
+
+
+class ClusterIndex:
+    def __init__(
+        self,
+        features: Iterable[Feature],
+        *,
+        min_zoom: int = 0,
+        max_zoom: int = 16,
+        radius_px: float = 60.0,
+        tile_px: int = 256,
+    ) -> None:
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.radius_px = radius_px
+        self.tile_px = tile_px
+        points: List[_Item] = []
+        for f in features:
+            try:
+                lng, lat = (float(c) for c in f["geometry"]["coordinates"][:2])
+            except Exception:
+                continue
+            activo = 1 if (f.get("properties") or {}).get("activo") else 0
+            points.append(_Item(_mx(lng), _my(lat), 1, activo, f, len(points)))
+        self.points = points
+        self._levels: Dict[int, List[_Item]] = {}
+        prev = points
+        for z in range(max_zoom, min_zoom - 1, -1):
+            prev = self._levels[z] = self._grid_pass(prev, z)
+
+    def _grid_pass(self, items: Sequence[_Item], z: int) -> List[_Item]:
+        cell = self.radius_px / (self.tile_px * float(1 << z))
+        buckets: Dict[Tuple[int, int], List[_Item]] = {}
+        for it in items:
+            buckets.setdefault((int(it.x // cell), int(it.y // cell)), []).append(it)
+        out: List[_Item] = []
+        for group in buckets.values():
+            if len(group) == 1:
+                out.append(group[0])
+                continue
+            n = sum(g.n for g in group)
+            x = sum(g.x * g.n for g in group) / n
+            y = sum(g.y * g.n for g in group) / n
+            # id estable dentro del índice: posición en el nivel + zoom (como supercluster)
+            out.append(_Item(x, y, n, sum(g.activos for g in group), None, (len(out) << 5) + z))
+        return out
+
+    def clusters(self, zoom: int, bbox: Optional[BBox] = None) -> List[Feature]:
+        """Features para el zoom pedido, opcionalmente recortadas al bbox (lng/lat)."""
+        zoom = max(int(zoom), self.min_zoom)
+        items = self.points if zoom > self.max_zoom else self._levels[zoom]
+        if bbox is not None:
+            x0, x1 = _mx(bbox[0]), _mx(bbox[2])
+            y0, y1 = _my(bbox[3]), _my(bbox[1])
+            items = [it for it in items if x0 <= it.x <= x1 and y0 <= it.y <= y1]
+        out: List[Feature] = []
+        for it in items:
+            if it.feature is not None:
+                out.append(it.feature)
+                continue
+            out.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [round(_lng(it.x), 7), round(_lat(it.y), 7)]},
+                "properties": {
+                    "cluster": True,
+                    "cluster_id": it.id,
+                    "point_count": it.n,
+                    "activos": it.activos,
+                },
+            })
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "points": len(self.points),
+            "levels": {z: len(v) for z, v in sorted(self._levels.items())},
+        }
@@ -0,0 +1,41 @@
+# backend/app/services/geo_utils.py
+"""Utilidades geográficas compartidas (sin PostGIS ni NumPy)."""
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+EARTH_RADIUS_M = 6_371_008.8
+M_PER_DEG_LAT = 111_320.0
+
+
+
+def haversine_sql(lat_ref: str, lng_ref: str, alias: str = "u") -> str:
+    """Expresión SQL de la distancia haversine (m) de (alias.lat, alias.lng) al punto dado."""
+    return (
+        f"({EARTH_RADIUS_M} * 2 * asin(sqrt(least(1.0, "
+        f"power(sin(radians({alias}.lat - {lat_ref}) / 2), 2) + "
+        f"cos(radians({lat_ref})) * cos(radians({alias}.lat)) * "
+        f"power(sin(radians({alias}.lng - {lng_ref}) / 2), 2)))))"
+    )
+
+
+# versión con binds de SQLAlchemy text() (:near_lat, :near_lng)
+HAVERSINE_M_SQL = haversine_sql(":near_lat", ":near_lng")
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distancia en metros sobre la esfera."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((p2 - p1) / 2) ** 2
+        + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def deg_box(lat: float, radius_m: float) -> Tuple[float, float]:
+    """Semiancho (dlat, dlng) en grados de un rectángulo que contiene el círculo de radius_m."""
+    dlat = radius_m / M_PER_DEG_LAT
+    dlng = radius_m / (M_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return dlat, min(dlng, 180.0)
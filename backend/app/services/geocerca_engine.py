@@ -0,0 +1,276 @@
+# backend/app/services/geocerca_engine.py
+"""
+Motor de geocercas evaluado en la ingesta.
+
+- UbicacionService.crear / crear_batch llaman a submit_pings(): sólo encolan
+  (microsegundos), el POST no espera a la evaluación.
+- Un hilo por proceso toma los pings en micro-lotes (misma mecánica que el
+  write-behind, ver ubicacion_buffer.WriteBehindBuffer) y:
+    1. recarga las geocercas si cambiaron (cada GEOFENCE_SYNC_S como máximo),
+    2. busca candidatas con una grilla de bboxes precalculada,
+    3. hace point-in-polygon agrupado por geocerca (cada polígono se prueba
+       contra todos los pings del lote que caen en su bbox de una vez),
+    4. compara con el estado guardado y emite eventos enter/exit
+       (GeocercaRepository.registrar_transiciones).
+
+Las geocercas con patrulla_id sólo aplican a esa patrulla (su sector);
+sin patrulla_id aplican a todas.
+"""
+from __future__ import annotations
+
+import atexit
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.config.settings import Settings
+from app.services.ubicacion_buffer import BufferFullError, WriteBehindBuffer
+
+Ring = List[Tuple[float, float]]          # [(lng, lat), ...]
+Polygon = List[Ring]                      # [exterior, hueco, ...]
+# (patrulla_id, ts, lat, lng, ubicacion_id)
+Ping = Tuple[int, datetime, float, float, Optional[int]]
+
+
+def polygons_of(geojson: Dict[str, Any]) -> List[Polygon]:
+    """Polygon/MultiPolygon GeoJSON -> lista de polígonos [(lng, lat)...]."""
+    t = geojson.get("type")
+    coords = geojson.get("coordinates") or []
+    if t == "Polygon":
+        polys = [coords]
+    elif t == "MultiPolygon":
+        polys = coords
+    else:
+        raise ValueError("geojson debe ser Polygon o MultiPolygon")
+    out: List[Polygon] = []
+    for poly in polys:
+        rings = [[(float(p[0]), float(p[1])) for p in ring] for ring in poly]
+        if not rings or len(rings[0]) < 4:
+            raise ValueError("cada anillo necesita al menos 4 posiciones (cerrado)")
+        out.append(rings)
+    return out
+
+
+def bbox_of(polys: Sequence[Polygon]) -> Tuple[float, float, float, float]:
+    xs = [x for poly in polys for x, _ in poly[0]]
+    ys = [y for poly in polys for _, y in poly[0]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _in_ring(x: float, y: float, ring: Ring) -> bool:
+    """Ray casting (par/impar)."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def contains(polys: Sequence[Polygon], lng: float, lat: float) -> bool:
+    for rings in polys:
+        if _in_ring(lng, lat, rings[0]) and not any(_in_ring(lng, lat, h) for h in rings[1:]):
+            return True
+    return False
+
+
+class _Fence:
+    __slots__ = ("id", "patrulla_id", "polys", "bbox")
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        self.id = int(row["id"])
+        self.patrulla_id = row.get("patrulla_id")
+        self.polys = polygons_of(row["geojson"])
+        self.bbox = (row["min_lng"], row["min_lat"], row["max_lng"], row["max_lat"])
+
+
+class GeofenceIndex:
+    """Grilla de bboxes de geocercas; las que cubren demasiadas celdas van a una lista aparte."""
+
+    MAX_CELLS_PER_FENCE = 4096
+
+    def __init__(self, rows: Iterable[Dict[str, Any]], cell_deg: float = 0.05) -> None:
+        self.cell_deg = cell_deg
+        self.fences: Dict[int, _Fence] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._large: List[int] = []
+        for row in rows:
+            try:
+                f = _Fence(row)
+            except Exception as e:
+                print(f"[geocercas] geocerca {row.get('id')} inválida, se ignora: {e}")
+                continue
+            self.fences[f.id] = f
+            x0, y0 = self._cell(f.bbox[0], f.bbox[1])
+            x1, y1 = self._cell(f.bbox[2], f.bbox[3])
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > self.MAX_CELLS_PER_FENCE:
+                self._large.append(f.id)
+                continue
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self._cells.setdefault((x, y), []).append(f.id)
+
+    def _cell(self, lng: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lng / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def candidates(self, lng: float, lat: float, pid: Optional[int]) -> List[_Fence]:
+        out = []
+        for gid in self._cells.get(self._cell(lng, lat), []) + self._large:
+            f = self.fences[gid]
+            if f.patrulla_id is not None and f.patrulla_id != pid:
+                continue
+            b = f.bbox
+            if b[0] <= lng <= b[2] and b[1] <= lat <= b[3]:
+                out.append(f)
+        return out
+
+    def evaluate(self, pings: Sequence[Ping]) -> List[FrozenSet[int]]:
+        """Geocercas que contienen cada ping (misma posición que en `pings`)."""
+        # 1) candidatas por bbox, agrupadas por geocerca
+        por_cerca: Dict[int, List[int]] = {}
+        for i, (pid, _, lat, lng, _) in enumerate(pings):
+            for f in self.candidates(lng, lat, pid):
+                por_cerca.setdefault(f.id, []).append(i)
+        # 2) un polígono contra todos sus pings candidatos
+        dentro: List[Set[int]] = [set() for _ in pings]
+        for gid, idxs in por_cerca.items():
+            polys = self.fences[gid].polys
+            for i in idxs:
+                if contains(polys, pings[i][3], pings[i][2]):
+                    dentro[i].add(gid)
+        return [frozenset(s) for s in dentro]
+
+
+class GeofenceEngine:
+    def __init__(self, repo=None, *, sync_s: float = 5.0, cell_deg: float = 0.05) -> None:
+        if repo is None:
+            from app.repositories.geocerca_repository import GeocercaRepository
+
+            repo = GeocercaRepository()
+        self.repo = repo
+        self.sync_s = sync_s
+        self.cell_deg = cell_deg
+        self.index = GeofenceIndex([], cell_deg)
+        self._version: Any = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"evaluated": 0, "events": 0, "reloads": 0}
+
+    def reload(self) -> None:
+        """Recarga las geocercas activas (p.ej. tras un alta/edición en este worker)."""
+        version = self.repo.version()
+        rows = self.repo.listar(solo_activas=True)
+        with self._lock:
+            self.index = GeofenceIndex(rows, self.cell_deg)
+            self._version = version
+            self._last_check = time.monotonic()
+            self._counters["reloads"] += 1
+
+    def invalidate(self) -> None:
+        self._last_check = 0.0
+        self._version = None
+
+    def _maybe_reload(self) -> None:
+        if time.monotonic() - self._last_check < self.sync_s:
+            return
+        version = self.repo.version()
+        if version != self._version:
+            self.reload()
+        else:
+            self._last_check = time.monotonic()
+
+    def process(self, pings: Sequence[Ping]) -> List[Dict[str, Any]]:
+        """Evalúa un lote y persiste transiciones. Devuelve los eventos emitidos."""
+        self._maybe_reload()
+        index = self.index
+        # sin geocercas (ni estados que cerrar) no hay nada que hacer
+        if not index.fences and self._version is not None and self._version[0] == 0:
+            return []
+        dentro = index.evaluate(pings)
+        evals = [(p[0], p[1], p[2], p[3], p[4], d) for p, d in zip(pings, dentro)]
+        eventos = self.repo.registrar_transiciones(evals)
+        with self._lock:
+            self._counters["evaluated"] += len(pings)
+            self._counters["events"] += len(eventos)
+        return eventos
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"fences": len(self.index.fences), **self._counters}
+
+
+# ---------- singleton por proceso ----------
+_engine: Optional[GeofenceEngine] = None
+_queue: Optional[WriteBehindBuffer] = None
+_lock = threading.Lock()
+_dropped = 0
+
+
+def get_geofence_engine() -> Optional[GeofenceEngine]:
+    global _engine, _queue
+    if not Settings.GEOFENCE_ENABLED:
+        return None
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                engine = GeofenceEngine(sync_s=Settings.GEOFENCE_SYNC_S)
+                _queue = WriteBehindBuffer(
+                    engine.process,
+                    batch_rows=Settings.GEOFENCE_BATCH_ROWS,
+                    max_delay=Settings.GEOFENCE_MAX_DELAY_MS / 1000.0,
+                    queue_max=Settings.GEOFENCE_QUEUE_MAX,
+                    put_timeout=0.0,
+                    name="geocerca-eval",
+                )
+                _engine = engine
+    return _engine
+
+
+def submit_pings(pings: Iterable[Ping]) -> None:
+    """Encola pings con patrulla para evaluar geocercas. Nunca hace fallar la ingesta."""
+    global _dropped
+    if get_geofence_engine() is None or _queue is None:
+        return
+    for p in pings:
+        if p[0] is None:
+            continue
+        try:
+            _queue.put(p)
+        except BufferFullError:
+            _dropped += 1
+
+
+def pings_from_batch(rows: Iterable[tuple]) -> List[Ping]:
+    """Filas de crear_batch (nombre, lat, lng, activo, updated_at, patrulla_id) -> pings."""
+    return [(pid, ts, lat, lng, None) for _, lat, lng, _, ts, pid in rows if pid is not None]
+
+
+def shutdown_geofence_engine(timeout: float = 10.0) -> None:
+    global _queue, _engine
+    with _lock:
+        q, _queue = _queue, None
+        _engine = None
+    if q is not None:
+        q.close(timeout)
+
+
+def geofence_stats() -> Dict[str, Any]:
+    engine, q = _engine, _queue
+    if engine is None or q is None:
+        return {"enabled": bool(Settings.GEOFENCE_ENABLED), "queue_depth": 0}
+    qs = q.stats()
+    return {
+        "enabled": True,
+        **engine.stats(),
+        "queue_depth": qs["queue_depth"],
+        "dropped_pings": _dropped + qs["dropped_rows"],
+        "avg_batch_ms": qs["avg_flush_ms"],
+    }
+
+
+atexit.register(shutdown_geofence_engine)
@@ -0,0 +1,97 @@
+# backend/app/services/geocerca_service.py
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.repositories.geocerca_repository import GeocercaRepository
+from app.services.geocerca_engine import bbox_of, geofence_stats, get_geofence_engine, polygons_of
+
+
+class GeocercaService:
+    def __init__(self) -> None:
+        self.repo = GeocercaRepository()
+
+    def ensure_schema(self) -> None:
+        self.repo.ensure_schema()
+
+    # --- validaciones ---
+    def _clean_geojson(self, value: Any) -> Dict[str, Any]:
+        try:
+            geom = json.loads(value) if isinstance(value, str) else dict(value or {})
+        except Exception:
+            raise ValueError("geojson inválido")
+        if geom.get("type") == "Feature":
+            geom = geom.get("geometry") or {}
+        polys = polygons_of(geom)  # ValueError si no es Polygon/MultiPolygon válido
+        for rings in polys:
+            for lng, lat in rings[0]:
+                if not (-180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0):
+                    raise ValueError("coordenadas fuera de rango (lng, lat)")
+        return {"type": geom["type"], "coordinates": geom["coordinates"]}
+
+    def _clean(self, data: Dict[str, Any], *, parcial: bool) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        if "nombre" in data or not parcial:
+            nombre = (data.get("nombre") or "").strip()
+            if not nombre:
+                raise ValueError("nombre es requerido")
+            out["nombre"] = nombre
+        if "geojson" in data or not parcial:
+            geom = self._clean_geojson(data.get("geojson"))
+            out["geojson"] = geom
+            out.update(zip(("min_lng", "min_lat", "max_lng", "max_lat"), bbox_of(polygons_of(geom))))
+        if "patrulla_id" in data or not parcial:
+            pid = data.get("patrulla_id")
+            try:
+                out["patrulla_id"] = int(pid) if pid not in (None, "") else None
+            except (TypeError, ValueError):
+                raise ValueError("patrulla_id inválido")
+        if "activo" in data or not parcial:
+            out["activo"] = bool(data.get("activo", True))
+        return out
+
+    def _changed(self) -> None:
+        # este worker recarga ya; los demás al siguiente chequeo de versión
+        engine = get_geofence_engine()
+        if engine is not None:
+            engine.invalidate()
+
+    # --- CRUD ---
+    def list(self) -> List[Dict[str, Any]]:
+        return self.repo.listar()
+
+    def get(self, gid: int) -> Optional[Dict[str, Any]]:
+        return self.repo.obtener(gid)
+
+    def create(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        row = self.repo.crear(self._clean(data, parcial=False))
+        self._changed()
+        return row
+
+    def update(self, gid: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = self.repo.actualizar(gid, self._clean(data, parcial=True))
+        if row:
+            self._changed()
+        return row
+
+    def delete(self, gid: int) -> bool:
+        ok = self.repo.eliminar(gid)
+        if ok:
+            self._changed()
+        return ok
+
+    # --- eventos / métricas ---
+    def eventos(
+        self,
+        *,
+        patrulla_id: Optional[int] = None,
+        geocerca_id: Optional[int] = None,
+        desde: Optional[datetime] = None,
+        limit: int = 200,
+    ) -> List[Dict[str, Any]]:
+        return self.repo.eventos(patrulla_id=patrulla_id, geocerca_id=geocerca_id, desde=desde, limit=limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return geofence_stats()
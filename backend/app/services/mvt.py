@@ -0,0 +1,164 @@
+# backend/app/services/mvt.py
+"""
+Mapbox Vector Tiles (MVT 2.1) para capas de puntos, sin dependencias.
+
+- Matemática de teselas XYZ / Web Mercator (EPSG:3857).
+- Codificador protobuf mínimo: sólo lo que usan nuestras capas (Point y
+  propiedades string/int/float/bool). Es el camino sin PostGIS; con PostGIS
+  el historial sale de ST_AsMVT y se concatena (una tesela MVT es una lista
+  de capas, así que concatenar capas codificadas por separado es válido).
+- Raleo por zoom: un punto por celda de `cell` unidades de tesela.
+"""
+from __future__ import annotations
+
+import math
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+EXTENT = 4096
+MAX_ZOOM = 22
+WEB_MERCATOR_M = 40_075_016.685578488  # circunferencia ecuatorial (m)
+
+# (x, y, propiedades) en coordenadas de tesela
+TileFeature = Tuple[int, int, Dict[str, Any]]
+
+
+# ---------- teselas ----------
+def check_tile(z: int, x: int, y: int) -> None:
+    if not (0 <= z <= MAX_ZOOM):
+        raise ValueError(f"z debe estar entre 0 y {MAX_ZOOM}")
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError("x/y fuera de rango para el zoom")
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: int = 0, extent: int = EXTENT) -> Tuple[float, float, float, float]:
+    """(min_lng, min_lat, max_lng, max_lat) de la tesela, ampliada `buffer` unidades por lado."""
+    n = float(1 << z)
+    pad = buffer / float(extent)
+
+    def lng(tx: float) -> float:
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty: float) -> float:
+        ty = min(max(ty, 0.0), n)
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * ty / n))))
+
+    return (
+        max(lng(x - pad), -180.0),
+        lat(y + 1 + pad),
+        min(lng(x + 1 + pad), 180.0),
+        lat(y - pad),
+    )
+
+
+def tile_coords(lng: float, lat: float, z: int, x: int, y: int, extent: int = EXTENT) -> Tuple[int, int]:
+    """lng/lat -> coordenadas enteras dentro de la tesela (0..extent, y hacia abajo)."""
+    n = float(1 << z)
+    lat = min(max(lat, -85.05112878), 85.05112878)
+    wx = (lng + 180.0) / 360.0 * n
+    wy = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return int(round((wx - x) * extent)), int(round((wy - y) * extent))
+
+
+def tile_size_m(z: int) -> float:
+    """Ancho de una tesela en metros Web Mercator."""
+    return WEB_MERCATOR_M / (1 << z)
+
+
+def thin(features: Iterable[Tuple[int, int, Any, Dict[str, Any]]], cell: int) -> List[TileFeature]:
+    """
+    Un punto por celda de `cell` unidades: queda el de mayor `rank` (p.ej. el
+    más reciente) y se agrega la propiedad n = puntos agrupados.
+    Entrada: (x, y, rank, props).
+    """
+    if cell <= 1:
+        return [(x, y, {**props, "n": 1}) for x, y, _, props in features]
+    best: Dict[Tuple[int, int], List[Any]] = {}
+    for x, y, rank, props in features:
+        key = (x // cell, y // cell)
+        cur = best.get(key)
+        if cur is None:
+            best[key] = [x, y, rank, props, 1]
+            continue
+        cur[4] += 1
+        if rank is not None and (cur[2] is None or rank > cur[2]):
+            cur[0], cur[1], cur[2], cur[3] = x, y, rank, props
+    return [(x, y, {**props, "n": n}) for x, y, _, props, n in best.values()]
+
+
+# ---------- protobuf ----------
+def _varint(v: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = v & 0x7F
+        v >>= 7
+        if v:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _zigzag(v: int) -> int:
+    return (v << 1) ^ (v >> 63)
+
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _bytes_field(field: int, data: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed(field: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _value(v: Any) -> bytes:
+    """Tile.Value: string=1, double=3, sint64=6, bool=7."""
+    if isinstance(v, bool):
+        return _key(7, 0) + _varint(int(v))
+    if isinstance(v, int):
+        return _key(6, 0) + _varint(_zigzag(v) & 0xFFFFFFFFFFFFFFFF)
+    if isinstance(v, float):
+        return _key(3, 1) + struct.pack("<d", v)
+    return _bytes_field(1, str(v).encode("utf-8"))
+
+
+def encode_layer(
+    name: str,
+    features: Iterable[TileFeature],
+    extent: int = EXTENT,
+    id_prop: Optional[str] = None,
+) -> bytes:
+    """Codifica una capa de puntos como mensaje Tile (una sola capa). Propiedades None se omiten."""
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    feats: List[bytes] = []
+    for x, y, props in features:
+        tags: List[int] = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            ki = keys.setdefault(k, len(keys))
+            vi = values.setdefault((type(v), v), len(values))
+            tags += (ki, vi)
+        body = b""
+        fid = props.get(id_prop) if id_prop else None
+        if isinstance(fid, int) and fid >= 0:
+            body += _key(1, 0) + _varint(fid)
+        if tags:
+            body += _packed(2, tags)
+        body += _key(3, 0) + _varint(1)  # POINT
+        body += _packed(4, [9, _zigzag(x) & 0xFFFFFFFF, _zigzag(y) & 0xFFFFFFFF])  # MoveTo(1)
+        feats.append(_bytes_field(2, body))
+    if not feats:
+        return b""
+    layer = _key(15, 0) + _varint(2) + _bytes_field(1, name.encode("utf-8"))
+    layer += b"".join(feats)
+    layer += b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+    layer += b"".join(_bytes_field(4, _value(v)) for _, v in values)
+    layer += _key(5, 0) + _varint(extent)
+    return _bytes_field(3, layer)
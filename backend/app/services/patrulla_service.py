@@ -5,6 +5,8 @@ from typing import Any, Dict, List, Optional
 from sqlalchemy import text
 from flask import current_app
 
+from app.core.db.keyset import count_mode, decode_cursor, explain_sql, next_cursor, plan_rows
+
 
 class PatrullaService:
     """
@@ -39,35 +41,62 @@ class PatrullaService:
         page: int = 1,
         size: int = 10,
         q: str = "",
+        after: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> Dict[str, Any]:
+        """
+        Orden id DESC. after = cursor 'next' de la página anterior (keyset,
+        WHERE id < :after; page se ignora); sin after, OFFSET como antes.
+        count: exact (defecto con page) | estimate | none (defecto con after).
+        """
         page = max(int(page or 1), 1)
         size = max(min(int(size or 10), 200), 1)
-        off = (page - 1) * size
+        count = count_mode(count, "none" if after else "exact")
 
-        params = {}
-        where = ""
+        params: Dict[str, Any] = {}
+        conds: List[str] = []
         if q:
-            where = "WHERE (LOWER(codigo) LIKE :q OR LOWER(alias) LIKE :q OR LOWER(placa) LIKE :q)"
+            conds.append("(LOWER(codigo) LIKE :q OR LOWER(alias) LIKE :q OR LOWER(placa) LIKE :q)")
             params["q"] = f"%{q.lower()}%"
+        where = f"WHERE {' AND '.join(conds)}" if conds else ""
+
+        page_conds = list(conds)
+        off = (page - 1) * size
+        if after:
+            (params["after_id"],) = decode_cursor(after, (int,))
+            page_conds.append("id < :after_id")
+            off = 0
+        page_where = f"WHERE {' AND '.join(page_conds)}" if page_conds else ""
 
-        sql_count = f"SELECT COUNT(*) FROM patrulla {where};"
         sql_rows = f"""
         SELECT id, codigo, alias, placa, is_activa, created_at
         FROM patrulla
-        {where}
+        {page_where}
         ORDER BY id DESC
         LIMIT :size OFFSET :off;
         """
 
+        total: Optional[int] = None
         with self._engine().begin() as cx:
-            total = cx.execute(text(sql_count), params).scalar() or 0
+            if count == "exact":
+                total = cx.execute(text(f"SELECT COUNT(*) FROM patrulla {where}"), params).scalar() or 0
+            elif count == "estimate":
+                plan = cx.execute(text(explain_sql(f"SELECT 1 FROM patrulla {where}")), params).scalar()
+                total = plan_rows(plan)
             rows = cx.execute(
                 text(sql_rows),
-                {**params, "size": size, "off": off},
+                {**params, "size": size + 1, "off": off},
             ).mappings().all()
 
-        items = [dict(r) for r in rows]
-        return {"items": items, "page": page, "size": size, "total": total}
+        items = [dict(r) for r in rows[:size]]
+        return {
+            "items": items,
+            "page": None if after else page,
+            "size": size,
+            "total": total,
+            "count": count,
+            "next": next_cursor(rows, size, lambda r: (r["id"],)),
+        }
 
     # -------- get ----------
     def get(self, pid: int) -> Optional[Dict[str, Any]]:
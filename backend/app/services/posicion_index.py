@@ -0,0 +1,368 @@
+# backend/app/services/posicion_index.py
+"""
+Índice espacial en memoria (grilla uniforme) de la posición vigente de cada
+patrulla, por worker.
+
+- Se precarga al arrancar desde public.patrulla_posicion_actual y se actualiza
+  en cada ingesta exitosa de este proceso (crear, lote, flush write-behind).
+- Lo que ingieren otros workers llega por sincronización perezosa: al consultar,
+  si pasaron UBIC_GRID_SYNC_S se leen los cambios desde el cursor de la última
+  lectura (UbicacionRepository.cambios_desde: cambio_xid >= xmin de la snapshot,
+  orden de commit, incluye bajas). El cursor sale sólo de lecturas de la BD:
+  los upserts locales no lo mueven, así no se saltean filas de otros workers
+  que confirman tarde ni pings con hora de dispositivo atrasada. Cada
+  UBIC_GRID_FULL_SYNC_S se recarga completo (red de seguridad).
+- Consultas por bbox: se recorren sólo las celdas que toca el bbox (o todas
+  las entradas si el bbox cubre más celdas que patrullas hay).
+
+Las filas tienen la forma de UbicacionRepository.actuales():
+{id, patrulla_id, nombre, lat, lng, activo, updated_at}.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config.settings import Settings
+from app.services.geo_utils import M_PER_DEG_LAT, haversine_m
+
+Row = Dict[str, Any]
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    def __init__(
+        self,
+        load_changes: Callable[[int], Dict[str, Any]],
+        *,
+        cell_deg: float = 0.01,
+        sync_s: float = 2.0,
+        full_sync_s: float = 60.0,
+    ) -> None:
+        self._load_changes = load_changes  # cursor -> {cursor, reset, rows, bajas}
+        self.cell_deg = max(cell_deg, 1e-4)
+        self.sync_s = max(sync_s, 0.0)
+        self.full_sync_s = max(full_sync_s, self.sync_s)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._rows: Dict[int, Row] = {}
+        self._cell_of: Dict[int, Cell] = {}
+        self._cells: Dict[Cell, Set[int]] = {}
+        self._cursor = 0  # xmin de la última lectura de la BD (0 = recarga completa)
+        self._latest: Optional[datetime] = None  # updated_at más nuevo aplicado (informativo)
+        self._warm = False
+        self._last_sync = 0.0
+        self._last_full = 0.0
+        self._ediciones: Optional[int] = None  # último contador de ediciones visto (catch_up)
+        self._synced_for: Optional[str] = None  # último token de sync_for() cumplido
+        self.version = 0  # cambia con cada posición aplicada (cachés derivados, p.ej. clusters)
+
+    # --- grilla ---
+    def _cell(self, lng: float, lat: float) -> Cell:
+        return (math.floor(lng / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def _put(self, row: Row) -> None:
+        pid = int(row["patrulla_id"])
+        cell = self._cell(float(row["lng"]), float(row["lat"]))
+        old = self._cell_of.get(pid)
+        if old is not None and old != cell:
+            bucket = self._cells.get(old)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._cells[old]
+        self._cells.setdefault(cell, set()).add(pid)
+        self._cell_of[pid] = cell
+        self._rows[pid] = row
+        self.version += 1
+        ts = row.get("updated_at")
+        if ts is not None and (self._latest is None or ts > self._latest):
+            self._latest = ts
+
+    def _drop(self, pid: int) -> None:
+        cell = self._cell_of.pop(pid, None)
+        self._rows.pop(pid, None)
+        if cell is not None:
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._cells[cell]
+            self.version += 1
+
+    # --- escrituras ---
+    def upsert(self, row: Row) -> None:
+        """Aplica una posición; se ignora si es más vieja que la vigente (igual que el upsert SQL)."""
+        if row.get("patrulla_id") is None:
+            return
+        with self._lock:
+            cur = self._rows.get(int(row["patrulla_id"]))
+            if cur is not None and cur.get("updated_at") and row.get("updated_at") \
+                    and row["updated_at"] < cur["updated_at"]:
+                return
+            self._put(dict(row))
+
+    def upsert_many(self, rows: Iterable[Row]) -> None:
+        with self._lock:
+            for row in rows:
+                self.upsert(row)
+
+    def invalidate(self) -> None:
+        """Fuerza una recarga completa en la próxima consulta (p.ej. tras un DELETE)."""
+        self._last_full = -math.inf
+        self._last_sync = 0.0
+        self._synced_for = None
+
+    def catch_up(self, ediciones: Optional[int] = None) -> None:
+        """
+        Adelanta la sincronización: la BD tiene algo que el índice no vio (aviso
+        de otro worker). Ediciones nuevas -> recarga completa; si no, incremental.
+        """
+        if ediciones is not None and ediciones != self._ediciones:
+            self._ediciones = ediciones
+            self._last_full = -math.inf
+        self._last_sync = 0.0
+
+    # --- sincronización con la BD ---
+    def warm(self) -> int:
+        return self._apply(self._load_changes(0))
+
+    def _apply(self, res: Dict[str, Any]) -> int:
+        """Aplica un resultado de load_changes: reset = reemplaza todo; si no, upserts y bajas."""
+        now = time.monotonic()
+        with self._lock:
+            if res["reset"]:
+                self._rows.clear()
+                self._cell_of.clear()
+                self._cells.clear()
+                self._latest = None
+                self.version += 1
+                for row in res["rows"]:
+                    if row.get("patrulla_id") is not None:
+                        self._put(dict(row))
+                self._warm = True
+                self._last_full = now
+            else:
+                self.upsert_many(res["rows"])
+                for pid in res.get("bajas") or ():
+                    self._drop(int(pid))
+            self._cursor = int(res["cursor"])
+            self._last_sync = now
+            return len(self._rows)
+
+    def _sync_locked(self) -> bool:
+        """Una sincronización (completa o incremental); requiere _sync_lock. False si falló."""
+        now = time.monotonic()
+        try:
+            if not self._warm or now - self._last_full >= self.full_sync_s:
+                self.warm()
+            else:
+                self._apply(self._load_changes(self._cursor))
+            return True
+        except Exception as e:
+            if not self._warm:
+                raise
+            print(f"[ubicaciones] sync del índice en memoria falló (se sirve lo cacheado): {e}")
+            self._last_sync = now
+            return False
+
+    def sync_for(self, token: str, ediciones: Optional[int] = None) -> bool:
+        """
+        Deja el índice al menos tan nuevo como la BD cuando se leyó `token`
+        (watermark del ETag, leído antes de llamar): sincroniza esperando el
+        lock si hace falta, una vez por token. False si la lectura falló y lo
+        que hay puede ser más viejo que el token.
+        """
+        if self._warm and token == self._synced_for:
+            return True
+        with self._sync_lock:
+            if self._warm and token == self._synced_for:
+                return True
+            self.catch_up(ediciones)
+            try:
+                ok = self._sync_locked()
+            except Exception as e:
+                print(f"[ubicaciones] sync del índice en memoria falló: {e}")
+                return False
+            if ok:
+                self._synced_for = token
+            return ok
+
+    def _maybe_sync(self) -> None:
+        if self._warm and time.monotonic() - self._last_sync < self.sync_s:
+            return
+        if not self._sync_lock.acquire(blocking=not self._warm):
+            return  # otro hilo ya sincroniza; se sirve lo que hay
+        try:
+            if not self._warm or time.monotonic() - self._last_sync >= self.sync_s:
+                self._sync_locked()
+        finally:
+            self._sync_lock.release()
+
+    # --- lecturas ---
+    def query_bbox(
+        self,
+        min_lng: Optional[float] = None,
+        min_lat: Optional[float] = None,
+        max_lng: Optional[float] = None,
+        max_lat: Optional[float] = None,
+        *,
+        patrulla_id: Optional[int] = None,
+    ) -> List[Row]:
+        """Posiciones dentro del bbox (todas si no hay bbox), más recientes primero."""
+        self._maybe_sync()
+        with self._lock:
+            if patrulla_id is not None:
+                row = self._rows.get(int(patrulla_id))
+                cands: Iterable[Row] = [row] if row is not None else []
+            elif min_lng is None:
+                cands = list(self._rows.values())
+            else:
+                x0, y0 = self._cell(min_lng, min_lat)
+                x1, y1 = self._cell(max_lng, max_lat)
+                n_cells = (x1 - x0 + 1) * (y1 - y0 + 1)
+                if n_cells > len(self._cells):
+                    cands = list(self._rows.values())
+                else:
+                    cands = [
+                        self._rows[pid]
+                        for x in range(x0, x1 + 1)
+                        for y in range(y0, y1 + 1)
+                        for pid in self._cells.get((x, y), ())
+                    ]
+            if min_lng is not None:
+                cands = [
+                    r for r in cands
+                    if min_lng <= r["lng"] <= max_lng and min_lat <= r["lat"] <= max_lat
+                ]
+            out = [dict(r) for r in cands]
+        out.sort(key=lambda r: (r.get("updated_at") is not None, r.get("updated_at") or 0), reverse=True)
+        return out
+
+    def _ring(self, cx: int, cy: int, r: int) -> Iterable[Cell]:
+        """Celdas a distancia de Chebyshev exactamente r de (cx, cy)."""
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (x, cy - r)
+            yield (x, cy + r)
+        for y in range(cy - r + 1, cy + r):
+            yield (cx - r, y)
+            yield (cx + r, y)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        *,
+        max_m: Optional[float] = None,
+        activo: Optional[bool] = None,
+    ) -> List[Row]:
+        """
+        k unidades más cercanas (haversine), cada fila con distance_m.
+        Búsqueda por anillos de celdas alrededor del punto: se detiene cuando
+        las k mejores están más cerca que el borde ya cubierto; si el anillo
+        crece más que la grilla ocupada, pasa a recorrer todas las unidades.
+        """
+        self._maybe_sync()
+        heap: List[Tuple[float, int, int]] = []  # max-heap (-dist, orden, pid)
+        seq = 0
+
+        def consider(pid: int) -> None:
+            nonlocal seq
+            row = self._rows[pid]
+            if activo is not None and bool(row.get("activo")) != activo:
+                return
+            d = haversine_m(lat, lng, row["lat"], row["lng"])
+            if max_m is not None and d > max_m:
+                return
+            seq += 1
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, seq, pid))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, seq, pid))
+
+        with self._lock:
+            occupied = len(self._cells)
+            cx, cy = self._cell(lng, lat)
+            r, seen = 0, 0
+            while occupied:
+                if (2 * r + 1) ** 2 > 4 * occupied:
+                    heap, seq = [], 0
+                    for pid in self._rows:
+                        consider(pid)
+                    break
+                for cell in self._ring(cx, cy, r):
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        seen += 1
+                        for pid in bucket:
+                            consider(pid)
+                # distancia mínima garantizada hasta lo no visitado (lng encoge con la latitud)
+                lat_edge = min(abs(lat) + (r + 1) * self.cell_deg, 89.0)
+                covered_m = r * self.cell_deg * M_PER_DEG_LAT * math.cos(math.radians(lat_edge))
+                if len(heap) >= k and -heap[0][0] <= covered_m:
+                    break
+                if max_m is not None and covered_m >= max_m:
+                    break
+                if seen >= occupied:
+                    break
+                r += 1
+            out = [{**self._rows[pid], "distance_m": -neg} for neg, _, pid in heap]
+        out.sort(key=lambda row: row["distance_m"])
+        return out
+
+    @property
+    def warm_ready(self) -> bool:
+        return self._warm
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "warm": self._warm,
+                "units": len(self._rows),
+                "cells": len(self._cells),
+                "cell_deg": self.cell_deg,
+                "cursor": self._cursor,
+                "latest": self._latest.isoformat() if self._latest else None,
+            }
+
+
+# ---------- singleton por proceso ----------
+_index: Optional[GridIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_posicion_index() -> Optional[GridIndex]:
+    """Índice del proceso (None si UBIC_GRID_ENABLED=false)."""
+    global _index
+    if not Settings.UBIC_GRID_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from app.repositories.ubicacion_repository import UbicacionRepository
+
+                repo = UbicacionRepository()
+                _index = GridIndex(
+                    repo.cambios_desde,
+                    cell_deg=Settings.UBIC_GRID_CELL_DEG,
+                    sync_s=Settings.UBIC_GRID_SYNC_S,
+                    full_sync_s=Settings.UBIC_GRID_FULL_SYNC_S,
+                )
+    return _index
+
+
+def rows_from_batch(rows: Iterable[tuple]) -> List[Row]:
+    """Filas de crear_batch (nombre, lat, lng, activo, updated_at, patrulla_id) -> filas del índice."""
+    return [
+        {"id": None, "patrulla_id": pid, "nombre": n, "lat": lat, "lng": lng, "activo": act, "updated_at": ts}
+        for n, lat, lng, act, ts, pid in rows
+        if pid is not None
+    ]
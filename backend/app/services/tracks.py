@@ -0,0 +1,166 @@
+# backend/app/services/tracks.py
+"""
+Recorridos por patrulla simplificados por zoom (Douglas–Peucker multi-resolución).
+
+Una sola pasada de Douglas–Peucker con tolerancia 0 asigna a cada vértice su
+"importancia": la distancia (m) a la que DP lo conservaría, acotada por la de
+su padre para que los niveles queden anidados. Con eso, simplificar a
+cualquier tolerancia es filtrar importancia > tolerancia, sin recalcular; un
+recorrido precalculado sirve para todos los zooms.
+
+La tolerancia sale del zoom: metros por píxel en la latitud del recorrido
+por UBIC_TRACK_TOL_PX.
+
+Los recorridos de ventanas cerradas (turnos terminados) se guardan en una
+caché LRU por worker; las ventanas abiertas se calculan en cada request.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.services.geo_utils import M_PER_DEG_LAT
+
+# metros por píxel en el ecuador a zoom 0 (tesela de 256 px)
+M_PER_PX_Z0 = 156_543.03392804097
+
+# (lng, lat, ts)
+TrackPoint = Tuple[float, float, datetime]
+
+
+def tolerance_m(zoom: float, lat: float, px: float = 1.0) -> float:
+    return M_PER_PX_Z0 * math.cos(math.radians(lat)) / (2.0 ** zoom) * px
+
+
+def importances(xy: Sequence[Tuple[float, float]]) -> List[float]:
+    """Importancia DP de cada vértice (extremos = inf). xy en metros."""
+    n = len(xy)
+    imp = [0.0] * n
+    if n == 0:
+        return imp
+    imp[0] = imp[-1] = math.inf
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j - i < 2:
+            continue
+        ax, ay = xy[i]
+        bx, by = xy[j]
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        best, k = -1.0, i + 1
+        for m in range(i + 1, j):
+            px, py = xy[m]
+            if seg2 == 0.0:
+                d = math.hypot(px - ax, py - ay)
+            else:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / seg2))
+                d = math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+            if d > best:
+                best, k = d, m
+        imp[k] = min(best, parent)
+        stack.append((i, k, imp[k]))
+        stack.append((k, j, imp[k]))
+    return imp
+
+
+class Track:
+    """Recorrido partido en tramos (cortes por huecos sin pings) con importancias precalculadas."""
+
+    def __init__(self, points: Sequence[TrackPoint], gap_s: float = 300.0) -> None:
+        self.raw_points = len(points)
+        self.lat_ref = (sum(p[1] for p in points) / len(points)) if points else 0.0
+        kx = M_PER_DEG_LAT * math.cos(math.radians(self.lat_ref))
+        self.segments: List[List[Tuple[float, float, int, float]]] = []  # (lng, lat, epoch, imp)
+        tramo: List[TrackPoint] = []
+        for p in points:
+            if tramo and gap_s > 0 and (p[2] - tramo[-1][2]).total_seconds() > gap_s:
+                self._add(tramo, kx)
+                tramo = []
+            tramo.append(p)
+        self._add(tramo, kx)
+
+    def _add(self, tramo: Sequence[TrackPoint], kx: float) -> None:
+        if not tramo:
+            return
+        imp = importances([(p[0] * kx, p[1] * M_PER_DEG_LAT) for p in tramo])
+        self.segments.append([
+            (p[0], p[1], int(p[2].timestamp()), w) for p, w in zip(tramo, imp)
+        ])
+
+    def at_tolerance(self, tol_m: float) -> Tuple[List[List[List[float]]], List[List[int]]]:
+        """(coordenadas por tramo, epoch por vértice) conservando importancia > tol_m."""
+        coords, times = [], []
+        for seg in self.segments:
+            kept = [v for v in seg if v[3] > tol_m]
+            coords.append([[v[0], v[1]] for v in kept])
+            times.append([v[2] for v in kept])
+        return coords, times
+
+
+class TrackCache:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(max_entries, 0)
+        self._data: "OrderedDict[Hashable, Track]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Track]:
+        with self._lock:
+            track = self._data.get(key)
+            if track is not None:
+                self._data.move_to_end(key)
+            return track
+
+    def set(self, key: Hashable, track: Track) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._data[key] = track
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def track_feature(
+    track: Track,
+    zoom: Optional[float],
+    *,
+    tol_px: float = 1.0,
+    properties: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """GeoJSON Feature (LineString o MultiLineString) con properties.times alineado a los vértices."""
+    tol = tolerance_m(zoom, track.lat_ref, tol_px) if zoom is not None else 0.0
+    coords, times = track.at_tolerance(tol if zoom is not None else -1.0)  # sin zoom: todo
+    if len(coords) == 1:
+        geometry = {"type": "LineString", "coordinates": coords[0]}
+        times_out: Any = times[0]
+    else:
+        geometry = {"type": "MultiLineString", "coordinates": coords}
+        times_out = times
+    return {
+        "type": "Feature",
+        "geometry": geometry,
+        "properties": {
+            **(properties or {}),
+            "zoom": zoom,
+            "tolerance_m": round(tol, 2),
+            "points_raw": track.raw_points,
+            "points": sum(len(c) for c in coords),
+            "times": times_out,  # epoch (s) por vértice
+        },
+    }
+
+
+def iso(ts: Optional[datetime]) -> Optional[str]:
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -0,0 +1,238 @@
+# backend/app/services/ubicacion_buffer.py
+"""
+Buffer write-behind para la ingesta de pings (opcional, Settings.UBIC_WRITE_BEHIND).
+
+POST /api/ubicaciones encola la fila ya validada y responde de inmediato; un
+hilo por proceso la escribe con COPY en micro-lotes, cuando se juntan
+UBIC_WB_BATCH_ROWS filas o pasan UBIC_WB_MAX_DELAY_MS desde la primera
+pendiente. Un COMMIT (un fsync) por lote en lugar de uno por ping.
+
+- Cola acotada (UBIC_WB_QUEUE_MAX): si está llena, put() espera hasta
+  UBIC_WB_PUT_TIMEOUT_MS y luego lanza BufferFullError (el endpoint responde 503).
+- Un lote que falla se reintenta una vez; sólo se reintenta la escritura
+  (flush_fn). Los efectos posteriores al commit (after_flush: índice, avisos,
+  geocercas) corren una vez y sus errores sólo se registran: reintentarlos
+  junto con el COPY duplicaría las filas.
+- Apagado: shutdown_write_buffer() vacía la cola antes de salir; se llama desde
+  gunicorn (worker_exit en gunicorn.conf.py) y, como respaldo, con atexit.
+  Desde que empieza, get_write_buffer() devuelve None y la ingesta vuelve al
+  INSERT síncrono.
+"""
+from __future__ import annotations
+
+import atexit
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.config.settings import Settings
+
+_STOP = object()
+
+
+class BufferFullError(Exception):
+    """La cola write-behind está llena (backpressure)."""
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        flush_fn: Callable[[Sequence[Any]], Any],
+        *,
+        after_flush: Optional[Callable[[Sequence[Any]], Any]] = None,
+        batch_rows: int = 200,
+        max_delay: float = 0.25,
+        queue_max: int = 10000,
+        put_timeout: float = 0.05,
+        name: str = "ubic-write-behind",
+    ) -> None:
+        self._flush_fn = flush_fn
+        self._after_flush = after_flush
+        self.batch_rows = max(batch_rows, 1)
+        self.max_delay = max(max_delay, 0.001)
+        self.put_timeout = max(put_timeout, 0.0)
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(queue_max, 1))
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counters: Dict[str, float] = {
+            "enqueued_rows": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "dropped_rows": 0,       # lote perdido tras reintento fallido
+            "rejected_full": 0,      # put() rechazado por cola llena
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    # --- productor ---
+    def put(self, row: Any) -> None:
+        if self._closed:
+            raise BufferFullError("buffer cerrado")
+        try:
+            self._q.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected_full"] += 1
+            raise BufferFullError("cola de ingesta llena, reintente")
+        with self._lock:
+            self._counters["enqueued_rows"] += 1
+
+    # --- consumidor ---
+    def _run(self) -> None:
+        batch: List[Any] = []
+        deadline: Optional[float] = None
+        while True:
+            timeout = self.max_delay if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                # drenar lo que quede y salir
+                while True:
+                    try:
+                        rest = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if rest is not _STOP:
+                        batch.append(rest)
+                for i in range(0, len(batch), self.batch_rows):
+                    self._flush(batch[i:i + self.batch_rows])
+                return
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.max_delay
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_rows or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch, deadline = [], None
+
+    def _flush(self, batch: List[Any]) -> None:
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        try:
+            self._flush_fn(batch)
+        except Exception as e:
+            # un reintento corto (p.ej. conexión reciclada); luego se descarta
+            time.sleep(0.2)
+            try:
+                self._flush_fn(batch)
+            except Exception as e2:
+                print(f"[ubicaciones] write-behind: se descartan {len(batch)} filas: {e} / {e2}")
+                with self._lock:
+                    self._counters["dropped_rows"] += len(batch)
+                return
+        ms = (time.perf_counter() - t0) * 1000.0
+        if self._after_flush is not None:
+            try:
+                self._after_flush(batch)
+            except Exception as e:
+                # el lote ya está escrito: no se reintenta
+                print(f"[ubicaciones] write-behind: efectos tras escribir {len(batch)} filas fallaron: {e}")
+        with self._lock:
+            c = self._counters
+            c["flushed_rows"] += len(batch)
+            c["flushes"] += 1
+            c["last_flush_ms"] = ms
+            c["max_flush_ms"] = max(c["max_flush_ms"], ms)
+            c["total_flush_ms"] += ms
+
+    # --- ciclo de vida / métricas ---
+    def close(self, timeout: float = 30.0) -> None:
+        """Deja de aceptar filas y espera a que se escriba todo lo pendiente."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+        flushes = int(c.pop("flushes"))
+        total = c.pop("total_flush_ms")
+        return {
+            "enabled": True,
+            "queue_depth": self._q.qsize(),
+            "queue_max": self._q.maxsize,
+            "flushes": flushes,
+            "avg_flush_ms": round(total / flushes, 3) if flushes else 0.0,
+            "last_flush_ms": round(c.pop("last_flush_ms"), 3),
+            "max_flush_ms": round(c.pop("max_flush_ms"), 3),
+            **{k: int(v) for k, v in c.items()},
+        }
+
+
+# ---------- singleton por proceso ----------
+_buffer: Optional[WriteBehindBuffer] = None
+_buffer_lock = threading.Lock()
+_closing = False
+
+
+def get_write_buffer() -> Optional[WriteBehindBuffer]:
+    """
+    Buffer del proceso si UBIC_WRITE_BEHIND está activo (None si no).
+    Se crea en el primer uso, es decir ya dentro del worker (post-fork).
+    None también desde que empezó shutdown_write_buffer().
+    """
+    global _buffer
+    if not Settings.UBIC_WRITE_BEHIND or _closing:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _closing:
+                return None
+            if _buffer is None:
+                from app.repositories.ubicacion_repository import UbicacionRepository
+                from app.services.geocerca_engine import pings_from_batch, submit_pings
+                from app.services.posicion_index import get_posicion_index, rows_from_batch
+                from app.services.ubicacion_eventos import PING, publicar, resumen_lote
+
+                repo = UbicacionRepository()
+
+                def _after_flush(rows: Sequence[Any]) -> None:
+                    index = get_posicion_index()
+                    if index is not None:
+                        index.upsert_many(rows_from_batch(rows))
+                    publicar(PING, *resumen_lote(rows))
+                    submit_pings(pings_from_batch(rows))
+
+                _buffer = WriteBehindBuffer(
+                    repo.crear_batch,
+                    after_flush=_after_flush,
+                    batch_rows=Settings.UBIC_WB_BATCH_ROWS,
+                    max_delay=Settings.UBIC_WB_MAX_DELAY_MS / 1000.0,
+                    queue_max=Settings.UBIC_WB_QUEUE_MAX,
+                    put_timeout=Settings.UBIC_WB_PUT_TIMEOUT_MS / 1000.0,
+                )
+    return _buffer
+
+
+def shutdown_write_buffer(timeout: float = 30.0) -> None:
+    """Vacía y detiene el buffer del proceso (idempotente)."""
+    global _buffer, _closing
+    with _buffer_lock:
+        _closing = True
+        buf = _buffer
+    if buf is not None:
+        buf.close(timeout)
+    with _buffer_lock:
+        _buffer = None
+
+
+def write_buffer_stats() -> Dict[str, Any]:
+    buf = _buffer
+    if buf is None:
+        return {"enabled": bool(Settings.UBIC_WRITE_BEHIND), "queue_depth": 0}
+    return buf.stats()
+
+
+atexit.register(shutdown_write_buffer)
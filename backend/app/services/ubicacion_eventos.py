@@ -0,0 +1,282 @@
+# backend/app/services/ubicacion_eventos.py
+"""
+Bus de cambios de ubicaciones entre procesos (LISTEN/NOTIFY de Postgres).
+También lleva las invalidaciones de la caché de asignaciones (ver
+asignacion_cache.py) y los refrescos de capacidades del esquema (ver
+views/api.py), que tienen que llegar a todos los workers.
+
+Cada escritura (ping, lote, edición, borrado, retención) hace pg_notify en su
+misma transacción: el aviso sale sólo si hay commit, y llega a todos los
+workers de todos los nodos que escuchan el canal. Un hilo por worker mantiene
+una conexión dedicada con LISTEN y publica lo que llega en un bus en memoria.
+Las escrituras del propio proceso se publican directo (su eco por NOTIFY se
+descarta por origen).
+
+Suscriptores (ver ubicacion_service._on_cambio): el hub SSE, el watermark del
+ETag, el índice en memoria y las cachés de teselas/recorridos.
+
+Mientras la conexión está caída se pierden avisos: al reconectar se publica un
+cambio 'resync' y cada suscriptor se pone al día desde la BD (recarga del
+índice, delta del hub desde su cursor, watermark nuevo).
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.config.settings import Settings, build_psycopg_conninfo
+
+PING = "ping"  # posiciones nuevas (crear / lote / write-behind)
+EDICION = "edicion"  # edición, borrado o retención del historial
+RESYNC = "resync"  # local: se reconectó el LISTEN y pudo perderse algo
+ASIGNACION = "asignacion"  # inicio/fin de asignación (uid/email) o cambio de patrulla (todas)
+ESQUEMA = "esquema"  # POST /api/schema-caps/refresh: releer capacidades
+
+# más patrullas que esto -> el aviso va sin lista (el payload de NOTIFY es < 8000 bytes)
+MAX_PATRULLAS = 200
+
+SQL_NOTIFY = "SELECT pg_notify(%s, %s)"
+
+_origin: Tuple[int, str] = (0, "")
+
+
+def origin() -> str:
+    """Id de este proceso en los avisos (se recalcula tras un fork)."""
+    global _origin
+    pid = os.getpid()
+    if _origin[0] != pid:
+        _origin = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:6]}")
+    return _origin[1]
+
+
+class Cambio(NamedTuple):
+    kind: str
+    patrullas: Optional[Tuple[int, ...]]  # None = no se sabe cuáles
+    ts: Optional[datetime]
+    origin: str
+    uid: Optional[int] = None
+    email: str = ""
+
+    @property
+    def remoto(self) -> bool:
+        return self.origin != origin()
+
+
+def payload(
+    kind: str,
+    patrullas: Optional[Iterable[int]] = None,
+    ts: Optional[datetime] = None,
+    *,
+    uid: Optional[int] = None,
+    email: str = "",
+) -> str:
+    msg: Dict[str, Any] = {"o": origin(), "k": kind}
+    if patrullas is not None:
+        pids = sorted(set(patrullas))
+        if len(pids) <= MAX_PATRULLAS:
+            msg["p"] = pids
+    if ts is not None:
+        msg["t"] = ts.isoformat()
+    if uid is not None:
+        msg["u"] = uid
+    if email:
+        msg["e"] = email
+    return json.dumps(msg, separators=(",", ":"))
+
+
+def parse(raw: str) -> Optional[Cambio]:
+    """Payload de NOTIFY -> Cambio (None si no es nuestro formato)."""
+    try:
+        msg = json.loads(raw)
+        pids = msg.get("p")
+        return Cambio(
+            str(msg["k"]),
+            tuple(int(p) for p in pids) if pids is not None else None,
+            datetime.fromisoformat(msg["t"]) if msg.get("t") else None,
+            str(msg["o"]),
+            int(msg["u"]) if msg.get("u") is not None else None,
+            str(msg.get("e") or ""),
+        )
+    except Exception:
+        return None
+
+
+def resumen_lote(rows: Sequence[Tuple[Any, ...]]) -> Tuple[List[int], Optional[datetime]]:
+    """Filas (nombre, lat, lng, activo, ts, patrulla_id) -> (patrullas, ts más nuevo)."""
+    pids = {r[5] for r in rows if r[5] is not None}
+    return sorted(pids), max((r[4] for r in rows), default=None)
+
+
+def notify(cur: Any, kind: str, patrullas: Optional[Iterable[int]] = None, ts: Optional[datetime] = None) -> None:
+    """pg_notify en la transacción del cursor: sale con el commit (o nunca)."""
+    if Settings.UBIC_NOTIFY_ENABLED:
+        cur.execute(SQL_NOTIFY, (Settings.UBIC_NOTIFY_CHANNEL, payload(kind, patrullas, ts)))
+
+
+# ---------- bus en memoria (por proceso) ----------
+class CambiosBus:
+    def __init__(self) -> None:
+        self._handlers: List[Callable[[Cambio], None]] = []
+
+    def subscribe(self, handler: Callable[[Cambio], None]) -> None:
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def publish(self, cambio: Cambio) -> None:
+        for handler in list(self._handlers):
+            try:
+                handler(cambio)
+            except Exception as e:
+                print(f"[ubicaciones] suscriptor de cambios falló ({cambio.kind}): {e}")
+
+
+bus = CambiosBus()
+
+
+def publicar(
+    kind: str,
+    patrullas: Optional[Iterable[int]] = None,
+    ts: Optional[datetime] = None,
+    *,
+    uid: Optional[int] = None,
+    email: str = "",
+) -> None:
+    """Publica en este proceso un cambio que escribió este proceso."""
+    pids = tuple(sorted(set(patrullas))) if patrullas is not None else None
+    bus.publish(Cambio(kind, pids, ts, origin(), uid, email))
+
+
+def anunciar(kind: str, *, uid: Optional[int] = None, email: str = "") -> None:
+    """
+    Para escrituras que no pasan por un cursor propio (asignaciones,
+    patrullas, esquema): publica en este proceso y avisa a los demás con un NOTIFY
+    en su propia transacción, después del commit de la escritura.
+    """
+    publicar(kind, uid=uid, email=email)
+    if not Settings.UBIC_NOTIFY_ENABLED:
+        return
+    try:
+        from app.core.db.pool import get_pool
+
+        with get_pool().connection() as conn:
+            conn.execute(SQL_NOTIFY, (Settings.UBIC_NOTIFY_CHANNEL, payload(kind, uid=uid, email=email)))
+    except Exception as e:
+        print(f"[ubicaciones] no se pudo avisar '{kind}' a los demás workers: {e}")
+
+
+# ---------- LISTEN: una conexión dedicada por worker ----------
+class NotifyListener:
+    def __init__(
+        self,
+        conninfo: str,
+        channel: str,
+        on_cambio: Callable[[Cambio], None],
+        *,
+        check_s: float = 10.0,
+        reconnect_max_s: float = 30.0,
+    ) -> None:
+        self._conninfo = conninfo
+        self.channel = channel
+        self._on_cambio = on_cambio
+        self.check_s = max(check_s, 0.5)
+        self.reconnect_max_s = max(reconnect_max_s, 1.0)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+
+    def _dispatch(self, n: Any) -> None:
+        cambio = parse(n.payload)
+        if cambio is not None and cambio.remoto:
+            self.received += 1
+            self._on_cambio(cambio)
+
+    def _listen(self) -> None:
+        import psycopg
+        from psycopg import sql
+
+        with psycopg.connect(self._conninfo, autocommit=True) as conn:
+            # avisos que lleguen durante el SELECT 1 de control también se despachan
+            conn.add_notify_handler(self._dispatch)
+            conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+            if self.reconnects:
+                # lo escrito mientras no se escuchaba: que todos relean de la BD
+                self._on_cambio(Cambio(RESYNC, None, None, origin()))
+            self.connected = True
+            while not self._stop.is_set():
+                for n in conn.notifies(timeout=self.check_s):
+                    self._dispatch(n)
+                conn.execute("SELECT 1")  # detecta una conexión muerta sin esperar al TCP
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                print(f"[ubicaciones] LISTEN {self.channel} caído, reintento en {delay:.0f}s: {e}")
+            was_connected, self.connected = self.connected, False
+            if was_connected:
+                delay = 1.0
+            self.reconnects += 1
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.reconnect_max_s)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ubic-listen", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "connected": self.connected,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+_listener: Optional[NotifyListener] = None
+_listener_lock = threading.Lock()
+
+
+def start_notify_listener() -> None:
+    """Arranca el LISTEN del proceso (idempotente). UBIC_NOTIFY_ENABLED=false lo desactiva."""
+    global _listener
+    if not Settings.UBIC_NOTIFY_ENABLED:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = NotifyListener(
+                build_psycopg_conninfo(Settings),
+                Settings.UBIC_NOTIFY_CHANNEL,
+                bus.publish,
+                check_s=Settings.UBIC_NOTIFY_CHECK_S,
+                reconnect_max_s=Settings.UBIC_NOTIFY_RECONNECT_MAX_S,
+            )
+        _listener.start()
+
+
+def shutdown_notify_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def notify_listener_stats() -> Dict[str, Any]:
+    return _listener.stats() if _listener is not None else {"connected": False}
+
+
+atexit.register(shutdown_notify_listener)
@@ -0,0 +1,72 @@
+# backend/app/services/ubicacion_mantenimiento.py
+"""
+Mantenimiento periódico del historial particionado (ver
+app/repositories/ubicacion_particiones.py): crea las particiones futuras y
+aplica la retención cada UBIC_PARTITION_MAINT_S segundos. De paso purga las
+lápidas del delta del mapa en vivo (UBIC_DELTA_TOMBSTONE_H).
+
+Un hilo daemon por proceso; entre workers se coordinan con un advisory lock,
+así que que corran varios no duplica trabajo.
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from typing import Any, Dict, Optional
+
+from app.config.settings import Settings
+from app.repositories.ubicacion_particiones import UbicacionParticiones
+from app.repositories.ubicacion_repository import UbicacionRepository
+from app.services.ubicacion_eventos import EDICION, publicar
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_lock = threading.Lock()
+_last: Dict[str, Any] = {}
+
+
+def _run(interval: float) -> None:
+    repo = UbicacionParticiones()
+    bajas = UbicacionRepository()
+    while not _stop.wait(interval):
+        try:
+            res = repo.mantenimiento()
+            _last.clear()
+            _last.update(res)
+            if res.get("created") or res.get("dropped") or res.get("detached"):
+                print(f"[ubicaciones] particiones: {res}")
+            if res.get("dropped") or res.get("detached") or res.get("default_purged"):
+                publicar(EDICION)  # los demás workers se enteran por NOTIFY
+        except Exception as e:
+            print(f"[ubicaciones] mantenimiento de particiones falló: {e}")
+        try:
+            bajas.purgar_bajas(Settings.UBIC_DELTA_TOMBSTONE_H)
+        except Exception as e:
+            print(f"[ubicaciones] purga de lápidas del delta falló: {e}")
+
+
+def start_partition_maintenance() -> None:
+    """Arranca el hilo (idempotente). UBIC_PARTITION_MAINT_S <= 0 lo desactiva."""
+    global _thread
+    interval = Settings.UBIC_PARTITION_MAINT_S
+    if interval <= 0:
+        return
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _stop.clear()
+        _thread = threading.Thread(
+            target=_run, args=(float(interval),), name="ubic-particiones", daemon=True
+        )
+        _thread.start()
+
+
+def stop_partition_maintenance() -> None:
+    _stop.set()
+
+
+def last_maintenance() -> Dict[str, Any]:
+    return dict(_last)
+
+
+atexit.register(stop_partition_maintenance)
@@ -1,12 +1,89 @@
 # backend/app/services/ubicacion_service.py
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
-from datetime import datetime
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import create_engine, text
 from flask import current_app
 
+from app.config.settings import Settings
+from app.core.db.keyset import count_mode
 from app.repositories.ubicacion_repository import UbicacionRepository
+from app.services.cluster import ClusterIndex
+from app.services.geocerca_engine import pings_from_batch, submit_pings
+from app.services.geo_utils import HAVERSINE_M_SQL, M_PER_DEG_LAT, deg_box
+from app.services.posicion_index import get_posicion_index, rows_from_batch
+from app.services.ubicacion_buffer import get_write_buffer, write_buffer_stats
+from app.services.tracks import Track, TrackCache, iso, track_feature
+from app.services.ubicacion_tiles import HIST_SETTLE, UbicacionTiles, tile_cache
+from app.services.ubicacion_eventos import (
+    EDICION,
+    PING,
+    RESYNC,
+    Cambio,
+    bus,
+    notify_listener_stats,
+    publicar,
+    resumen_lote,
+)
+from app.services.ubicacion_stream import StreamBusyError, get_position_hub, notify_positions
+from app.services.ubicacion_version import invalidate_watermark
+
+
+# Máximo de pings por request en /api/ubicaciones/batch
+BATCH_MAX_ITEMS = 1000
+
+# Tolerancia al reloj del dispositivo: un ts más adelantado que esto se rechaza
+# (fijaría la posición vigente, que no retrocede ante pings más viejos)
+BATCH_TS_MAX_FUTURE = timedelta(minutes=5)
+
+# Radio máximo para filtros por distancia (metros)
+MAX_RADIUS_M = 200_000.0
+
+# /api/ubicaciones/nearest: k por defecto y máximo
+NEAREST_K_DEFAULT = 5
+NEAREST_K_MAX = 100
+
+# /api/ubicaciones/heatmap: tamaño de celda (metros)
+HEATMAP_CELL_M_DEFAULT = 250.0
+HEATMAP_CELL_M_MIN = 10.0
+
+# Índice de clusters de la posición vigente (por worker), reconstruido si el
+# índice en memoria cambió y pasaron UBIC_CLUSTER_REBUILD_S
+_live_clusters: Dict[str, Any] = {"version": None, "at": 0.0, "index": None}
+_live_clusters_lock = threading.Lock()
+
+# Recorridos de ventanas cerradas (turnos terminados), por worker
+track_cache = TrackCache(Settings.UBIC_TRACK_CACHE_MAX)
+
+
+def _on_cambio(cambio: Cambio) -> None:
+    """
+    Estado en memoria del worker al día con cada escritura, de este proceso o
+    de otro (LISTEN, ver ubicacion_eventos.py).
+    """
+    index = get_posicion_index()
+    if cambio.kind == PING:
+        # los pings locales ya se aplicaron con upsert; los remotos, en la próxima lectura
+        if cambio.remoto and index is not None:
+            index.catch_up()
+    elif cambio.kind in (EDICION, RESYNC):
+        # edición/borrado/retención o aviso perdido: cualquier cosa pudo cambiar
+        if index is not None:
+            index.invalidate()
+        tile_cache.clear()
+        track_cache.clear()
+    else:
+        return  # no es de ubicaciones (p.ej. asignaciones)
+    invalidate_watermark()
+    notify_positions()
+
+
+bus.subscribe(_on_cambio)
 
 
 class UbicacionService:
@@ -39,12 +116,105 @@ class UbicacionService:
         activo = bool(data.get("activo", True))
         return nombre, lat, lng, activo
 
+    def _clean_patrulla_id(self, value: Any) -> Optional[int]:
+        if value in (None, "", 0, "0"):
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError("patrulla_id inválido")
+
     # --- operaciones CRUD existentes ---
     def crear(self, data: Dict[str, Any]) -> Dict[str, Any]:
         nombre, lat, lng, activo = self._clean_payload(data)
-        row = self.repo.crear({"nombre": nombre, "lat": lat, "lng": lng, "activo": activo})
+        patrulla_id = self._clean_patrulla_id(data.get("patrulla_id"))
+
+        # write-behind: se encola y se escribe en el próximo micro-lote
+        # (lanza BufferFullError si la cola está llena)
+        buf = get_write_buffer()
+        if buf is not None:
+            ts = datetime.now(timezone.utc)
+            buf.put((nombre, lat, lng, activo, ts, patrulla_id))
+            return {
+                "queued": True,
+                "patrulla_id": patrulla_id,
+                "nombre": nombre,
+                "lat": lat,
+                "lng": lng,
+                "activo": activo,
+                "updated_at": ts,
+            }
+
+        row = self.repo.crear(
+            {"nombre": nombre, "lat": lat, "lng": lng, "activo": activo, "patrulla_id": patrulla_id}
+        )
+        index = get_posicion_index()
+        if index is not None:
+            index.upsert(row)
+        publicar(PING, [patrulla_id] if patrulla_id is not None else [], row.get("updated_at"))
+        submit_pings([(patrulla_id, row.get("updated_at"), lat, lng, row.get("id"))])
         return row
 
+    def ingest_stats(self) -> Dict[str, Any]:
+        return {**write_buffer_stats(), "notify": notify_listener_stats()}
+
+    def crear_batch(
+        self,
+        items: List[Any],
+        *,
+        nombre: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Valida todos los pings en una sola pasada y carga los válidos con COPY.
+        - nombre: valor por defecto para los items que no lo traen.
+        - patrulla_id: patrulla del lote (resuelta una vez por request).
+        - ts (opcional por item): hora del ping en el dispositivo (ISO8601;
+          sin zona horaria se toma como UTC); si no viene se usa la hora de
+          recepción. Más de BATCH_TS_MAX_FUTURE en el futuro se rechaza.
+        Devuelve {accepted, rejected, results:[{index, ok, msg?}]}.
+        """
+        if len(items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"máximo {BATCH_MAX_ITEMS} ubicaciones por lote")
+
+        pid = self._clean_patrulla_id(patrulla_id)
+        now = datetime.now(timezone.utc)
+        rows: List[Tuple[str, float, float, bool, datetime, Optional[int]]] = []
+        results: List[Dict[str, Any]] = []
+        for i, it in enumerate(items):
+            if not isinstance(it, dict):
+                results.append({"index": i, "ok": False, "msg": "item inválido"})
+                continue
+            if not (it.get("nombre") or "").strip() and nombre:
+                it = {**it, "nombre": nombre}
+            try:
+                n, lat, lng, activo = self._clean_payload(it)
+                ts = now
+                if it.get("ts"):
+                    try:
+                        ts = self._parse_dt(str(it["ts"]))
+                    except Exception:
+                        raise ValueError("ts inválido")
+                    if ts > now + BATCH_TS_MAX_FUTURE:
+                        raise ValueError("ts en el futuro")
+            except ValueError as ve:
+                results.append({"index": i, "ok": False, "msg": str(ve)})
+                continue
+            rows.append((n, lat, lng, activo, ts, pid))
+            results.append({"index": i, "ok": True})
+
+        accepted = self.repo.crear_batch(rows)
+        index = get_posicion_index()
+        if index is not None:
+            index.upsert_many(rows_from_batch(rows))
+        publicar(PING, *resumen_lote(rows))
+        submit_pings(pings_from_batch(rows))
+        return {
+            "accepted": accepted,
+            "rejected": len(items) - len(rows),
+            "results": results,
+        }
+
     def actualizar(self, ubic_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         nombre = data.get("nombre")
         lat = data.get("lat")
@@ -61,22 +231,107 @@ class UbicacionService:
                 raise ValueError("lng fuera de rango (-180..180)")
         if activo is not None:
             activo = bool(activo)
-        return self.repo.actualizar(
+        row = self.repo.actualizar(
             ubic_id,
             nombre=nombre,
             lat=lat,
             lng=lng,
             activo=activo,
         )
+        self._invalidate_index()
+        return row
 
     def eliminar(self, ubic_id: int) -> bool:
-        return self.repo.eliminar(ubic_id)
+        ok = self.repo.eliminar(ubic_id)
+        if ok:
+            self._invalidate_index()
+        return ok
+
+    def _invalidate_index(self) -> None:
+        # ediciones/borrados pueden cambiar la posición vigente: recarga completa
+        # (y cualquier tesela ya generada); ver _on_cambio
+        publicar(EDICION)
+
+    def warm_index(self) -> int:
+        """Precarga el índice en memoria (al arrancar). Devuelve cuántas unidades cargó."""
+        index = get_posicion_index()
+        return index.warm() if index is not None else 0
+
+    def _live_rows(self, box: Optional[Tuple[float, float, float, float]] = None,
+                   patrulla_id: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Posiciones vigentes desde el índice en memoria; None si no está disponible (-> SQL)."""
+        index = get_posicion_index()
+        if index is None:
+            return None
+        try:
+            if box:
+                return index.query_bbox(*box, patrulla_id=patrulla_id)
+            return index.query_bbox(patrulla_id=patrulla_id)
+        except Exception as e:
+            print(f"[ubicaciones] índice en memoria no disponible, se usa SQL: {e}")
+            return None
+
+    def _live_cluster_index(self) -> Optional[ClusterIndex]:
+        index = get_posicion_index()
+        if index is None:
+            return None
+        c = _live_clusters
+        if c["index"] is not None and time.monotonic() - c["at"] < Settings.UBIC_CLUSTER_REBUILD_S:
+            return c["index"]
+        with _live_clusters_lock:
+            if c["index"] is not None and time.monotonic() - c["at"] < Settings.UBIC_CLUSTER_REBUILD_S:
+                return c["index"]
+            rows = self._live_rows()
+            if rows is None:
+                return None
+            if c["index"] is None or c["version"] != index.version:
+                c["index"] = ClusterIndex(
+                    self._fc_from_rows(rows)["features"],
+                    max_zoom=Settings.UBIC_CLUSTER_MAX_ZOOM,
+                    radius_px=Settings.UBIC_CLUSTER_RADIUS_PX,
+                )
+                c["version"] = index.version
+            c["at"] = time.monotonic()
+            return c["index"]
 
     def obtener(self, ubic_id: int) -> Optional[Dict[str, Any]]:
         return self.repo.obtener(ubic_id)
 
-    def listar(self, page: int = 1, size: int = 100) -> Dict[str, Any]:
-        return self.repo.listar_paginado(page=page, size=size)
+    # --- teselas vectoriales ---
+    def tile(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        *,
+        capas: Optional[str] = None,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+    ) -> Tuple[bytes, float]:
+        """Tesela MVT (ver ubicacion_tiles). capas: 'posiciones', 'historial' o ambas separadas por coma."""
+        fechas = []
+        for nombre, val in (("desde", desde), ("hasta", hasta)):
+            try:
+                fechas.append(self._parse_dt(val) if val else None)
+            except ValueError:
+                raise ValueError(f"{nombre} inválido")
+        nombres = [c.strip() for c in (capas or "posiciones").split(",") if c.strip()]
+        return UbicacionTiles(self.repo, self._live_rows).tile(
+            z, x, y, capas=nombres, patrulla_id=patrulla_id, desde=fechas[0], hasta=fechas[1]
+        )
+
+    def listar(
+        self,
+        page: int = 1,
+        size: int = 100,
+        after: Optional[str] = None,
+        count: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Historial paginado; after = cursor keyset, count = exact|estimate|none (ver core/db/keyset.py)."""
+        return self.repo.listar_paginado(
+            page=page, size=size, after=after, count=count_mode(count, "estimate")
+        )
 
     def listar_bbox(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[Dict[str, Any]]:
         # validación ligera
@@ -86,19 +341,208 @@ class UbicacionService:
             raise ValueError("lng bbox fuera de rango")
         if min_lng > max_lng or min_lat > max_lat:
             raise ValueError("bbox inválido: min mayor que max")
+        rows = self._live_rows((min_lng, min_lat, max_lng, max_lat))
+        if rows is not None:
+            return rows
         return self.repo.listar_bbox(min_lng, min_lat, max_lng, max_lat)
 
+    def nearest(
+        self,
+        lat: Any,
+        lng: Any,
+        k: Any = NEAREST_K_DEFAULT,
+        max_km: Any = None,
+        activo: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        """Unidades más cercanas a (lat, lng) ordenadas por distancia (distance_m)."""
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            raise ValueError("lat/lng inválidos")
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            raise ValueError("lat/lng fuera de rango")
+        try:
+            k = int(k) if k not in (None, "") else NEAREST_K_DEFAULT
+        except (TypeError, ValueError):
+            raise ValueError("k inválido")
+        k = max(1, min(k, NEAREST_K_MAX))
+        max_m = None
+        if max_km not in (None, ""):
+            try:
+                max_m = float(max_km) * 1000.0
+            except (TypeError, ValueError):
+                raise ValueError("max_km inválido")
+            if not (0 < max_m <= MAX_RADIUS_M):
+                raise ValueError(f"max_km debe estar entre 0 y {MAX_RADIUS_M / 1000:.0f}")
+
+        index = get_posicion_index()
+        if index is not None:
+            try:
+                rows = index.nearest(lat, lng, k, max_m=max_m, activo=activo)
+            except Exception as e:
+                print(f"[ubicaciones] índice en memoria no disponible, se usa SQL: {e}")
+            else:
+                return [{**r, "distance_m": round(r["distance_m"], 1)} for r in rows]
+        rows = self.repo.cercanas(lat, lng, k, max_m=max_m, activo=activo)
+        return [{**r, "distance_m": round(r["distance_m"], 1)} for r in rows]
+
+    # --- recorrido simplificado ---
+    def track(
+        self,
+        *,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        zoom: Any = None,
+        asignacion_id: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Recorrido de una patrulla como LineString/MultiLineString simplificado
+        para `zoom` (sin zoom: todos los vértices). La ventana es un turno
+        (asignacion_id) o patrulla_id + desde/hasta (hasta por defecto: ahora).
+        None si el turno no existe.
+        """
+        if zoom not in (None, ""):
+            try:
+                zoom = float(zoom)
+            except (TypeError, ValueError):
+                raise ValueError("zoom inválido")
+            if not (0 <= zoom <= 22):
+                raise ValueError("zoom debe estar entre 0 y 22")
+        else:
+            zoom = None
+
+        now = datetime.now(timezone.utc)
+        if asignacion_id is not None:
+            asig = self.repo.asignacion(asignacion_id)
+            if asig is None:
+                return None
+            pid, t0, t1 = int(asig["patrulla_id"]), asig["started_at"], asig["ended_at"] or now
+        else:
+            if patrulla_id is None or not desde:
+                raise ValueError("patrulla_id y desde son requeridos (o asignacion_id)")
+            try:
+                t0 = self._parse_dt(desde)
+                t1 = self._parse_dt(hasta) if hasta else now
+            except ValueError:
+                raise ValueError("desde/hasta inválidos")
+            if t1 <= t0:
+                raise ValueError("hasta debe ser mayor que desde")
+            pid = int(patrulla_id)
+
+        # ventana cerrada (turno terminado): se calcula una vez y sirve para todos los zooms
+        cerrada = t1 < now - HIST_SETTLE
+        key = (pid, iso(t0), iso(t1))
+        trk = track_cache.get(key) if cerrada else None
+        if trk is None:
+            points = self.repo.track(pid, t0, t1, Settings.UBIC_TRACK_MAX_POINTS)
+            trk = Track(points, gap_s=Settings.UBIC_TRACK_GAP_S)
+            if cerrada:
+                track_cache.set(key, trk)
+
+        return track_feature(
+            trk,
+            zoom,
+            tol_px=Settings.UBIC_TRACK_TOL_PX,
+            properties={
+                "patrulla_id": pid,
+                "asignacion_id": asignacion_id,
+                "desde": iso(t0),
+                "hasta": iso(t1),
+                "truncated": trk.raw_points >= Settings.UBIC_TRACK_MAX_POINTS,
+            },
+        )
+
+    # --- mapa de calor ---
+    def heatmap(
+        self,
+        bbox: Any,
+        desde: Optional[str],
+        hasta: Optional[str],
+        cell_m: Any = None,
+        patrulla_id: Optional[int] = None,
+        formato: str = "matrix",
+    ) -> Dict[str, Any]:
+        """
+        Densidad de pings del historial por celda de ~cell_m metros.
+
+        La grilla se ancla en la esquina SO del bbox; el ancho en grados de
+        longitud se corrige por la latitud central. formato:
+          - matrix (def): {cols, rows, cell_deg, cells: [[col, fila, n], ...]}
+            sólo celdas no vacías (fila 0 = sur)
+          - geojson: FeatureCollection de polígonos con properties.n
+        """
+        box = self._bbox_tuple(bbox) if bbox else None
+        if box is None:
+            raise ValueError("bbox requerido: 'minLng,minLat,maxLng,maxLat'")
+        if not desde or not hasta:
+            raise ValueError("desde y hasta son requeridos")
+        try:
+            t0, t1 = self._parse_dt(desde), self._parse_dt(hasta)
+        except ValueError:
+            raise ValueError("desde/hasta inválidos")
+        if t1 <= t0:
+            raise ValueError("hasta debe ser mayor que desde")
+        if (t1 - t0).total_seconds() > Settings.UBIC_HEATMAP_MAX_DAYS * 86400:
+            raise ValueError(f"ventana máxima: {Settings.UBIC_HEATMAP_MAX_DAYS} días")
+        try:
+            cell_m = float(cell_m) if cell_m not in (None, "") else HEATMAP_CELL_M_DEFAULT
+        except (TypeError, ValueError):
+            raise ValueError("cell_m inválido")
+        if cell_m < HEATMAP_CELL_M_MIN:
+            raise ValueError(f"cell_m mínimo: {HEATMAP_CELL_M_MIN:.0f}")
+        if formato not in ("matrix", "geojson"):
+            raise ValueError("formato debe ser matrix o geojson")
+
+        min_lng, min_lat, max_lng, max_lat = box
+        mid_lat = (min_lat + max_lat) / 2.0
+        dy = cell_m / M_PER_DEG_LAT
+        dx = cell_m / (M_PER_DEG_LAT * max(math.cos(math.radians(mid_lat)), 0.01))
+        cols = max(1, math.ceil((max_lng - min_lng) / dx))
+        rows = max(1, math.ceil((max_lat - min_lat) / dy))
+        if cols * rows > Settings.UBIC_HEATMAP_MAX_CELLS:
+            raise ValueError(
+                f"demasiadas celdas ({cols}x{rows}); aumente cell_m o reduzca el bbox"
+            )
+
+        cells = self.repo.heatmap(box, (dx, dy), (cols, rows), t0, t1, patrulla_id=patrulla_id)
+        total = sum(n for _, _, n in cells)
+        meta = {
+            "bbox": [min_lng, min_lat, max_lng, max_lat],
+            "cell_m": cell_m,
+            "cell_deg": [dx, dy],
+            "cols": cols,
+            "rows": rows,
+            "total": total,
+            "max": max((n for _, _, n in cells), default=0),
+        }
+        if formato == "matrix":
+            return {**meta, "cells": [[cx, cy, n] for cx, cy, n in cells]}
+        features = []
+        for cx, cy, n in cells:
+            x0, y0 = min_lng + cx * dx, min_lat + cy * dy
+            ring = [[x0, y0], [x0 + dx, y0], [x0 + dx, y0 + dy], [x0, y0 + dy], [x0, y0]]
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+                "properties": {"col": cx, "row": cy, "n": n},
+            })
+        return {"type": "FeatureCollection", "features": features, "meta": meta}
+
     # --- para dashboard ---
     def summary(self) -> Dict[str, Any]:
+        """KPIs sobre la posición vigente (una fila por patrulla), no sobre el historial."""
         return {
-            "total": self.repo.contar_total(),
-            "activas": self.repo.contar_activas(),
-            "ultima_actualizacion": self.repo.ultima_actualizacion_iso(),
+            **self.repo.resumen_actual(),
             "recientes": self.repo.recientes(limit=20),
         }
 
+    def actuales(self) -> List[Dict[str, Any]]:
+        """Última posición conocida de cada patrulla (mapa en vivo / dashboard)."""
+        return self.repo.actuales()
+
     # =========================
-    #  GeoJSON para Leaflet (sin PostGIS)
+    #  GeoJSON para Leaflet (PostGIS opcional)
     # =========================
     def _engine(self):
         """
@@ -115,105 +559,485 @@ class UbicacionService:
 
     def _parse_dt(self, s: str) -> datetime:
         """
-        Acepta 'YYYY-MM-DD HH:MM:SS' o ISO 'YYYY-MM-DDTHH:MM:SS'.
+        Acepta 'YYYY-MM-DD HH:MM:SS' o ISO 'YYYY-MM-DDTHH:MM:SS' (con o sin
+        zona horaria). Siempre devuelve un datetime con zona: sin zona = UTC,
+        igual que las columnas timestamptz con las que se compara.
         """
         s = (s or "").strip()
         if not s:
             raise ValueError("fecha vacía")
         try:
-            return datetime.fromisoformat(s)
+            dt = datetime.fromisoformat(s)
         except Exception:
-            return datetime.fromisoformat(s.replace(" ", "T"))
+            dt = datetime.fromisoformat(s.replace(" ", "T"))
+        return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
 
-    def feature_collection(
-        self,
-        patrulla_id: Optional[int] = None,   # (no existe en la tabla actual; se devuelve como null)
-        desde: Optional[str] = None,
-        hasta: Optional[str] = None,
-        limit: int = 1000,
-        bbox: Optional[str] = None,          # <- string "minLng,minLat,maxLng,maxLat"
-    ) -> Dict[str, Any]:
+    def _bbox_tuple(self, bbox: Any) -> Optional[Tuple[float, float, float, float]]:
         """
-        Devuelve un FeatureCollection GeoJSON usando columnas lat/lng de
-        public.ubicaciones (sin requerir PostGIS).
-
-        Filtros:
-          - desde/hasta: comparan contra updated_at (datetime o string ISO)
-          - bbox: 'minLng,minLat,maxLng,maxLat'
-          - limit: tope (1..5000)
+        Acepta 'minLng,minLat,maxLng,maxLat' o el dict del controller
+        ({min_lng, min_lat, max_lng, max_lat}). None si viene mal formado.
         """
-        # sanitizar limit
         try:
-            limit = int(limit)
+            if isinstance(bbox, dict):
+                vals = [float(bbox[k]) for k in ("min_lng", "min_lat", "max_lng", "max_lat")]
+            else:
+                vals = [float(x) for x in str(bbox).split(",")]
+            min_lng, min_lat, max_lng, max_lat = vals
         except Exception:
-            limit = 1000
-        limit = max(1, min(limit, 5000))
+            return None
+        if min_lng > max_lng or min_lat > max_lat:
+            return None
+        return min_lng, min_lat, max_lng, max_lat
+
+    def _near_tuple(self, near: Any) -> Tuple[float, float]:
+        """'lng,lat' o (lng, lat) -> (lng, lat); ValueError si es inválido."""
+        try:
+            if isinstance(near, (list, tuple)):
+                lng, lat = (float(v) for v in near)
+            else:
+                lng, lat = (float(x) for x in str(near).split(","))
+        except Exception:
+            raise ValueError("near debe ser 'lng,lat'")
+        if not (-180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0):
+            raise ValueError("near fuera de rango")
+        return lng, lat
 
+    def _polygon_geojson(self, polygon: Any) -> str:
+        """Valida un Polygon/MultiPolygon GeoJSON (dict o string) y lo devuelve como string."""
+        try:
+            geom = json.loads(polygon) if isinstance(polygon, str) else dict(polygon)
+        except Exception:
+            raise ValueError("polygon debe ser GeoJSON")
+        if geom.get("type") == "Feature":
+            geom = geom.get("geometry") or {}
+        if geom.get("type") not in ("Polygon", "MultiPolygon"):
+            raise ValueError("polygon debe ser Polygon o MultiPolygon")
+        return json.dumps(geom)
+
+    def _fc_from_rows(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """FeatureCollection con la misma forma que la generada en SQL."""
+        features = []
+        for r in rows:
+            ts = r.get("updated_at")
+            if isinstance(ts, datetime):
+                ts = ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [r["lng"], r["lat"]]},
+                "properties": {
+                    "id": r.get("id"),
+                    "nombre": r.get("nombre"),
+                    "activo": r.get("activo"),
+                    "patrulla_id": r.get("patrulla_id"),
+                    "ts": ts,
+                },
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    def _geo_query(
+        self,
+        patrulla_id: Optional[int],
+        desde: Optional[str],
+        hasta: Optional[str],
+        bbox: Any,
+        near: Any,
+        radius_m: Optional[float],
+        polygon: Any,
+    ) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        (source, where, params) de /geo para SQLAlchemy text(): `source` es el
+        SELECT sobre el historial (con desde/hasta) o la posición vigente.
+        Lo comparten el FeatureCollection agregado y el modo streaming.
+        """
+        postgis = self.repo.postgis_activo()
         conds: List[str] = []
-        params: Dict[str, Any] = {"limit": limit}
+        params: Dict[str, Any] = {}
 
         # Filtros de tiempo sobre updated_at (SIN ::timestamptz)
+        historial = False
         if desde:
             try:
                 params["desde"] = self._parse_dt(desde)
                 conds.append("u.updated_at >= :desde")
+                historial = True
             except Exception:
                 pass
         if hasta:
             try:
                 params["hasta"] = self._parse_dt(hasta)
                 conds.append("u.updated_at <= :hasta")
+                historial = True
             except Exception:
                 pass
 
-        # BBOX opcional: "minLng,minLat,maxLng,maxLat"
-        if bbox:
-            try:
-                min_lng, min_lat, max_lng, max_lat = [float(x) for x in bbox.split(",")]
-                if min_lng > max_lng or min_lat > max_lat:
-                    raise ValueError("bbox inválido (min > max)")
+        # BBOX opcional (mal formado -> se ignora silenciosamente)
+        box = self._bbox_tuple(bbox) if bbox else None
+        if box:
+            params.update(dict(zip(("min_lng", "min_lat", "max_lng", "max_lat"), box)))
+            if postgis:
+                conds.append("u.geom && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)")
+            else:
                 conds.append("u.lng BETWEEN :min_lng AND :max_lng")
                 conds.append("u.lat BETWEEN :min_lat AND :max_lat")
-                params.update(
-                    {"min_lng": min_lng, "max_lng": max_lng, "min_lat": min_lat, "max_lat": max_lat}
+
+        # Radio en metros alrededor de near
+        if near is not None or radius_m is not None:
+            if near is None or radius_m is None:
+                raise ValueError("near y radius_m van juntos")
+            try:
+                radius_m = float(radius_m)
+            except (TypeError, ValueError):
+                raise ValueError("radius_m inválido")
+            if not (0 < radius_m <= MAX_RADIUS_M):
+                raise ValueError(f"radius_m debe estar entre 0 y {MAX_RADIUS_M:.0f}")
+            near_lng, near_lat = self._near_tuple(near)
+            dlat, dlng = deg_box(near_lat, radius_m)
+            params.update(near_lng=near_lng, near_lat=near_lat, radius_m=radius_m, dlat=dlat, dlng=dlng)
+            if postgis:
+                conds.append(
+                    "u.geom && ST_Expand(ST_SetSRID(ST_MakePoint(:near_lng, :near_lat), 4326), :dlng, :dlat)"
                 )
-            except Exception:
-                # bbox mal formado -> lo ignoramos silenciosamente
-                pass
+                conds.append(
+                    "ST_DWithin(u.geom::geography, "
+                    "ST_SetSRID(ST_MakePoint(:near_lng, :near_lat), 4326)::geography, :radius_m)"
+                )
+            else:
+                # prefiltro rectangular (B-tree) + distancia exacta
+                conds.append("u.lat BETWEEN :near_lat - :dlat AND :near_lat + :dlat")
+                conds.append("u.lng BETWEEN :near_lng - :dlng AND :near_lng + :dlng")
+                conds.append(f"{HAVERSINE_M_SQL} <= :radius_m")
+
+        if polygon is not None:
+            if not postgis:
+                raise ValueError("el filtro polygon requiere PostGIS (UBIC_POSTGIS=true)")
+            params["polygon"] = self._polygon_geojson(polygon)
+            conds.append("ST_Intersects(u.geom, ST_SetSRID(ST_GeomFromGeoJSON(:polygon), 4326))")
 
-        # patrulla_id no existe en la tabla actual => se ignora (se devuelve null)
+        # patrulla_id: en el historial usa idx_ubicaciones_patrulla_ts (rango por unidad)
+        if patrulla_id is not None:
+            conds.append("u.patrulla_id = :pid")
+            params["pid"] = int(patrulla_id)
+
+        geom_col = ", geom" if postgis else ""
+        if historial:
+            source = f"""
+                SELECT id, nombre, lat, lng, activo, patrulla_id, updated_at{geom_col}
+                FROM public.ubicaciones u
+            """
+        else:
+            source = f"""
+                SELECT ubicacion_id AS id, nombre, lat, lng, activo, patrulla_id, updated_at{geom_col}
+                FROM public.patrulla_posicion_actual u
+            """
 
         where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        return source, where, params
 
-        # Construimos GeoJSON en el servidor con JSON nativo de PostgreSQL
-        sql = text(f"""
-            SELECT json_build_object(
-                'type','FeatureCollection',
-                'features', COALESCE(json_agg(
-                    json_build_object(
-                        'type','Feature',
-                        'geometry', json_build_object(
+    def _feature_sql(self) -> str:
+        """Expresión SQL de una Feature GeoJSON para la fila `u` de _geo_query."""
+        if self.repo.postgis_activo():
+            geometry = "ST_AsGeoJSON(u.geom)::json"
+        else:
+            geometry = """json_build_object(
                             'type','Point',
                             'coordinates', json_build_array(u.lng, u.lat)
-                        ),
+                        )"""
+
+        return f"""json_build_object(
+                        'type','Feature',
+                        'geometry', {geometry},
                         'properties', json_build_object(
                             'id', u.id,
                             'nombre', u.nombre,
                             'activo', u.activo,
-                            'patrulla_id', NULL,
-                            'ts', to_char(u.updated_at,'YYYY-MM-DD"T"HH24:MI:SSZ')
+                            'patrulla_id', u.patrulla_id,
+                            'ts', to_char(u.updated_at AT TIME ZONE 'UTC','YYYY-MM-DD"T"HH24:MI:SS"Z"')
                         )
-                    )
+                    )"""
+
+    def feature_collection(
+        self,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        limit: int = 1000,
+        bbox: Any = None,                    # "minLng,minLat,maxLng,maxLat" o dict del controller
+        near: Any = None,                    # "lng,lat" (junto con radius_m)
+        radius_m: Optional[float] = None,
+        polygon: Any = None,                 # GeoJSON Polygon/MultiPolygon (sólo PostGIS)
+        cluster: bool = False,
+        zoom: Any = None,                    # requerido con cluster (0..22)
+    ) -> Dict[str, Any]:
+        """
+        Devuelve un FeatureCollection GeoJSON.
+
+        - Sin desde/hasta: mapa en vivo, una feature por patrulla; sale del
+          índice en memoria (posicion_index) o, si no está, de
+          public.patrulla_posicion_actual (O(patrullas), no O(pings)).
+        - Con desde/hasta: historial de public.ubicaciones; devuelve los
+          `limit` pings más recientes de la ventana, en orden cronológico.
+
+        Con PostGIS activo (UBIC_POSTGIS + columna geom) los filtros espaciales
+        usan el índice GiST (&&, ST_DWithin, ST_Intersects) y la geometría sale
+        de ST_AsGeoJSON; si no, se filtra por lat/lng con B-tree + haversine.
+
+        Filtros:
+          - desde/hasta: comparan contra updated_at (datetime o string ISO)
+          - bbox: 'minLng,minLat,maxLng,maxLat'
+          - near + radius_m: puntos a menos de radius_m metros de near
+          - polygon: puntos dentro del polígono (requiere PostGIS)
+          - patrulla_id: una unidad (en vivo o su recorrido en la ventana)
+          - limit: tope (1..5000)
+
+        cluster=True + zoom: agrupa los puntos para ese zoom (ver app/services/cluster.py).
+        En vivo sin patrulla_id se usa un índice jerárquico en memoria sobre todas
+        las patrullas (no aplica limit); con historial/otros filtros se agrupan
+        las filas ya filtradas.
+        """
+        if cluster:
+            try:
+                zoom = int(zoom)
+            except (TypeError, ValueError):
+                raise ValueError("zoom requerido con cluster=true (0..22)")
+            if not (0 <= zoom <= 22):
+                raise ValueError("zoom debe estar entre 0 y 22")
+            if not (desde or hasta) and near is None and radius_m is None \
+                    and polygon is None and patrulla_id is None:
+                idx = self._live_cluster_index()
+                if idx is not None:
+                    box = self._bbox_tuple(bbox) if bbox else None
+                    return {"type": "FeatureCollection", "features": idx.clusters(zoom, box)}
+            fc = self.feature_collection(
+                patrulla_id=patrulla_id, desde=desde, hasta=hasta, limit=limit, bbox=bbox,
+                near=near, radius_m=radius_m, polygon=polygon,
+            )
+            idx = ClusterIndex(
+                fc["features"],
+                min_zoom=min(zoom, Settings.UBIC_CLUSTER_MAX_ZOOM),
+                max_zoom=Settings.UBIC_CLUSTER_MAX_ZOOM,
+                radius_px=Settings.UBIC_CLUSTER_RADIUS_PX,
+            )
+            return {"type": "FeatureCollection", "features": idx.clusters(zoom)}
+
+        # sanitizar limit
+        try:
+            limit = int(limit)
+        except Exception:
+            limit = 1000
+        limit = max(1, min(limit, 5000))
+
+        # mapa en vivo con bbox/patrulla: se responde desde el índice en memoria
+        if not (desde or hasta) and near is None and radius_m is None and polygon is None:
+            box = self._bbox_tuple(bbox) if bbox else None
+            rows = self._live_rows(box, patrulla_id)
+            if rows is not None:
+                return self._fc_from_rows(reversed(rows[:limit]))
+
+        source, where, params = self._geo_query(patrulla_id, desde, hasta, bbox, near, radius_m, polygon)
+        params["limit"] = limit
+
+        # Construimos GeoJSON en el servidor con JSON nativo de PostgreSQL
+        sql = text(f"""
+            SELECT json_build_object(
+                'type','FeatureCollection',
+                'features', COALESCE(json_agg(
+                    {self._feature_sql()} ORDER BY u.updated_at ASC
                 ), '[]'::json)
             ) AS fc
             FROM (
-                SELECT id, nombre, lat, lng, activo, updated_at
-                FROM public.ubicaciones u
+                {source}
                 {where}
-                ORDER BY updated_at ASC
+                ORDER BY updated_at DESC
                 LIMIT :limit
             ) u;
         """)
         with self._engine().begin() as conn:
             row = conn.execute(sql, params).first()
             return row[0] if row and row[0] else {"type": "FeatureCollection", "features": []}
+
+    def feature_stream(
+        self,
+        patrulla_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        limit: Any = None,
+        bbox: Any = None,
+        near: Any = None,
+        radius_m: Optional[float] = None,
+        polygon: Any = None,
+    ) -> Iterator[str]:
+        """
+        Mismo FeatureCollection que feature_collection() pero por partes: un
+        cursor del lado del servidor (stream_results) entrega
+        UBIC_STREAM_CHUNK_ROWS features ya serializadas por PostgreSQL y se
+        emiten tal cual. Memoria constante y primer byte inmediato.
+
+        limit es opcional (sin él, toda la ventana en orden cronológico; con
+        él, los `limit` más recientes como en /geo), acotado por
+        UBIC_STREAM_MAX_ROWS si es > 0.
+
+        Los filtros se validan aquí (ValueError antes de empezar a responder);
+        la consulta corre recién al iterar.
+        """
+        cap = Settings.UBIC_STREAM_MAX_ROWS
+        if limit not in (None, ""):
+            try:
+                limit = max(1, int(limit))
+            except (TypeError, ValueError):
+                raise ValueError("limit inválido")
+        else:
+            limit = None
+        if cap > 0:
+            limit = min(limit, cap) if limit else cap
+
+        source, where, params = self._geo_query(patrulla_id, desde, hasta, bbox, near, radius_m, polygon)
+        if limit:
+            params["limit"] = limit
+            inner = f"{source} {where} ORDER BY updated_at DESC LIMIT :limit"
+        else:
+            inner = f"{source} {where}"
+        sql = text(f"""
+            SELECT ({self._feature_sql()})::text
+            FROM ({inner}) u
+            ORDER BY u.updated_at ASC
+        """)
+        engine = self._engine()
+        chunk = max(Settings.UBIC_STREAM_CHUNK_ROWS, 1)
+
+        def generate() -> Iterator[str]:
+            yield '{"type":"FeatureCollection","features":['
+            sep = ""
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=chunk).execute(sql, params)
+                for part in result.partitions(chunk):
+                    yield sep + ",".join(r[0] for r in part)
+                    sep = ","
+            yield "]}"
+
+        return generate()
+
+    def feature_delta(
+        self,
+        since: Any,
+        bbox: Any = None,
+        patrulla_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Delta del mapa en vivo: posiciones cambiadas desde el cursor `since`
+        (ver UbicacionRepository.cambios_desde), no toda la flota.
+
+        Devuelve un FeatureCollection con los cambios más:
+          - deleted: patrulla_id que hay que quitar (bajas y, con bbox, las
+            que se movieron fuera del bbox)
+          - cursor: para el próximo ?since= (opaco para el cliente)
+          - reset: true si se mandó todo (since=0 o cursor ya vencido); el
+            cliente reemplaza lo que tenía en lugar de aplicar el delta
+        """
+        try:
+            since = int(since)
+            if since < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError("since inválido (usar 0 o el cursor de la respuesta anterior)")
+        box = self._bbox_tuple(bbox) if bbox else None
+        return self._delta_payload(self.repo.cambios_desde(since, patrulla_id), box, patrulla_id)
+
+    def _delta_payload(
+        self,
+        res: Dict[str, Any],
+        box: Optional[Tuple[float, float, float, float]],
+        patrulla_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Resultado de cambios_desde() -> cuerpo de /geo?since= (y de los eventos SSE)."""
+        dentro, deleted = [], set(res["bajas"])
+        for r in res["rows"]:
+            if patrulla_id is not None and r["patrulla_id"] != patrulla_id:
+                continue
+            if box is None or (box[0] <= r["lng"] <= box[2] and box[1] <= r["lat"] <= box[3]):
+                dentro.append(r)
+            elif not res["reset"]:
+                deleted.add(int(r["patrulla_id"]))
+        if patrulla_id is not None:
+            deleted &= {patrulla_id}
+        return {
+            **self._fc_from_rows(dentro),
+            "deleted": sorted(deleted),
+            "cursor": str(res["cursor"]),
+            "reset": res["reset"],
+        }
+
+    def position_stream(
+        self,
+        *,
+        last_event_id: Optional[str] = None,
+        bbox: Any = None,
+        patrulla_id: Optional[int] = None,
+        dumps: Callable[[Any], str] = json.dumps,
+    ) -> Iterator[str]:
+        """
+        Server-Sent Events con los cambios del mapa en vivo (reemplaza el
+        polling de /actuales). Eventos:
+          - snapshot: la flota completa (al conectar sin Last-Event-ID o con
+            uno ya vencido); el cliente reemplaza lo que tenía
+          - positions: delta (features + deleted), igual que /geo?since=
+        El id de cada evento es el cursor del delta: al reconectar con
+        Last-Event-ID se retoma desde el buffer del hub o, si ya no está,
+        desde la BD. Comentarios ': ping' cada UBIC_SSE_HEARTBEAT_S.
+        """
+        hub = get_position_hub()
+        if hub is None:
+            raise StreamBusyError("stream deshabilitado (UBIC_SSE_ENABLED=false)")
+        if hub.full():
+            raise StreamBusyError("demasiadas conexiones de stream en este worker")
+        box = None
+        if bbox:
+            box = self._bbox_tuple(bbox)
+            if box is None:
+                raise ValueError("bbox inválido (minLng,minLat,maxLng,maxLat)")
+        try:
+            resume: Optional[int] = int(last_event_id) if last_event_id else None
+        except ValueError:
+            resume = None  # id ajeno o corrupto: snapshot
+        heartbeat = max(Settings.UBIC_SSE_HEARTBEAT_S, 1.0)
+        max_s = Settings.UBIC_SSE_MAX_S
+
+        def event(name: str, payload: Dict[str, Any]) -> str:
+            return f"id: {payload['cursor']}\nevent: {name}\ndata: {dumps(payload)}\n\n"
+
+        def generate() -> Iterator[str]:
+            hub.subscribe()
+            try:
+                yield f"retry: {Settings.UBIC_SSE_RETRY_MS}\n\n"
+                t_end = time.monotonic() + max_s if max_s > 0 else None
+                last_write = time.monotonic()
+                cursor, seq = resume, None
+                while t_end is None or time.monotonic() < t_end:
+                    if seq is None:
+                        if cursor is not None and hub.covers(cursor):
+                            seq = hub.start_seq(cursor)
+                        else:
+                            # sin buffer que cubra el cursor: delta (o snapshot) desde la BD
+                            res = self.repo.cambios_desde(cursor or 0, patrulla_id)
+                            seq = hub.start_seq(res["cursor"])
+                            cursor = res["cursor"]
+                            payload = self._delta_payload(res, box, patrulla_id)
+                            if res["reset"] or payload["features"] or payload["deleted"]:
+                                yield event("snapshot" if res["reset"] else "positions", payload)
+                                last_write = time.monotonic()
+                    batches = hub.wait(seq, heartbeat)
+                    if batches is None:
+                        seq = None  # el buffer ya descartó lotes que no se mandaron
+                        continue
+                    for b in batches:
+                        seq, cursor = b.seq, b.cursor
+                        payload = self._delta_payload(b.as_delta(), box, patrulla_id)
+                        if b.reset or payload["features"] or payload["deleted"]:
+                            yield event("snapshot" if b.reset else "positions", payload)
+                            last_write = time.monotonic()
+                    if time.monotonic() - last_write >= heartbeat:
+                        yield ": ping\n\n"
+                        last_write = time.monotonic()
+            finally:
+                hub.unsubscribe()
+
+        return generate()
@@ -0,0 +1,236 @@
+# backend/app/services/ubicacion_stream.py
+"""
+Hub de cambios de posición para GET /api/ubicaciones/stream (SSE), por worker.
+
+Un hilo por proceso lee el delta de la posición vigente
+(UbicacionRepository.cambios_desde, el mismo de /geo?since=) y lo reparte a
+todas las conexiones SSE del worker: N pantallas abiertas cuestan una
+consulta por intervalo, no N. Lee cuando llega un cambio al bus del proceso
+(notify_positions: escrituras locales y, por LISTEN, las de otros workers y
+nodos) y, como respaldo, cada UBIC_SSE_POLL_MS; nunca más seguido que
+UBIC_SSE_MIN_INTERVAL_MS (los avisos de una ráfaga se juntan en una lectura).
+Sin suscriptores no consulta.
+
+Cada lectura con cambios queda como un lote en un buffer acotado
+(UBIC_SSE_REPLAY lotes) con el cursor del delta como id de evento. Un cliente
+que reconecta con Last-Event-ID retoma desde ese buffer si el cursor sigue
+cubierto; si no, se resincroniza con un delta desde la BD (o un snapshot).
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from app.config.settings import Settings
+
+Row = Dict[str, Any]
+
+
+class StreamBusyError(Exception):
+    """El worker ya tiene UBIC_SSE_MAX_CLIENTS conexiones abiertas."""
+
+
+class Batch(NamedTuple):
+    seq: int
+    since: int
+    cursor: int
+    rows: List[Row]
+    bajas: List[int]
+    reset: bool
+
+    def as_delta(self) -> Dict[str, Any]:
+        """Misma forma que UbicacionRepository.cambios_desde()."""
+        return {"cursor": self.cursor, "reset": self.reset, "rows": self.rows, "bajas": self.bajas}
+
+
+class PositionHub:
+    def __init__(
+        self,
+        fetch: Callable[[int], Dict[str, Any]],
+        *,
+        poll_s: float = 1.0,
+        min_interval_s: float = 0.2,
+        max_batches: int = 512,
+        max_subscribers: int = 48,
+    ) -> None:
+        self._fetch = fetch
+        self.poll_s = max(poll_s, 0.05)
+        self.min_interval_s = max(min_interval_s, 0.0)
+        self.max_batches = max(max_batches, 1)
+        self.max_subscribers = max(max_subscribers, 1)
+        self._cond = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._batches: Deque[Batch] = deque()
+        self._seq = 0
+        self._cursor: Optional[int] = None  # último cursor leído (None = detenido)
+        self._from: Optional[int] = None  # cursores >= _from se sirven desde el buffer
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_poll = 0.0
+        self.subscribers = 0
+        self.polls = 0
+
+    # --- lectura del delta ---
+    def _poll(self) -> None:
+        """Lee el delta desde el último cursor (con _poll_lock tomado)."""
+        since = self._cursor
+        res = self._fetch(since or 0)
+        self._last_poll = time.monotonic()
+        self.polls += 1
+        with self._cond:
+            if since is None:
+                # arranque: sólo fija el punto de partida (los clientes piden su snapshot)
+                self._batches.clear()
+                self._from = res["cursor"]
+            elif res["rows"] or res["bajas"] or res["reset"]:
+                self._seq += 1
+                self._batches.append(Batch(
+                    self._seq, since, res["cursor"], res["rows"], res["bajas"], res["reset"]
+                ))
+                while len(self._batches) > self.max_batches:
+                    self._from = self._batches.popleft().cursor
+                self._cond.notify_all()
+            self._cursor = res["cursor"]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            espera = self.min_interval_s - (time.monotonic() - self._last_poll)
+            if espera > 0:
+                time.sleep(espera)
+            with self._poll_lock:
+                if self.subscribers == 0:
+                    self._cursor = None  # al volver alguien se arranca de cero
+                    continue
+                try:
+                    self._poll()
+                except Exception as e:
+                    print(f"[ubicaciones] stream: lectura de cambios falló (se reintenta): {e}")
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ubic-stream", daemon=True)
+            self._thread.start()
+
+    def notify(self) -> None:
+        """Hay cambios nuevos: leer ya (respetando min_interval_s)."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    # --- suscriptores ---
+    def full(self) -> bool:
+        return self.subscribers >= self.max_subscribers
+
+    def subscribe(self) -> None:
+        """
+        Registra un suscriptor. Si el hub estaba detenido fija su punto de
+        partida aquí mismo, antes de que el cliente lea su snapshot: así el
+        primer lote del hub nunca empieza después del snapshot.
+        """
+        with self._poll_lock:
+            self.subscribers += 1
+            if self._cursor is None:
+                try:
+                    self._poll()
+                except Exception:
+                    self.subscribers -= 1
+                    raise
+        self._ensure_thread()
+
+    def unsubscribe(self) -> None:
+        with self._poll_lock:
+            self.subscribers = max(self.subscribers - 1, 0)
+
+    # --- lotes ---
+    def covers(self, cursor: int) -> bool:
+        """¿Se puede retomar desde `cursor` sólo con el buffer?"""
+        with self._cond:
+            return self._from is not None and cursor >= self._from
+
+    def start_seq(self, cursor: int) -> int:
+        """
+        Posición desde la que un cliente al día hasta `cursor` tiene que
+        recibir lotes: los que terminan después de `cursor` (uno que termina
+        antes o justo ahí no trae nada que el cliente no haya visto).
+        """
+        with self._cond:
+            for b in self._batches:
+                if b.cursor > cursor:
+                    return b.seq - 1
+            return self._seq
+
+    def wait(self, after_seq: int, timeout: float) -> Optional[List[Batch]]:
+        """
+        Lotes posteriores a after_seq ([] si no llegó nada en `timeout`).
+        None si el buffer ya descartó alguno (cliente lento): hay que
+        resincronizar desde la BD.
+        """
+        with self._cond:
+            if self._seq <= after_seq:
+                self._cond.wait(timeout)
+            if self._seq <= after_seq:
+                return []
+            if not self._batches or self._batches[0].seq > after_seq + 1:
+                return None
+            return [b for b in self._batches if b.seq > after_seq]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "subscribers": self.subscribers,
+                "batches": len(self._batches),
+                "seq": self._seq,
+                "cursor": self._cursor,
+                "polls": self.polls,
+            }
+
+
+# ---------- singleton por proceso ----------
+_hub: Optional[PositionHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_position_hub() -> Optional[PositionHub]:
+    """Hub del proceso (None si UBIC_SSE_ENABLED=false)."""
+    global _hub
+    if not Settings.UBIC_SSE_ENABLED:
+        return None
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                from app.repositories.ubicacion_repository import UbicacionRepository
+
+                repo = UbicacionRepository()
+                _hub = PositionHub(
+                    repo.cambios_desde,
+                    poll_s=Settings.UBIC_SSE_POLL_MS / 1000.0,
+                    min_interval_s=Settings.UBIC_SSE_MIN_INTERVAL_MS / 1000.0,
+                    max_batches=Settings.UBIC_SSE_REPLAY,
+                    max_subscribers=Settings.UBIC_SSE_MAX_CLIENTS,
+                )
+    return _hub
+
+
+def notify_positions() -> None:
+    """Hubo un cambio (local o por LISTEN): que el hub lea ya (no-op si nadie escucha)."""
+    if _hub is not None and _hub.subscribers:
+        _hub.notify()
+
+
+def shutdown_position_hub() -> None:
+    if _hub is not None:
+        _hub.stop()
+
+
+atexit.register(shutdown_position_hub)
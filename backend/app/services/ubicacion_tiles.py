@@ -0,0 +1,197 @@
+# backend/app/services/ubicacion_tiles.py
+"""
+Teselas vectoriales de ubicaciones: GET /api/ubicaciones/tiles/{z}/{x}/{y}.mvt
+
+Capas:
+  - posiciones: posición vigente de cada patrulla (índice en memoria o
+    patrulla_posicion_actual), codificada en proceso (app/services/mvt.py).
+  - historial: pings de public.ubicaciones en desde/hasta; con PostGIS sale
+    de ST_AsMVT, si no se agrupa en SQL y se codifica en proceso.
+
+Raleo por zoom: por debajo de UBIC_TILE_FULL_ZOOM se deja un punto por celda
+(el más reciente) con la propiedad n = puntos agrupados; la celda se achica al
+acercarse. Cada capa se corta en UBIC_TILE_MAX_FEATURES.
+
+Caché LRU por worker: las capas en vivo viven UBIC_TILE_LIVE_TTL_S; el
+historial de una ventana ya cerrada (hasta en el pasado) UBIC_TILE_HIST_TTL_S.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config.settings import Settings
+from app.services import mvt
+
+CAPAS = ("posiciones", "historial")
+# margen para pings con hora de dispositivo que llegan tarde
+HIST_SETTLE = timedelta(minutes=5)
+
+TileKey = Tuple[Any, ...]
+
+
+class TileCache:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(max_entries, 0)
+        self._data: "OrderedDict[TileKey, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: TileKey) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: TileKey, data: bytes, ttl: float) -> None:
+        if ttl <= 0 or self.max_entries == 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": sum(len(v[1]) for v in self._data.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+tile_cache = TileCache(Settings.UBIC_TILE_CACHE_MAX)
+
+
+def cell_for_zoom(z: int) -> int:
+    """Tamaño de celda de raleo (unidades de tesela): 1 = sin raleo."""
+    d = Settings.UBIC_TILE_FULL_ZOOM - z
+    if d <= 0:
+        return 1
+    return min(1 << d, max(Settings.UBIC_TILE_EXTENT // 64, 1))
+
+
+def _iso(ts: Any) -> Optional[str]:
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return ts
+
+
+class UbicacionTiles:
+    def __init__(
+        self,
+        repo: Any,
+        live_rows: Callable[[Optional[Tuple[float, float, float, float]], Optional[int]], Optional[List[Dict[str, Any]]]],
+        cache: TileCache = tile_cache,
+    ) -> None:
+        self.repo = repo
+        self._live_rows = live_rows
+        self.cache = cache
+
+    # --- capas ---
+    def _posiciones(self, z: int, x: int, y: int, patrulla_id: Optional[int]) -> bytes:
+        extent, buffer = Settings.UBIC_TILE_EXTENT, Settings.UBIC_TILE_BUFFER
+        bounds = mvt.tile_bounds(z, x, y, buffer, extent)
+        rows = self._live_rows(bounds, patrulla_id)
+        if rows is None:
+            rows = self.repo.listar_bbox(*bounds)
+            if patrulla_id is not None:
+                rows = [r for r in rows if r.get("patrulla_id") == patrulla_id]
+        pts = []
+        for r in rows:
+            px, py = mvt.tile_coords(r["lng"], r["lat"], z, x, y, extent)
+            pts.append((px, py, r.get("updated_at"), {
+                "id": r.get("id"),
+                "patrulla_id": r.get("patrulla_id"),
+                "nombre": r.get("nombre"),
+                "activo": r.get("activo"),
+                "ts": _iso(r.get("updated_at")),
+            }))
+        feats = mvt.thin(pts, cell_for_zoom(z))
+        feats.sort(key=lambda f: f[2]["ts"] or "", reverse=True)
+        return mvt.encode_layer("posiciones", feats[: Settings.UBIC_TILE_MAX_FEATURES], extent, id_prop="patrulla_id")
+
+    def _historial(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        patrulla_id: Optional[int],
+        desde: Optional[datetime],
+        hasta: Optional[datetime],
+    ) -> bytes:
+        extent, buffer = Settings.UBIC_TILE_EXTENT, Settings.UBIC_TILE_BUFFER
+        cell = cell_for_zoom(z)
+        filtros = dict(desde=desde, hasta=hasta, patrulla_id=patrulla_id, limit=Settings.UBIC_TILE_MAX_FEATURES)
+        if self.repo.postgis_activo():
+            return self.repo.tile_historial_mvt(
+                z, x, y, cell=cell, extent=extent, buffer=buffer, layer="historial", **filtros
+            )
+        rows = self.repo.tile_historial(
+            z, x, y, mvt.tile_bounds(z, x, y, buffer, extent), cell=cell, extent=extent, **filtros
+        )
+        half = cell // 2
+        feats = [
+            (r["gx"] * cell + half, r["gy"] * cell + half,
+             {"n": int(r["n"]), "ts": _iso(r["ts"]), "patrulla_id": r.get("patrulla_id")})
+            for r in rows
+        ]
+        return mvt.encode_layer("historial", feats, extent)
+
+    # --- tesela ---
+    def tile(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        *,
+        capas: Sequence[str] = ("posiciones",),
+        patrulla_id: Optional[int] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+    ) -> Tuple[bytes, float]:
+        """Devuelve (bytes MVT, segundos de validez). Tesela vacía = b""."""
+        mvt.check_tile(z, x, y)
+        capas = tuple(c for c in CAPAS if c in capas)
+        if not capas:
+            raise ValueError(f"capas debe incluir alguna de: {', '.join(CAPAS)}")
+        if "historial" in capas and desde is None and hasta is None:
+            raise ValueError("la capa historial requiere desde y/o hasta")
+
+        cerrada = hasta is not None and \
+            (hasta if hasta.tzinfo else hasta.replace(tzinfo=timezone.utc)) < datetime.now(timezone.utc) - HIST_SETTLE
+        ttl = Settings.UBIC_TILE_HIST_TTL_S if capas == ("historial",) and cerrada \
+            else Settings.UBIC_TILE_LIVE_TTL_S
+
+        key = (z, x, y, capas, patrulla_id, _iso(desde), _iso(hasta))
+        data = self.cache.get(key)
+        if data is not None:
+            return data, ttl
+
+        parts = []
+        if "historial" in capas:
+            parts.append(self._historial(z, x, y, patrulla_id, desde, hasta))
+        if "posiciones" in capas:
+            parts.append(self._posiciones(z, x, y, patrulla_id))
+        data = b"".join(parts)
+        self.cache.set(key, data, ttl)
+        return data, ttl
@@ -0,0 +1,62 @@
+# backend/app/services/ubicacion_version.py
+"""
+Watermark de las lecturas de ubicaciones, para GET condicional (ETag/304).
+
+Junta en una consulta barata lo que cambia cuando puede cambiar una respuesta:
+  - MAX(id) del historial: cualquier ping nuevo, también los que llegan con
+    hora de dispositivo atrasada (no mueven MAX(updated_at))
+  - MAX(updated_at) y COUNT(*) de la posición vigente
+  - ubicacion_version.ediciones: se incrementa en la misma transacción de
+    cada edición/borrado y cuando la retención borra o desadjunta particiones
+
+Se cachea por worker UBIC_ETAG_TTL_MS. Las escrituras de este proceso lo
+invalidan al momento; las de otros workers se ven con ese retraso como máximo.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.config.settings import Settings
+
+
+class Watermark(NamedTuple):
+    max_id: Optional[int]
+    max_ts: Optional[datetime]
+    actuales: int
+    ediciones: int
+
+    def etag(self, key: str) -> str:
+        """ETag fuerte para una respuesta (key = ruta + query string)."""
+        ts = self.max_ts.isoformat() if self.max_ts else ""
+        raw = f"{self.max_id}|{ts}|{self.actuales}|{self.ediciones}|{key}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+_cache: Dict[str, Any] = {"at": 0.0, "wm": None}
+_lock = threading.Lock()
+
+
+def current_watermark(repo: Any = None) -> Watermark:
+    c = _cache
+    ttl = Settings.UBIC_ETAG_TTL_MS / 1000.0
+    if c["wm"] is not None and time.monotonic() - c["at"] < ttl:
+        return c["wm"]
+    with _lock:
+        if c["wm"] is not None and time.monotonic() - c["at"] < ttl:
+            return c["wm"]
+        if repo is None:
+            from app.repositories.ubicacion_repository import UbicacionRepository
+
+            repo = UbicacionRepository()
+        c["wm"] = Watermark(*repo.version())
+        c["at"] = time.monotonic()
+        return c["wm"]
+
+
+def invalidate_watermark() -> None:
+    """Tras una escritura local: la próxima lectura vuelve a consultar la BD."""
+    _cache["wm"] = None
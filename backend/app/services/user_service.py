@@ -1,18 +1,31 @@
 # backend/app/services/user_service.py
 from typing import Optional, Dict, Any, Tuple, List
-import psycopg
+from psycopg_pool import ConnectionPool
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.config.settings import Settings
+from app.core.db.keyset import count_mode, decode_cursor, explain_sql, next_cursor, plan_rows
+from app.core.db.pool import get_pool
 
 # id, email, password_hash, is_active, nombre, nip
 Row = Tuple[int, str, str, bool, Optional[str], Optional[str]]
 
 class UserService:
-    def __init__(self):
-        self.dsn = (
-            f"host={Settings.DB_HOST} port={Settings.DB_PORT} "
-            f"dbname={Settings.DB_NAME} user={Settings.DB_USER} password={Settings.DB_PASSWORD}"
-        )
+    """
+    Usuarios y roles sobre el pool psycopg del proceso (app/core/db/pool.py).
+
+    Las consultas de texto fijo se ejecutan con prepare=True: cada conexión del
+    pool las prepara en el servidor la primera vez y luego sólo envía parámetros
+    (sin re-planificar). Las de SQL dinámico (update_user) van sin preparar.
+    """
+
+    # server-side prepared statements para las consultas fijas
+    prepare: bool = True
+
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self._pool = pool
+
+    def _conn(self):
+        """Conexión prestada del pool; vuelve al pool al salir del `with`."""
+        return (self._pool or get_pool()).connection()
 
     # --- esquema ---
     def ensure_schema(self):
@@ -60,7 +73,7 @@ class UserService:
           ON public.users (nip) WHERE nip IS NOT NULL;
         """
 
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self._conn() as conn, conn.cursor() as cur:
             cur.execute(sql_users)
             cur.execute(sql_roles)
             cur.execute(sql_user_roles)
@@ -105,8 +118,8 @@ class UserService:
         FROM public.users
         WHERE email=%s
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (email,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (email,), prepare=self.prepare)
             row = cur.fetchone()
             return self._row_to_dict_full(row) if row else None
 
@@ -116,8 +129,8 @@ class UserService:
         FROM public.users
         WHERE id=%s
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id,), prepare=self.prepare)
             row = cur.fetchone()
             return self._row_to_dict_full(row) if row else None
 
@@ -134,10 +147,10 @@ class UserService:
         LIMIT %s OFFSET %s
         """
 
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(count_sql)
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(count_sql, prepare=self.prepare)
             total = cur.fetchone()[0]
-            cur.execute(list_sql, (size, offset))
+            cur.execute(list_sql, (size, offset), prepare=self.prepare)
             rows = cur.fetchall()
 
         items = [self._row_to_public(r) for r in rows]
@@ -162,8 +175,8 @@ class UserService:
         VALUES (%s, %s, %s, %s, %s)
         RETURNING id, email, password_hash, is_active, nombre, nip
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (email, pwd_hash, is_active, nombre, nip))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (email, pwd_hash, is_active, nombre, nip), prepare=self.prepare)
             row = cur.fetchone()
             conn.commit()
         return self._row_to_public(row)
@@ -209,7 +222,7 @@ class UserService:
         WHERE id=%s
         RETURNING id, email, password_hash, is_active, nombre, nip
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self._conn() as conn, conn.cursor() as cur:
             cur.execute(sql, tuple(params))
             row = cur.fetchone()
             conn.commit()
@@ -217,8 +230,8 @@ class UserService:
 
     def delete_user(self, user_id: int) -> bool:
         sql = "DELETE FROM public.users WHERE id=%s"
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id,), prepare=self.prepare)
             deleted = cur.rowcount
             conn.commit()
         return deleted > 0
@@ -232,8 +245,8 @@ class UserService:
         WHERE ur.user_id = %s
         ORDER BY r.code
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id,), prepare=self.prepare)
             return [row[0] for row in cur.fetchall()]
 
     def has_role(self, user_id: int, role_code: str) -> bool:
@@ -244,8 +257,8 @@ class UserService:
         WHERE ur.user_id = %s AND r.code = %s
         LIMIT 1
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id, role_code))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, role_code), prepare=self.prepare)
             return cur.fetchone() is not None
 
     def is_admin(self, user_id: int) -> bool:
@@ -254,8 +267,8 @@ class UserService:
     def assign_role(self, user_id: int, role_code: str) -> bool:
         # asigna (idempotente) un rol existente a un usuario
         sql_get = "SELECT id FROM public.roles WHERE code=%s"
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql_get, (role_code,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql_get, (role_code,), prepare=self.prepare)
             r = cur.fetchone()
             if not r:
                 raise ValueError(f"rol '{role_code}' no existe")
@@ -270,8 +283,8 @@ class UserService:
     def revoke_role(self, user_id: int, role_code: str) -> bool:
         # quita un rol al usuario (si lo tiene)
         sql_get = "SELECT id FROM public.roles WHERE code=%s"
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql_get, (role_code,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql_get, (role_code,), prepare=self.prepare)
             r = cur.fetchone()
             if not r:
                 return False
@@ -288,7 +301,7 @@ class UserService:
     def ensure_roles_exist(self, codes: List[str]) -> None:
         if not codes:
             return
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self._conn() as conn, conn.cursor() as cur:
             for c in codes:
                 code = (c or "").strip().lower()
                 if not code:
@@ -305,7 +318,7 @@ class UserService:
         if not code:
             return
         name = code.capitalize()
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self._conn() as conn, conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO public.roles(code, name) VALUES (%s, %s) ON CONFLICT (code) DO NOTHING",
                 (code, name),
@@ -317,14 +330,14 @@ class UserService:
         self.ensure_role(code)
 
     def list_all_roles(self) -> List[Dict[str, Any]]:
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute("SELECT id, code, name FROM public.roles ORDER BY code")
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, code, name FROM public.roles ORDER BY code", prepare=self.prepare)
             rows = cur.fetchall()
         return [{"id": r[0], "code": r[1], "name": r[2]} for r in rows]
 
     def list_all_role_codes(self) -> List[str]:
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute("SELECT code FROM public.roles ORDER BY code")
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT code FROM public.roles ORDER BY code", prepare=self.prepare)
             return [r[0] for r in cur.fetchall()]
 
     # --- lecturas con roles (para el frontend) ---
@@ -333,26 +346,42 @@ class UserService:
         page: int = 1,
         size: int = 10,
         q: Optional[str] = None,
+        after: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Lista usuarios agregando roles y ordenando por prioridad de rol:
-          admin (0) -> usuario (1) -> patrullero (2) -> otros (99), y luego por email ASC.
+          admin (0) -> usuario (1) -> patrullero (2) -> otros (99), y luego por email ASC
+          (id como desempate).
         Soporta filtro por email/nombre/nip (insensible a mayúsculas).
+        after = cursor 'next' de la página anterior: keyset sobre
+        (rango, email, id) en lugar de OFFSET; page se ignora. El rango sale
+        de un agregado, así que ningún índice sirve ese orden: cada página
+        agrega y ordena todos los usuarios (sólo se evita descartar filas del
+        OFFSET). Aceptable para una tabla de usuarios chica.
+        count: exact (defecto con page) | estimate | none (defecto con after).
         """
         page = max(page, 1)
         size = max(min(size, 100), 1)
-        offset = (page - 1) * size
+        count = count_mode(count, "none" if after else "exact")
+        offset = 0 if after else (page - 1) * size
 
         where = ""
-        params: Dict[str, Any] = {"size": size, "off": offset}
+        params: Dict[str, Any] = {"size": size + 1, "off": offset}
         if q:
             where = """
-            WHERE LOWER(u.email) LIKE %(q)s
+            WHERE (LOWER(u.email) LIKE %(q)s
                OR LOWER(COALESCE(u.nombre,'')) LIKE %(q)s
-               OR LOWER(COALESCE(u.nip,'')) LIKE %(q)s
+               OR LOWER(COALESCE(u.nip,'')) LIKE %(q)s)
             """
             params["q"] = f"%{q.lower()}%"
 
+        page_where = where
+        if after:
+            params["a_rank"], params["a_email"], params["a_id"] = decode_cursor(after, (int, str, int))
+            keyset = "(COALESCE(rr.best_rank, 99), u.email, u.id) > (%(a_rank)s, %(a_email)s, %(a_id)s)"
+            page_where = f"{where} AND {keyset}" if where else f"WHERE {keyset}"
+
         count_sql = f"SELECT COUNT(*) FROM public.users u {where}"
 
         list_sql = f"""
@@ -388,16 +417,22 @@ class UserService:
         LEFT JOIN public.user_roles ur ON ur.user_id = u.id
         LEFT JOIN public.roles r       ON r.id       = ur.role_id
         LEFT JOIN role_rank rr         ON rr.user_id = u.id
-        {where}
+        {page_where}
         GROUP BY u.id, u.email, u.is_active, u.nombre, u.nip, rr.best_rank
-        ORDER BY rr.best_rank ASC, u.email ASC
+        ORDER BY COALESCE(rr.best_rank, 99) ASC, u.email ASC, u.id ASC
         LIMIT %(size)s OFFSET %(off)s;
         """
 
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(count_sql, params if q else {})
-            total = cur.fetchone()[0]
-            cur.execute(list_sql, params)
+        total: Optional[int] = None
+        count_params = {"q": params["q"]} if q else {}
+        with self._conn() as conn, conn.cursor() as cur:
+            if count == "exact":
+                cur.execute(count_sql, count_params, prepare=self.prepare)
+                total = cur.fetchone()[0]
+            elif count == "estimate":
+                cur.execute(explain_sql(f"SELECT 1 FROM public.users u {where}"), count_params)
+                total = plan_rows(cur.fetchone()[0])
+            cur.execute(list_sql, params, prepare=self.prepare)
             rows = cur.fetchall()
 
         items = [
@@ -409,9 +444,16 @@ class UserService:
                 "nip": r[4],
                 "roles": list(r[5] or []),
             }
-            for r in rows
+            for r in rows[:size]
         ]
-        return {"items": items, "page": page, "size": size, "total": total}
+        return {
+            "items": items,
+            "page": None if after else page,
+            "size": size,
+            "total": total,
+            "count": count,
+            "next": next_cursor(rows, size, lambda r: (r[6], r[1], r[0])),
+        }
 
     def get_user_with_roles(self, user_id: int) -> Optional[Dict[str, Any]]:
         sql = """
@@ -432,8 +474,8 @@ class UserService:
         WHERE u.id = %s
         GROUP BY u.id, u.email, u.is_active, u.nombre, u.nip;
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id,), prepare=self.prepare)
             row = cur.fetchone()
         if not row:
             return None
@@ -453,6 +495,6 @@ class UserService:
     def email_exists(self, email: str) -> bool:
         email = (email or "").strip().lower()
         sql = "SELECT 1 FROM public.users WHERE email=%s"
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (email,))
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, (email,), prepare=self.prepare)
             return cur.fetchone() is not None
@@ -1,8 +1,48 @@
 # backend/app/views/api.py
+from typing import Optional, Tuple
+
 from flask import Blueprint, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import text  # <-- NECESARIO en SQLAlchemy 2.x
 
+from app.core.db.schema_caps import get_capabilities, mark_stale, refresh_capabilities
+from app.services.ubicacion_eventos import ESQUEMA, Cambio, anunciar, bus
+from app.services.user_service import UserService
+
 api_bp = Blueprint("api", __name__)
+_user_svc = UserService()
+
+
+def _on_cambio(cambio: Cambio) -> None:
+    # refresh en otro worker: la foto de este queda vieja
+    if cambio.kind == ESQUEMA and cambio.remoto:
+        mark_stale()
+
+
+bus.subscribe(_on_cambio)
+
+
+# ------- helpers de admin -------
+def _current_uid_int() -> Optional[int]:
+    try:
+        val = get_jwt_identity()
+        return int(val) if val is not None else None
+    except Exception:
+        return None
+
+
+def _admin_guard() -> Optional[Tuple[dict, int]]:
+    uid = _current_uid_int()
+    if uid is None:
+        return {"ok": False, "msg": "no autorizado"}, 401
+    try:
+        roles = _user_svc.list_role_codes(uid) or []
+    except Exception:
+        roles = []
+    if "admin" not in roles:
+        return {"ok": False, "msg": "permiso denegado"}, 403
+    return None
+
 
 @api_bp.get("/ping")
 def ping():
@@ -20,3 +60,35 @@ def ping_db():
         return jsonify({"db": "ok" if one == 1 else "fail"})
     except Exception as e:
         return jsonify({"db": "error", "detail": str(e)}), 500
+
+@api_bp.get("/schema-caps")
+@jwt_required()
+def schema_caps():
+    """Capacidades del esquema detectadas al arrancar (tablas/columnas/extensiones). Solo admin."""
+    guard = _admin_guard()
+    if guard:
+        body, code = guard
+        return jsonify(body), code
+    try:
+        caps = get_capabilities(current_app.extensions["db_engine"])
+        return jsonify(caps.as_dict())
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al leer capacidades: {e}"}), 500
+
+@api_bp.post("/schema-caps/refresh")
+@jwt_required()
+def schema_caps_refresh():
+    """
+    Re-detecta el esquema (p.ej. tras una migración) sin reiniciar workers.
+    Solo admin. Los demás workers reciben el aviso y releen en su próximo uso.
+    """
+    guard = _admin_guard()
+    if guard:
+        body, code = guard
+        return jsonify(body), code
+    try:
+        caps = refresh_capabilities(current_app.extensions["db_engine"])
+        anunciar(ESQUEMA)
+        return jsonify({"ok": True, **caps.as_dict()})
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"error al refrescar capacidades: {e}"}), 500
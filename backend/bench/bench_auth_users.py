@@ -0,0 +1,90 @@
+# backend/bench/bench_auth_users.py
+"""
+Benchmark de latencia por endpoint para /api/auth/login, /api/auth/me y
+/api/users: conexión nueva sin preparar (antes) vs. pool + prepared
+statements (ahora). Requiere una BD accesible con las variables DB_*.
+
+Uso (desde backend/):
+    python -m bench.bench_auth_users --iterations 300
+
+Crea un usuario admin temporal y lo borra al terminar.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import psycopg
+
+from app import create_app
+from app.config.settings import Settings, build_psycopg_conninfo
+from app.core.db.pool import get_pool
+from app.services.user_service import UserService
+
+BENCH_EMAIL = "bench.auth@patrullaje.local"
+BENCH_PASS = "bench-pass-123"
+
+
+def _time(fn: Callable[[], object], n: int) -> List[float]:
+    out: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _run_endpoints(client, n: int) -> Dict[str, List[float]]:
+    login_body = {"email": BENCH_EMAIL, "password": BENCH_PASS}
+    resp = client.post("/api/auth/login", json=login_body)
+    token = resp.get_json()["access_token"]
+    hdr = {"Authorization": f"Bearer {token}"}
+    return {
+        "POST /api/auth/login": _time(lambda: client.post("/api/auth/login", json=login_body), n),
+        "GET  /api/auth/me": _time(lambda: client.get("/api/auth/me", headers=hdr), n),
+        "GET  /api/users": _time(lambda: client.get("/api/users?page=1&size=20", headers=hdr), n),
+    }
+
+
+def _report(label: str, results: Dict[str, List[float]]) -> None:
+    print(f"--- {label}")
+    for name, lat in results.items():
+        lat = sorted(lat)
+        p95 = lat[int(len(lat) * 0.95) - 1]
+        print(f"{name:<22} p50={statistics.median(lat) * 1000:7.2f} ms   p95={p95 * 1000:7.2f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iterations", type=int, default=300)
+    args = ap.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    svc = UserService()
+    get_pool().wait()
+
+    user = svc.get_by_email(BENCH_EMAIL) or svc.create_user(BENCH_EMAIL, BENCH_PASS)
+    svc.assign_role(user["id"], "admin")
+    try:
+        # "antes": conexión nueva por método, sin preparar
+        dsn = build_psycopg_conninfo(Settings)
+        orig_conn, orig_prepare = UserService._conn, UserService.prepare
+        UserService._conn = lambda self: psycopg.connect(dsn)
+        UserService.prepare = False
+        try:
+            before = _run_endpoints(client, args.iterations)
+        finally:
+            UserService._conn, UserService.prepare = orig_conn, orig_prepare
+
+        after = _run_endpoints(client, args.iterations)
+        _report("connect por llamada, sin prepare", before)
+        _report("pool + prepared statements", after)
+    finally:
+        svc.delete_user(user["id"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# backend/bench/bench_json.py
+"""
+Benchmark: serializar una respuesta de 5000 filas (forma de /api/ubicaciones:
+id, nombre, lat, lng, activo, patrulla_id, created_at, updated_at) con
+
+  - el proveedor por defecto de Flask (stdlib json, sort_keys, fechas HTTP),
+  - FastJSONProvider con orjson (si está instalado),
+  - FastJSONProvider en modo respaldo (stdlib, como si no hubiera orjson).
+
+No requiere BD. Uso (desde backend/):
+    python -m bench.bench_json --rows 5000 --repeat 50
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Callable, List
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.core import json_provider
+from app.core.json_provider import FastJSONProvider
+
+
+def _rows(n: int) -> List[dict]:
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": i,
+            "nombre": f"P-{i % 300}",
+            "lat": 14.6 + i * 1e-5,
+            "lng": -90.5 - i * 1e-5,
+            "activo": i % 7 != 0,
+            "patrulla_id": i % 300,
+            "velocidad": Decimal("12.50"),
+            "created_at": base + timedelta(seconds=5 * i),
+            "updated_at": base + timedelta(seconds=5 * i, milliseconds=250),
+        }
+        for i in range(n)
+    ]
+
+
+def _measure(label: str, fn: Callable[[], bytes], repeat: int) -> float:
+    size = len(fn())  # calentamiento
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    p50 = statistics.median(times) * 1000
+    print(f"{label:<22} p50={p50:8.2f} ms  max={max(times) * 1000:8.2f} ms  {size / 1024:.0f} KiB")
+    return p50
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    app = Flask(__name__)
+    payload = {"items": _rows(args.rows), "total": args.rows, "page": 1}
+    flask_default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    with app.app_context():
+        base = _measure("flask default", lambda: flask_default.response(payload).get_data(), args.repeat)
+        if json_provider.HAS_ORJSON:
+            fast_ms = _measure("FastJSONProvider/orjson", lambda: fast.response(payload).get_data(), args.repeat)
+            print(f"  -> x{base / fast_ms:.1f} vs flask default")
+        else:
+            print("orjson no instalado: se omite")
+        json_provider.HAS_ORJSON = False
+        try:
+            _measure("FastJSONProvider/stdlib", lambda: fast.response(payload).get_data(), args.repeat)
+        finally:
+            json_provider.HAS_ORJSON = json_provider.orjson is not None
+
+
+if __name__ == "__main__":
+    main()
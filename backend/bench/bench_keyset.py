@@ -0,0 +1,70 @@
+# backend/bench/bench_keyset.py
+"""
+Benchmark: paginado del historial con LIMIT/OFFSET (?page=) vs. keyset
+(?after=) a distintas profundidades. Sólo lee: usa las filas que ya haya en
+public.ubicaciones (conviene >= 1M). Requiere una BD accesible con las
+variables DB_* habituales.
+
+Uso (desde backend/):
+    python -m bench.bench_keyset --size 100 --pages 1,100,1000,10000 --reps 20
+
+Imprime la latencia mediana por página en cada modo; con keyset debería ser
+la misma en la página 1 y en la 10.000.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from app.config.settings import Settings
+from app.core.db.keyset import encode_cursor
+from app.core.db.pool import close_pool, init_pool
+from app.repositories.ubicacion_repository import UbicacionRepository
+
+
+def _median_ms(fn: Callable[[], object], reps: int) -> float:
+    lat: List[float] = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - t0)
+    return statistics.median(lat) * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size", type=int, default=100)
+    ap.add_argument("--pages", default="1,100,1000,10000")
+    ap.add_argument("--reps", type=int, default=20)
+    args = ap.parse_args()
+
+    pool = init_pool(Settings)
+    pool.wait()
+    repo = UbicacionRepository()
+    try:
+        est = repo.listar_paginado(size=1, count="estimate")["total"]
+        print(f"filas (estimado)={est} size={args.size} reps={args.reps}")
+        print(f"{'página':>8} {'offset':>12} {'keyset':>12}")
+        for page in (int(p) for p in args.pages.split(",")):
+            skip = (page - 1) * args.size
+            with pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT id FROM public.ubicaciones ORDER BY id DESC OFFSET %s LIMIT 1",
+                    (skip,),
+                ).fetchone()
+            if row is None:
+                print(f"{page:>8}  (no hay tantas filas)")
+                break
+            # cursor de la página anterior = id de la primera fila de esta + 1
+            after = encode_cursor([row[0] + 1])
+            t_off = _median_ms(lambda: repo.listar_paginado(page=page, size=args.size, count="none"), args.reps)
+            t_key = _median_ms(lambda: repo.listar_paginado(size=args.size, after=after, count="none"), args.reps)
+            print(f"{page:>8} {t_off:9.2f} ms {t_key:9.2f} ms")
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
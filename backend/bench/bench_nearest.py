@@ -0,0 +1,92 @@
+# backend/bench/bench_nearest.py
+"""
+Benchmark: k-NN de /api/ubicaciones/nearest sobre el índice en memoria
+(búsqueda por anillos de la grilla) vs. ordenar todas las unidades por
+haversine (lo que haría el cliente tras pedir un bbox). No requiere BD:
+usa posiciones sintéticas alrededor de un centro.
+
+Uso (desde backend/):
+    python -m bench.bench_nearest --units 5000 --queries 2000 --k 10
+
+Imprime latencias p50/p95 por consulta para cada modo y verifica que ambos
+devuelvan las mismas unidades.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+from app.services.geo_utils import haversine_m
+from app.services.posicion_index import GridIndex
+
+CENTER = (14.6, -90.5)  # lat, lng
+SPREAD_DEG = 0.5
+
+
+def _rows(n: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": i,
+            "patrulla_id": i,
+            "nombre": f"P-{i}",
+            "lat": CENTER[0] + (random.random() - 0.5) * SPREAD_DEG,
+            "lng": CENTER[1] + (random.random() - 0.5) * SPREAD_DEG,
+            "activo": True,
+            "updated_at": now,
+        }
+        for i in range(n)
+    ]
+
+
+def _measure(label: str, fn: Callable[[float, float], List[int]], points: List[Tuple[float, float]]) -> None:
+    lat: List[float] = []
+    for p in points:
+        t0 = time.perf_counter()
+        fn(*p)
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    p50 = statistics.median(lat) * 1000
+    p95 = lat[int(len(lat) * 0.95) - 1] * 1000
+    print(f"{label:<16} p50={p50:.3f} ms  p95={p95:.3f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--units", type=int, default=5000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args()
+
+    random.seed(7)
+    rows = _rows(args.units)
+    index = GridIndex(
+        lambda cursor: {"cursor": 1, "reset": True, "rows": rows, "bajas": []},
+        sync_s=1e9,
+        full_sync_s=1e9,
+    )
+    index.warm()
+    points = [
+        (CENTER[0] + (random.random() - 0.5) * SPREAD_DEG, CENTER[1] + (random.random() - 0.5) * SPREAD_DEG)
+        for _ in range(args.queries)
+    ]
+
+    def brute(lat: float, lng: float) -> List[int]:
+        ranked = sorted(rows, key=lambda r: haversine_m(lat, lng, r["lat"], r["lng"]))
+        return [r["id"] for r in ranked[: args.k]]
+
+    def grid(lat: float, lng: float) -> List[int]:
+        return [r["id"] for r in index.nearest(lat, lng, args.k)]
+
+    bad = sum(1 for p in points[:100] if brute(*p) != grid(*p))
+    print(f"units={args.units} k={args.k} discrepancias(100 muestras)={bad}")
+    _measure("sort haversine", brute, points)
+    _measure("grid k-NN", grid, points)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# backend/bench/bench_ubicaciones_pool.py
+"""
+Benchmark: INSERT de ubicaciones con psycopg.connect por llamada (antes)
+vs. pool compartido (ahora). Requiere una BD accesible con las variables
+DB_* habituales.
+
+Uso (desde backend/):
+    python -m bench.bench_ubicaciones_pool --requests 2000 --threads 16
+
+Imprime requests/segundo y latencias p50/p95 para cada modo y borra las
+filas de prueba al final.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import psycopg
+
+from app.config.settings import Settings, build_psycopg_conninfo
+from app.core.db.pool import close_pool, init_pool
+from app.repositories.ubicacion_repository import UbicacionRepository
+
+BENCH_NOMBRE = "__bench_pool__"
+
+_INSERT_SQL = """
+INSERT INTO public.ubicaciones (nombre, lat, lng, activo)
+VALUES (%s, %s, %s, TRUE)
+RETURNING id
+"""
+
+
+def _insert_connect_per_call(dsn: str) -> Callable[[int], None]:
+    """Reproduce el comportamiento previo: una sesión TCP+auth por llamada."""
+    def run(i: int) -> None:
+        with psycopg.connect(dsn) as conn, conn.cursor() as cur:
+            cur.execute(_INSERT_SQL, (BENCH_NOMBRE, 14.6 + i * 1e-6, -90.5))
+            conn.commit()
+    return run
+
+
+def _insert_pooled(repo: UbicacionRepository) -> Callable[[int], None]:
+    def run(i: int) -> None:
+        repo.crear({"nombre": BENCH_NOMBRE, "lat": 14.6 + i * 1e-6, "lng": -90.5})
+    return run
+
+
+def _measure(label: str, fn: Callable[[int], None], n: int, threads: int) -> None:
+    lat: List[float] = []
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        t0 = time.perf_counter()
+        fn(i)
+        dt = time.perf_counter() - t0
+        with lock:
+            lat.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(one, range(n)))
+    total = time.perf_counter() - t0
+
+    lat.sort()
+    p95 = lat[int(len(lat) * 0.95) - 1] if lat else 0.0
+    print(
+        f"{label:<18} {n / total:9.1f} req/s   "
+        f"p50={statistics.median(lat) * 1000:7.2f} ms   p95={p95 * 1000:7.2f} ms"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=16)
+    args = ap.parse_args()
+
+    dsn = build_psycopg_conninfo(Settings)
+    pool = init_pool(Settings)
+    pool.wait()
+    repo = UbicacionRepository()
+    repo.ensure_schema()
+
+    print(f"requests={args.requests} threads={args.threads} "
+          f"pool={Settings.PG_POOL_MIN_SIZE}..{Settings.PG_POOL_MAX_SIZE}")
+    try:
+        _measure("connect/llamada", _insert_connect_per_call(dsn), args.requests, args.threads)
+        _measure("pool", _insert_pooled(repo), args.requests, args.threads)
+    finally:
+        with pool.connection() as conn:
+            conn.execute("DELETE FROM public.ubicaciones WHERE nombre = %s", (BENCH_NOMBRE,))
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# backend/gunicorn.conf.py
+# gunicorn carga este archivo solo (cwd=/app); los flags del CMD del Dockerfile
+# siguen mandando para bind/workers.
+import os
+
+# GET /api/ubicaciones/stream (SSE) deja la conexión abierta: con workers sync
+# cada pantalla ocuparía un worker entero. Con gthread cada conexión es un hilo
+# del worker.
+#
+# Hilos por worker = UBIC_SSE_MAX_CLIENTS + PG_POOL_MAX_SIZE: los streams no
+# toman conexiones (el hub lee con un solo hilo) y el resto de los hilos son
+# requests que sí pueden tomar una del pool psycopg del worker. Más hilos que
+# eso sólo esperan PG_POOL_TIMEOUT por una conexión y terminan en 500, así que
+# GUNICORN_THREADS se acota a ese valor; para más concurrencia, subir
+# PG_POOL_MAX_SIZE (y max_connections de Postgres: workers x pool).
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# (se lee del entorno con los mismos defaults de Settings: este archivo se carga
+# antes de que gunicorn ponga el cwd en sys.path)
+_sse_on = os.getenv("UBIC_SSE_ENABLED", "true").lower() == "true"
+_sse = int(os.getenv("UBIC_SSE_MAX_CLIENTS", "48")) if _sse_on else 0
+_threads_max = _sse + max(int(os.getenv("PG_POOL_MAX_SIZE", "10")), 1)
+threads = min(int(os.getenv("GUNICORN_THREADS", str(_threads_max))), _threads_max)
+
+
+def worker_exit(server, worker):
+    """Al salir un worker: escribir los pings que queden en el buffer write-behind
+    y evaluar las geocercas de los que ya estaban encolados."""
+    from app.services.geocerca_engine import shutdown_geofence_engine
+    from app.services.ubicacion_buffer import shutdown_write_buffer
+    from app.services.ubicacion_eventos import shutdown_notify_listener
+    from app.services.ubicacion_stream import shutdown_position_hub
+
+    shutdown_write_buffer()
+    shutdown_geofence_engine()
+    shutdown_position_hub()
+    shutdown_notify_listener()
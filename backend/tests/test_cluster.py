@@ -0,0 +1,78 @@
+# backend/tests/test_cluster.py
+import random
+
+import pytest
+
+from app.services.cluster import ClusterIndex, _lat, _lng, _mx, _my
+
+
+def _feat(lng, lat, activo=True, pid=0):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lng, lat]},
+        "properties": {"patrulla_id": pid, "activo": activo},
+    }
+
+
+def _count(features):
+    return sum(f["properties"]["point_count"] if f["properties"].get("cluster") else 1 for f in features)
+
+
+@pytest.fixture
+def index():
+    rnd = random.Random(3)
+    feats = [
+        _feat(-90.5 + rnd.uniform(-0.05, 0.05), 14.6 + rnd.uniform(-0.05, 0.05), activo=i % 3 != 0, pid=i)
+        for i in range(200)
+    ]
+    feats.append(_feat(-70.0, -30.0, pid=999))  # lejos de todo
+    return ClusterIndex(feats, max_zoom=16)
+
+
+def test_mercator_ida_y_vuelta():
+    for lng, lat in [(0, 0), (-90.5, 14.6), (179.9, -60.0)]:
+        assert _lng(_mx(lng)) == pytest.approx(lng)
+        assert _lat(_my(lat)) == pytest.approx(lat)
+
+
+def test_cada_zoom_conserva_todos_los_puntos(index):
+    for z in range(0, 18):
+        assert _count(index.clusters(z)) == 201
+
+
+def test_grupos_menos_al_alejar(index):
+    sizes = [len(index.clusters(z)) for z in range(0, 17)]
+    assert sizes == sorted(sizes)
+    assert sizes[0] < 10
+    assert len(index.clusters(17)) == 201  # sobre max_zoom: puntos originales
+
+
+def test_activos_y_ids(index):
+    clusters = [f for f in index.clusters(8) if f["properties"].get("cluster")]
+    assert sum(f["properties"]["activos"] for f in clusters) <= sum(
+        f["properties"]["point_count"] for f in clusters
+    )
+    total_activos = sum(
+        f["properties"]["activos"] if f["properties"].get("cluster") else int(f["properties"]["activo"])
+        for f in index.clusters(0)
+    )
+    assert total_activos == sum(1 for i in range(200) if i % 3 != 0) + 1
+    ids = [f["properties"]["cluster_id"] for f in clusters]
+    assert len(ids) == len(set(ids))
+
+
+def test_punto_suelto_es_el_feature_original(index):
+    lejos = [f for f in index.clusters(10) if not f["properties"].get("cluster")]
+    assert any(f["properties"]["patrulla_id"] == 999 for f in lejos)
+
+
+def test_bbox(index):
+    # sólo la zona de los 200 puntos
+    dentro = index.clusters(4, bbox=(-91.0, 14.0, -90.0, 15.0))
+    assert _count(dentro) == 200
+    assert index.clusters(4, bbox=(10.0, 10.0, 11.0, 11.0)) == []
+
+
+def test_features_sin_coordenadas_se_ignoran():
+    idx = ClusterIndex([{"geometry": None}, _feat(1.0, 1.0)])
+    assert idx.stats()["points"] == 1
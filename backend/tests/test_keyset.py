@@ -0,0 +1,63 @@
+# backend/tests/test_keyset.py
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.db.keyset import (
+    count_mode,
+    decode_cursor,
+    encode_cursor,
+    next_cursor,
+    parse_dt,
+    plan_rows,
+)
+
+
+def test_cursor_ida_y_vuelta():
+    ts = datetime(2024, 5, 1, 10, 30, 15, 123456, tzinfo=timezone(timedelta(hours=-6)))
+    token = encode_cursor([ts, 42])
+    assert decode_cursor(token, (parse_dt, int)) == [ts, 42]
+
+
+def test_cursor_opaco_y_url_safe():
+    token = encode_cursor(["ñandú/+?", 2**53])
+    assert "=" not in token
+    assert set(token) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+    assert decode_cursor(token, (str, int)) == ["ñandú/+?", 2**53]
+
+
+@pytest.mark.parametrize("token", [
+    "",
+    "no-es-base64!",
+    base64.urlsafe_b64encode(b"{}").decode(),  # no es lista
+    encode_cursor([1]),  # falta una columna
+    encode_cursor([1, 2, 3]),  # sobra una
+    encode_cursor(["ayer", 1]),  # fecha inválida
+    encode_cursor(["2024-01-01T00:00:00", "x"]),  # id no entero
+])
+def test_cursor_invalido_es_valueerror(token):
+    with pytest.raises(ValueError, match="after inválido"):
+        decode_cursor(token, (parse_dt, int))
+
+
+def test_next_cursor():
+    rows = [{"id": i} for i in range(11)]
+    key = lambda r: (r["id"],)  # noqa: E731
+    assert decode_cursor(next_cursor(rows, 10, key), (int,)) == [9]  # última fila de la página
+    assert next_cursor(rows[:10], 10, key) is None
+    assert next_cursor([], 10, key) is None
+
+
+def test_count_mode():
+    assert count_mode(None, "estimate") == "estimate"
+    assert count_mode(" EXACT ", "none") == "exact"
+    with pytest.raises(ValueError):
+        count_mode("todo", "exact")
+
+
+def test_plan_rows():
+    plan = [{"Plan": {"Node Type": "Seq Scan", "Plan Rows": 1234}}]
+    assert plan_rows(plan) == 1234
+    assert plan_rows(json.dumps(plan)) == 1234
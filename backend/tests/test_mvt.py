@@ -0,0 +1,145 @@
+# backend/tests/test_mvt.py
+import struct
+
+import pytest
+
+from app.services.mvt import _varint, _zigzag, encode_layer, thin
+
+
+# ---------- decodificador protobuf mínimo (sólo para verificar) ----------
+def _read_varint(buf, i):
+    shift = v = 0
+    while True:
+        b = buf[i]
+        i += 1
+        v |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return v, i
+        shift += 7
+
+
+def _fields(buf):
+    out, i = [], 0
+    while i < len(buf):
+        key, i = _read_varint(buf, i)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            v, i = _read_varint(buf, i)
+        elif wire == 1:
+            v, i = buf[i:i + 8], i + 8
+        elif wire == 2:
+            n, i = _read_varint(buf, i)
+            v, i = buf[i:i + n], i + n
+        else:
+            raise AssertionError(f"wire type {wire}")
+        out.append((field, v))
+    return out
+
+
+def _packed(buf):
+    vals, i = [], 0
+    while i < len(buf):
+        v, i = _read_varint(buf, i)
+        vals.append(v)
+    return vals
+
+
+def _unzigzag(v):
+    return (v >> 1) ^ -(v & 1)
+
+
+def _decode_value(buf):
+    ((field, v),) = _fields(buf)
+    if field == 1:
+        return v.decode("utf-8")
+    if field == 3:
+        return struct.unpack("<d", v)[0]
+    if field == 6:
+        return _unzigzag(v)
+    if field == 7:
+        return bool(v)
+    raise AssertionError(f"Value.{field}")
+
+
+def _decode_tile(data):
+    layers = []
+    for field, layer_buf in _fields(data):
+        assert field == 3
+        layer = {"features": [], "keys": [], "values": []}
+        for f, v in _fields(layer_buf):
+            if f == 15:
+                layer["version"] = v
+            elif f == 1:
+                layer["name"] = v.decode("utf-8")
+            elif f == 2:
+                layer["features"].append(dict(_fields(v)))
+            elif f == 3:
+                layer["keys"].append(v.decode("utf-8"))
+            elif f == 4:
+                layer["values"].append(_decode_value(v))
+            elif f == 5:
+                layer["extent"] = v
+        feats = []
+        for feat in layer["features"]:
+            tags = _packed(feat.get(2, b""))
+            props = {layer["keys"][k]: layer["values"][v] for k, v in zip(tags[::2], tags[1::2])}
+            cmd, x, y = _packed(feat[4])
+            assert cmd == 9 and feat[3] == 1  # MoveTo(1), POINT
+            feats.append((_unzigzag(x), _unzigzag(y), props, feat.get(1)))
+        layer["features"] = feats
+        layers.append(layer)
+    return layers
+
+
+# ---------- tests ----------
+@pytest.mark.parametrize("v, z", [(0, 0), (-1, 1), (1, 2), (-2, 3), (2, 4), (-64, 127), (4095, 8190)])
+def test_zigzag(v, z):
+    assert _zigzag(v) == z
+    assert _unzigzag(z) == v
+
+
+def test_varint():
+    assert _varint(0) == b"\x00"
+    assert _varint(1) == b"\x01"
+    assert _varint(300) == b"\xac\x02"
+    assert _read_varint(_varint(2**40 + 5), 0) == (2**40 + 5, 6)
+
+
+def test_encode_layer_roundtrip():
+    feats = [
+        (10, 20, {"id": 7, "alias": "P-1", "vel": 12.5, "activa": True, "nota": None}),
+        (-5, 4100, {"id": 8, "alias": "P-2", "vel": -3, "activa": False}),
+        (0, 0, {"alias": "P-1"}),  # valor repetido: se reutiliza
+    ]
+    (layer,) = _decode_tile(encode_layer("ubicaciones", feats, extent=4096, id_prop="id"))
+    assert layer["version"] == 2
+    assert layer["name"] == "ubicaciones"
+    assert layer["extent"] == 4096
+    assert layer["values"].count("P-1") == 1
+    assert "nota" not in layer["keys"]  # None se omite
+
+    (x0, y0, p0, id0), (x1, y1, p1, id1), (x2, y2, p2, id2) = layer["features"]
+    assert (x0, y0, id0) == (10, 20, 7)
+    assert p0 == {"id": 7, "alias": "P-1", "vel": 12.5, "activa": True}
+    assert (x1, y1, id1) == (-5, 4100, 8)  # coordenadas del buffer fuera de 0..extent
+    assert p1 == {"id": 8, "alias": "P-2", "vel": -3, "activa": False}
+    assert (x2, y2, p2, id2) == (0, 0, {"alias": "P-1"}, None)
+
+
+def test_bool_e_int_no_se_confunden():
+    # True == 1 en Python: la tabla de valores usa (tipo, valor)
+    (layer,) = _decode_tile(encode_layer("l", [(0, 0, {"a": 1, "b": True})]))
+    (_, _, props, _), = layer["features"]
+    assert props == {"a": 1, "b": True}
+    assert type(props["a"]) is int and type(props["b"]) is bool
+
+
+def test_capa_vacia():
+    assert encode_layer("l", []) == b""
+
+
+def test_thin_un_punto_por_celda():
+    feats = [(1, 1, 5, {"k": "a"}), (2, 2, 9, {"k": "b"}), (100, 100, 1, {"k": "c"})]
+    out = sorted(thin(feats, cell=64), key=lambda f: f[0])
+    assert out == [(2, 2, {"k": "b", "n": 2}), (100, 100, {"k": "c", "n": 1})]
+    assert len(thin(feats, cell=1)) == 3
@@ -0,0 +1,108 @@
+# backend/tests/test_posicion_index.py
+from datetime import datetime, timedelta, timezone
+
+from app.services.posicion_index import GridIndex
+
+T0 = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _row(pid, ts, lat=14.6, lng=-90.5):
+    return {"id": pid, "patrulla_id": pid, "nombre": f"P{pid}", "lat": lat, "lng": lng, "activo": True, "updated_at": ts}
+
+
+class _FakeDB:
+    """cambios_desde() de mentira: cursor = cantidad de commits."""
+
+    def __init__(self):
+        self.rows = {}
+        self.log = []  # (xid, patrulla_id | None, baja)
+        self.calls = []
+
+    def commit(self, row=None, baja=None):
+        if row is not None:
+            self.rows[row["patrulla_id"]] = row
+            self.log.append((len(self.log) + 1, row["patrulla_id"], False))
+        else:
+            self.rows.pop(baja, None)
+            self.log.append((len(self.log) + 1, baja, True))
+
+    def cambios_desde(self, since):
+        self.calls.append(since)
+        cursor = len(self.log) + 1
+        if since <= 0:
+            return {"cursor": cursor, "reset": True, "rows": list(self.rows.values()), "bajas": []}
+        nuevos = [(pid, baja) for xid, pid, baja in self.log if xid >= since]
+        return {
+            "cursor": cursor,
+            "reset": False,
+            "rows": [self.rows[pid] for pid, baja in nuevos if not baja and pid in self.rows],
+            "bajas": [pid for pid, baja in nuevos if baja],
+        }
+
+
+def _ids(index):
+    return sorted(r["patrulla_id"] for r in index.query_bbox())
+
+
+def test_upsert_local_no_esconde_filas_remotas_mas_viejas():
+    db = _FakeDB()
+    db.commit(_row(1, T0))
+    index = GridIndex(db.cambios_desde, sync_s=0, full_sync_s=1e9)
+    index.warm()
+
+    # este worker aplica un ping nuevo...
+    db.commit(_row(3, T0 + timedelta(minutes=5)))
+    index.upsert(_row(3, T0 + timedelta(minutes=5)))
+    # ...y otro worker confirma después un ping con hora de dispositivo anterior
+    db.commit(_row(2, T0 - timedelta(minutes=10)))
+
+    assert _ids(index) == [1, 2, 3]
+    assert db.calls[0] == 0 and all(c > 0 for c in db.calls[1:])  # sin recarga completa
+
+
+def test_bajas_incrementales():
+    db = _FakeDB()
+    db.commit(_row(1, T0))
+    db.commit(_row(2, T0))
+    index = GridIndex(db.cambios_desde, sync_s=0, full_sync_s=1e9)
+    index.warm()
+    db.commit(baja=1)
+    assert _ids(index) == [2]
+
+
+def test_reset_reemplaza_todo():
+    db = _FakeDB()
+    db.commit(_row(1, T0))
+    index = GridIndex(db.cambios_desde, sync_s=0, full_sync_s=1e9)
+    index.warm()
+    index.upsert(_row(9, T0))  # no está en la BD
+    index.invalidate()
+    assert _ids(index) == [1]
+
+
+def test_sync_for_lee_una_vez_por_token():
+    db = _FakeDB()
+    db.commit(_row(1, T0))
+    index = GridIndex(db.cambios_desde, sync_s=1e9, full_sync_s=1e9)
+    index.warm()
+    db.commit(_row(2, T0))
+
+    assert index.sync_for("wm-1")
+    assert _ids(index) == [1, 2]  # sin esperar sync_s
+    n = len(db.calls)
+    assert index.sync_for("wm-1")
+    assert len(db.calls) == n
+
+
+def test_sync_for_falla_sin_prometer_frescura():
+    db = _FakeDB()
+    db.commit(_row(1, T0))
+    index = GridIndex(db.cambios_desde, sync_s=1e9, full_sync_s=1e9)
+    index.warm()
+
+    def caida(_since):
+        raise OSError("sin conexión")
+
+    index._load_changes = caida
+    assert index.sync_for("wm-2") is False
+    assert _ids(index) == [1]  # se sirve lo cacheado
@@ -0,0 +1,83 @@
+# backend/tests/test_tracks.py
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.services.tracks import Track, importances, track_feature
+
+T0 = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _walk(n, seed=7, step_s=10, start=T0):
+    rnd = random.Random(seed)
+    lng, lat = -90.5, 14.6
+    pts = []
+    for i in range(n):
+        lng += rnd.uniform(-1e-4, 1e-4)
+        lat += rnd.uniform(-1e-4, 1e-4)
+        pts.append((lng, lat, start + timedelta(seconds=i * step_s)))
+    return pts
+
+
+def test_importances_extremos_infinitos():
+    rnd = random.Random(1)
+    xy = [(rnd.uniform(0, 500), rnd.uniform(0, 500)) for _ in range(50)]
+    imp = importances(xy)
+    assert imp[0] == imp[-1] == math.inf
+    assert all(w < math.inf for w in imp[1:-1])
+    assert importances([]) == []
+    assert importances([(0.0, 0.0)]) == [math.inf]
+
+
+def test_importances_hijo_no_supera_al_padre():
+    # un pico alto con un pico menor al costado: el menor queda acotado
+    xy = [(0, 0), (10, 5), (20, 100), (30, 0), (40, 0)]
+    imp = importances(xy)
+    assert imp[2] > imp[1]
+    assert imp[3] <= imp[2]
+
+
+def test_at_tolerance_anida_y_conserva_extremos():
+    track = Track(_walk(300), gap_s=0)
+    prev = None
+    for tol in (0.0, 1.0, 3.0, 10.0, 30.0, 1e9):
+        coords, times = track.at_tolerance(tol)
+        assert len(coords) == 1
+        kept = set(times[0])
+        # extremos siempre
+        assert times[0][0] == track.segments[0][0][2]
+        assert times[0][-1] == track.segments[0][-1][2]
+        assert len(coords[0]) == len(times[0])
+        if prev is not None:
+            assert kept <= prev  # más tolerancia, subconjunto
+        prev = kept
+    assert len(prev) == 2  # tolerancia enorme: sólo los extremos
+
+
+def test_tolerancia_negativa_conserva_todo():
+    pts = _walk(50)
+    coords, times = Track(pts).at_tolerance(-1.0)
+    assert sum(len(c) for c in coords) == len(pts)
+
+
+def test_hueco_parte_en_multilinestring():
+    a = _walk(20, seed=1)
+    b = _walk(20, seed=2, start=a[-1][2] + timedelta(minutes=30))
+    track = Track(a + b, gap_s=300)
+    assert len(track.segments) == 2
+
+    feat = track_feature(track, zoom=15)
+    assert feat["geometry"]["type"] == "MultiLineString"
+    assert len(feat["geometry"]["coordinates"]) == 2
+    assert [len(t) for t in feat["properties"]["times"]] == [
+        len(c) for c in feat["geometry"]["coordinates"]
+    ]
+    # cada tramo conserva sus extremos
+    assert feat["properties"]["times"][1][0] == int(b[0][2].timestamp())
+    assert feat["properties"]["times"][0][-1] == int(a[-1][2].timestamp())
+
+
+def test_sin_hueco_es_linestring():
+    feat = track_feature(Track(_walk(30), gap_s=300), zoom=None)
+    assert feat["geometry"]["type"] == "LineString"
+    assert feat["properties"]["points"] == feat["properties"]["points_raw"] == 30
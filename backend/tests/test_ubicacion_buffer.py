@@ -0,0 +1,46 @@
+# backend/tests/test_ubicacion_buffer.py
+from app.config.settings import Settings
+from app.services import ubicacion_buffer
+from app.services.ubicacion_buffer import WriteBehindBuffer
+
+
+def test_efectos_fallidos_no_reescriben_el_lote():
+    escritos, efectos = [], []
+
+    def after(rows):
+        efectos.append(list(rows))
+        raise RuntimeError("índice caído")
+
+    buf = WriteBehindBuffer(escritos.append, after_flush=after, max_delay=0.01)
+    buf.put(1)
+    buf.put(2)
+    buf.close()
+    assert [list(b) for b in escritos] == [[1, 2]]
+    assert efectos == [[1, 2]]
+    assert buf.stats()["flushed_rows"] == 2
+
+
+def test_reintenta_solo_la_escritura():
+    intentos, efectos = [], []
+
+    def flush(rows):
+        intentos.append(list(rows))
+        if len(intentos) == 1:
+            raise RuntimeError("conexión reciclada")
+
+    buf = WriteBehindBuffer(flush, after_flush=efectos.append, max_delay=0.01)
+    buf.put("a")
+    buf.close()
+    assert intentos == [["a"], ["a"]]
+    assert [list(b) for b in efectos] == [["a"]]
+
+
+def test_sin_buffer_desde_el_apagado(monkeypatch):
+    monkeypatch.setattr(Settings, "UBIC_WRITE_BEHIND", True)
+    monkeypatch.setattr(ubicacion_buffer, "_buffer", None)
+    monkeypatch.setattr(ubicacion_buffer, "_closing", False)
+    buf = ubicacion_buffer.get_write_buffer()
+    assert buf is not None
+
+    ubicacion_buffer.shutdown_write_buffer()
+    assert ubicacion_buffer.get_write_buffer() is None
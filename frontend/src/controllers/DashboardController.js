@@ -1,6 +1,6 @@
 
 import { DashboardView } from "../views/DashboardView.js";
-import { fetchUbicaciones } from "../services/api.js";
+import { fetchUbicaciones, openUbicacionesStream } from "../services/api.js";
 
 export class DashboardController {
   constructor() {
@@ -12,6 +12,11 @@ export class DashboardController {
     this._running = false;
     this._isFirstLoad = true;
 
+    // Push por SSE (si el navegador/servidor lo permiten); si no, polling
+    this._useStream = typeof window.EventSource === "function";
+    this._closeStream = null;
+    this._byPatrulla = new Map();
+
     
     this._onBeforeUnload = this.destroy.bind(this);
     this._onVisibilityChange = this._handleVisibility.bind(this);
@@ -23,10 +28,13 @@ export class DashboardController {
     this.view.initMap();
 
     
-    await this.loadData();
-
-    // Refresco periódico
-    this._startPolling();
+    if (this._useStream) {
+      this._startStream();
+    } else {
+      await this.loadData();
+      // Refresco periódico
+      this._startPolling();
+    }
 
    
     document.addEventListener("visibilitychange", this._onVisibilityChange);
@@ -40,6 +48,7 @@ export class DashboardController {
   }
 
   destroy() {
+    this._stopStream();
     this._stopPolling();
     window.removeEventListener("beforeunload", this._onBeforeUnload);
     document.removeEventListener("visibilitychange", this._onVisibilityChange);
@@ -61,10 +70,50 @@ export class DashboardController {
     }
   }
 
+  // Un solo stream para toda la flota: el servidor manda el snapshot al
+  // conectar y después sólo lo que cambia (o "deleted" si una patrulla sale).
+  _startStream() {
+    this._stopStream();
+    this._closeStream = openUbicacionesStream({
+      onChange: (delta) => this._applyDelta(delta),
+      onError: (err) => {
+        console.warn("Stream de ubicaciones no disponible, se usa polling:", err?.message || err);
+        this._stopStream();
+        this._useStream = false;
+        this.loadData();
+        this._startPolling();
+      },
+    });
+  }
+
+  _stopStream() {
+    if (this._closeStream) {
+      this._closeStream();
+      this._closeStream = null;
+    }
+  }
+
+  _applyDelta({ items, deleted, reset }) {
+    if (reset) this._byPatrulla.clear();
+    for (const u of items) {
+      this._byPatrulla.set(u.raw?.properties?.patrulla_id ?? u.patrulla, u);
+    }
+    for (const id of deleted) this._byPatrulla.delete(id);
+
+    // mismo orden que /ubicaciones/actuales: la más reciente primero
+    const ubicaciones = [...this._byPatrulla.values()].sort(
+      (a, b) => String(b.ts || "").localeCompare(String(a.ts || ""))
+    );
+    this.render(ubicaciones);
+  }
+
   _handleVisibility() {
     
     if (document.hidden) {
+      this._stopStream();
       this._stopPolling();
+    } else if (this._useStream) {
+      this._startStream();
     } else {
       this.loadData();
       if (!this._running) this._startPolling();
@@ -81,37 +130,38 @@ export class DashboardController {
   
   async loadData() {
     try {
-      const ubicaciones = await fetchUbicaciones();
-
-      // KPIs básicos
-      const total      = ubicaciones.length;
-      const activas    = ubicaciones.filter(u => (u.estado || "").toLowerCase() === "activa").length;
-      const inactivas  = Math.max(total - activas, 0);
-      const ultima     = total
-        ? (ubicaciones[0].ts ? new Date(ubicaciones[0].ts).toLocaleString() : "—")
-        : "—";
-
-      this.view.updateKpis({ total, activas, ultima });
-
-      // Renderiza mapa + tabla
-      
-      this.view.updateMap(ubicaciones, { isFirstLoad: this._isFirstLoad });
-      this.view.updateTable(ubicaciones);
-
-      // Snapshot para otros módulos (si lo necesitas)
-      window.dispatchEvent(
-        new CustomEvent("dashboard:snapshot", {
-          detail: { total, activas, inactivas, ultima, ubicaciones }
-        })
-      );
-
-     
-      this._isFirstLoad = false;
-
+      this.render(await fetchUbicaciones());
     } catch (err) {
       console.error("Error cargando ubicaciones:", err);
       this.view.showError("No se pudieron cargar ubicaciones");
      
     }
   }
+
+  render(ubicaciones) {
+    // KPIs básicos
+    const total      = ubicaciones.length;
+    const activas    = ubicaciones.filter(u => (u.estado || "").toLowerCase() === "activa").length;
+    const inactivas  = Math.max(total - activas, 0);
+    const ultima     = total
+      ? (ubicaciones[0].ts ? new Date(ubicaciones[0].ts).toLocaleString() : "—")
+      : "—";
+
+    this.view.updateKpis({ total, activas, ultima });
+
+    // Renderiza mapa + tabla
+    
+    this.view.updateMap(ubicaciones, { isFirstLoad: this._isFirstLoad });
+    this.view.updateTable(ubicaciones);
+
+    // Snapshot para otros módulos (si lo necesitas)
+    window.dispatchEvent(
+      new CustomEvent("dashboard:snapshot", {
+        detail: { total, activas, inactivas, ultima, ubicaciones }
+      })
+    );
+
+     
+    this._isFirstLoad = false;
+  }
 }
@@ -35,6 +35,8 @@ async function runRefresh() {
    - Adjunta cookies y Bearer si existe
    - Reintenta una vez tras /auth/refresh
    - Evita caché **sin** romper CORS (GET => cache-buster en la URL)
+   - opts.revalidate: GET sin cache-buster; el navegador revalida con
+     If-None-Match y el servidor responde 304 si nada cambió (ETag)
    ========================================= */
 export async function jsonFetch(url, opts = {}) {
   const baseOrAbs =
@@ -50,15 +52,17 @@ export async function jsonFetch(url, opts = {}) {
 
   const method = String(opts.method || "GET").toUpperCase();
 
+  const revalidate = method === "GET" && opts.revalidate === true;
+
   const finalUrl =
-    method === "GET"
+    method === "GET" && !revalidate
       ? `${baseOrAbs}${baseOrAbs.includes("?") ? "&" : "?"}_ts=${Date.now()}`
       : baseOrAbs;
 
   const exec = () =>
     fetch(finalUrl, {
       credentials: "include",
-      ...(method === "GET" ? { cache: "no-store" } : {}),
+      ...(method === "GET" ? { cache: revalidate ? "no-cache" : "no-store" } : {}),
       headers,
       ...opts,
     });
@@ -249,6 +253,9 @@ function normalizeUbics(json) {
               : "inactiva"
             : undefined),
         ts: f.properties?.ts || f.properties?.updated_at || null,
+        // grupos de /ubicaciones/geo?cluster=true (count = puntos agrupados)
+        cluster: f.properties?.cluster === true,
+        count: f.properties?.point_count ?? 1,
         raw: f,
       }))
       .filter((p) => Number.isFinite(p.lat) && Number.isFinite(p.lng));
@@ -283,11 +290,82 @@ function normalizeUbics(json) {
     .filter((p) => Number.isFinite(p.lat) && Number.isFinite(p.lng));
 }
 
+// Una fila por patrulla (posición vigente), no el historial paginado
 export async function fetchUbicaciones() {
-  const json = await jsonFetch(`/ubicaciones`, { method: "GET" });
+  const json = await jsonFetch(`/ubicaciones/actuales`, { method: "GET", revalidate: true });
+  return normalizeUbics(json);
+}
+
+// Plantilla de URL de teselas MVT para capas vectoriales (p.ej. L.vectorGrid.protobuf).
+// capas: "posiciones" | "historial" | "posiciones,historial"; historial requiere desde/hasta.
+export function ubicacionesTileUrl({ capas = "posiciones", patrulla_id, desde, hasta } = {}) {
+  const qs = new URLSearchParams({ capas });
+  if (patrulla_id != null) qs.set("patrulla_id", patrulla_id);
+  if (desde) qs.set("desde", desde);
+  if (hasta) qs.set("hasta", hasta);
+  return `${BASE}/ubicaciones/tiles/{z}/{x}/{y}.mvt?${qs.toString()}`;
+}
+
+// Mapa con zoom alejado: el servidor agrupa los puntos para ese zoom/bbox
+export async function fetchUbicacionesCluster({ zoom, bbox } = {}) {
+  const qs = new URLSearchParams({ cluster: "true", zoom: String(zoom ?? 12) });
+  if (bbox) qs.set("bbox", Array.isArray(bbox) ? bbox.join(",") : bbox);
+  const json = await jsonFetch(`/ubicaciones/geo?${qs.toString()}`, { method: "GET", revalidate: true });
   return normalizeUbics(json);
 }
 
+// Polling del mapa en vivo: sólo lo que cambió desde `cursor` (primera vez: cursor 0).
+// reset=true => reemplazar todo lo que se tenía con `items`; si no, aplicar
+// items (por patrulla_id) y quitar las patrullas en `deleted`.
+export async function fetchUbicacionesDelta({ cursor = "0", bbox } = {}) {
+  const qs = new URLSearchParams({ since: String(cursor) });
+  if (bbox) qs.set("bbox", Array.isArray(bbox) ? bbox.join(",") : bbox);
+  const json = await jsonFetch(`/ubicaciones/geo?${qs.toString()}`, { method: "GET", revalidate: true });
+  return {
+    items: normalizeUbics(json),
+    deleted: Array.isArray(json?.deleted) ? json.deleted : [],
+    cursor: json?.cursor ?? cursor,
+    reset: json?.reset === true,
+  };
+}
+
+// Push del mapa en vivo (SSE) en lugar de polling. onChange recibe
+// { items, deleted, reset } con la misma semántica que fetchUbicacionesDelta.
+// EventSource reconecta solo (con Last-Event-ID); onError se llama si la
+// conexión se cierra del todo (p.ej. 503 o navegador sin soporte) para volver
+// al polling. Devuelve una función para cerrar el stream.
+export function openUbicacionesStream({ bbox, patrulla_id, onChange, onError } = {}) {
+  if (typeof window.EventSource !== "function") {
+    onError?.(new Error("EventSource no soportado"));
+    return () => {};
+  }
+  const qs = new URLSearchParams();
+  if (bbox) qs.set("bbox", Array.isArray(bbox) ? bbox.join(",") : bbox);
+  if (patrulla_id != null) qs.set("patrulla_id", String(patrulla_id));
+  const url = `${BASE}/ubicaciones/stream${qs.toString() ? `?${qs.toString()}` : ""}`;
+
+  const es = new EventSource(url, { withCredentials: true });
+  const handle = (e) => {
+    let json;
+    try {
+      json = JSON.parse(e.data);
+    } catch {
+      return;
+    }
+    onChange?.({
+      items: normalizeUbics(json),
+      deleted: Array.isArray(json?.deleted) ? json.deleted : [],
+      reset: e.type === "snapshot" || json?.reset === true,
+    });
+  };
+  es.addEventListener("snapshot", handle);
+  es.addEventListener("positions", handle);
+  es.onerror = () => {
+    if (es.readyState === EventSource.CLOSED) onError?.(new Error("stream cerrado"));
+  };
+  return () => es.close();
+}
+
 /* =========================================
    USUARIOS (CRUD)
    ========================================= */